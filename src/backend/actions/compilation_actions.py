@@ -1,30 +1,118 @@
+import os
+import time
+import asyncio
 import logging
+import contextlib
 from typing import List, Dict
 from anthropic import AsyncAnthropic
+from metrics import LLM_ERRORS, LLM_RETRIES, LLM_TOKENS, timed
 
 logger = logging.getLogger(__name__)
 
 class CompilationActions:
-    def __init__(self, anthropic_client: AsyncAnthropic, file_manager):
+    def __init__(self, anthropic_client: AsyncAnthropic, file_manager, limiter=None):
         self.anthropic = anthropic_client
         self.file_manager = file_manager
-        self.max_compilation_attempts = 5
+        self.limiter = limiter
+        # Llamadas al LLM como máximo por corrección, repartidas entre las rondas
+        self.max_compilation_attempts = int(os.getenv("FIX_MAX_ATTEMPTS", "5"))
+        # Candidatos pedidos en paralelo por ronda y rondas máximas
+        self.candidates_per_round = int(os.getenv("FIX_CANDIDATES_PER_ROUND", "3"))
+        self.max_fix_rounds = int(os.getenv("FIX_MAX_ROUNDS", "2"))
 
-    async def fix_compilation_errors(self, file_path: str, errors: List[Dict]) -> bool:
-        """Intenta corregir errores de compilación automáticamente."""
+    async def fix_compilation_errors(self, file_path: str, errors: List[Dict] | None = None) -> bool:
+        """Intenta corregir errores de compilación automáticamente; True si el archivo quedó compilando."""
+        return (await self.fix_compilation_errors_report(file_path, errors))["success"]
+
+    @timed("fix_compilation")
+    async def fix_compilation_errors_report(self, file_path: str, errors: List[Dict] | None = None) -> Dict:
+        """Como `fix_compilation_errors`, pero devuelve el resumen completo.
+
+        En cada ronda pide varias correcciones en paralelo y las compila en
+        memoria; la primera que compila sin errores se escribe en el archivo.
+        Si ninguna compila, la siguiente ronda parte del candidato con menos
+        errores y de sus diagnósticos. Entre todas las rondas no se hacen más
+        de `max_compilation_attempts` llamadas al LLM. El resumen incluye el
+        resultado, los intentos, el tiempo total y el candidato ganador.
+        """
+        start = time.perf_counter()
         attempts = 0
-        while attempts < self.max_compilation_attempts:
+        launched = 0
+        rounds = 0
+        content = await self.file_manager.read_file(file_path)
+        if errors is None:
+            errors = (await self.file_manager.compile_source(content, file_path))["errors"]
+
+        for round_index in range(self.max_fix_rounds):
+            candidates = min(self.candidates_per_round, self.max_compilation_attempts - launched)
+            if candidates <= 0:
+                break
+            if round_index:
+                # Cada ronda extra repite las llamadas al LLM con el mejor candidato anterior
+                LLM_RETRIES.inc(candidates, operation="fix_compilation")
+            launched += candidates
+            rounds += 1
+            tasks = [
+                asyncio.create_task(self._fix_candidate(file_path, content, errors, candidate))
+                for candidate in range(candidates)
+            ]
+            best = None
+            winner = None
             try:
-                # Obtener el contenido actual
-                content = await self.file_manager.read_file(file_path)
-                
-                # Crear un mensaje para Claude con los errores
-                error_message = "Fix the following Solidity compilation errors:\n"
-                for error in errors:
-                    error_message += f"Line {error['line']}: {error['message']}\n"
-                error_message += f"\nCurrent code:\n```solidity\n{content}\n```"
+                for finished in asyncio.as_completed(tasks):
+                    candidate = await finished
+                    attempts += 1
+                    if candidate is None:
+                        continue
+                    if candidate["result"]["success"]:
+                        winner = candidate
+                        break
+                    if best is None or len(candidate["result"]["errors"]) < len(best["result"]["errors"]):
+                        best = candidate
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            if winner:
+                await self.file_manager.write_file(file_path, winner["code"])
+                summary = {
+                    "success": True,
+                    "attempts": attempts,
+                    "rounds": round_index + 1,
+                    "wall_time": time.perf_counter() - start,
+                    "winner": {"round": round_index + 1, "candidate": winner["candidate"]},
+                    "errors": []
+                }
+                logger.info(f"Fixed {file_path}: {summary}")
+                return summary
 
-                # Obtener la solución de Claude
+            if best:
+                # La siguiente ronda corrige el mejor candidato con sus diagnósticos actuales
+                content = best["code"]
+                errors = best["result"]["errors"]
+
+        summary = {
+            "success": False,
+            "attempts": attempts,
+            "rounds": rounds,
+            "wall_time": time.perf_counter() - start,
+            "winner": None,
+            "errors": errors
+        }
+        logger.info(f"Could not fix {file_path}: {summary}")
+        return summary
+
+    async def _fix_candidate(self, file_path: str, content: str, errors: List[Dict], candidate: int) -> Dict | None:
+        """Pide una corrección al LLM y la compila en memoria, sin tocar el archivo real."""
+        try:
+            # Crear un mensaje para Claude con los errores
+            error_message = "Fix the following Solidity compilation errors:\n"
+            for error in errors:
+                error_message += f"Line {error['line']}: {error['message']}\n"
+            error_message += f"\nCurrent code:\n```solidity\n{content}\n```"
+
+            # Obtener la solución de Claude; la temperatura varía entre candidatos para diversificarlos
+            async with self.limiter if self.limiter is not None else contextlib.nullcontext():
                 response = await self.anthropic.messages.create(
                     model="claude-3-sonnet-20240229",
                     max_tokens=4096,
@@ -32,26 +120,26 @@ class CompilationActions:
                     messages=[
                         {"role": "user", "content": error_message}
                     ],
-                    temperature=0.3
+                    temperature=min(1.0, 0.2 + 0.3 * candidate)
                 )
+            usage = getattr(response, "usage", None)
+            for kind in ("input", "output"):
+                tokens = getattr(usage, f"{kind}_tokens", 0)
+                if tokens:
+                    LLM_TOKENS.inc(tokens, operation="fix_compilation", kind=kind)
 
-                # Extraer el código corregido
-                fixed_code = self.extract_solidity_code(response.content[0].text)
-                if fixed_code:
-                    # Aplicar la corrección
-                    await self.file_manager.write_file(file_path, fixed_code)
-                    
-                    # Verificar si se resolvieron los errores
-                    new_result = await self.file_manager.compile_solidity(file_path)
-                    if new_result["success"]:
-                        return True
-                
-                attempts += 1
-            except Exception as e:
-                logger.error(f"Error fixing compilation errors: {str(e)}")
-                break
-
-        return False
+            # Extraer el código corregido
+            fixed_code = self.extract_solidity_code(response.content[0].text)
+            if not fixed_code:
+                return None
+            result = await self.file_manager.compile_source(fixed_code, file_path)
+            return {"candidate": candidate, "code": fixed_code, "result": result}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LLM_ERRORS.inc(operation="fix_compilation")
+            logger.error(f"Error fixing compilation errors: {str(e)}")
+            return None
 
     def extract_solidity_code(self, text: str) -> str:
         """Extrae el código Solidity de una respuesta de texto."""
@@ -1,9 +1,144 @@
 import logging
 import os
+import re
 from typing import Dict, List
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 
+# Palabras clave de sugerencia y de edición en una sola pasada (sin lower() por línea).
+# Ambos grupos son lookaheads anclados al inicio: `match` siempre tiene éxito e indica
+# qué tipos de palabra clave aparecen en cualquier parte de la línea.
+KEYWORD_PATTERN = re.compile(
+    r"(?=.*?(?P<suggestion>suggestion:|idea:|you could:|consider:|recommendation:|proposal:))?"
+    r"(?=.*?(?P<edit>edit|modify|update|change|add|include))?",
+    re.IGNORECASE
+)
+
+class ActionStreamParser:
+    """Parser incremental de acciones: recibe fragmentos de la respuesta y
+    devuelve las acciones en cuanto se completan (líneas de texto o bloques de código cerrados)."""
+
+    def __init__(self, edit_actions: "EditActions"):
+        self.edit_actions = edit_actions
+        self.partial_line: List[str] = []  # Fragmentos de la línea aún sin terminar
+        self.in_code_block = False
+        self.code_lines: List[str] = []
+        self.is_suggestion_block = False
+        self.is_edit_block = False
+        # Si hay un contrato actual, cualquier código solidity debería ser una edición
+        self.is_editing_mode = (
+            edit_actions.current_contract_context["file"] is not None
+            or edit_actions.active_contract["is_complete"]
+        )
+
+    @timed("parse_actions")
+    def feed(self, chunk: str) -> List[Dict]:
+        """Procesa un fragmento y devuelve las acciones completadas."""
+        actions = []
+        start = 0
+        newline = chunk.find("\n")
+        while newline != -1:
+            line = chunk[start:newline]
+            if self.partial_line:
+                self.partial_line.append(line)
+                line = "".join(self.partial_line)
+                self.partial_line = []
+            self._process_line(line, actions)
+            start = newline + 1
+            newline = chunk.find("\n", start)
+        if start < len(chunk):
+            self.partial_line.append(chunk[start:])
+        return actions
+
+    @timed("parse_actions")
+    def close(self) -> List[Dict]:
+        """Procesa la última línea pendiente al terminar la respuesta."""
+        actions = []
+        line = "".join(self.partial_line)
+        self.partial_line = []
+        self._process_line(line, actions)
+        return actions
+
+    def _process_line(self, line: str, actions: List[Dict]) -> None:
+        if not self.in_code_block:
+            keywords = KEYWORD_PATTERN.match(line)
+            # Detectar si es una sugerencia antes del bloque de código
+            if keywords.group("suggestion"):
+                self.is_suggestion_block = True
+                actions.append({
+                    "type": "message",
+                    "content": line.strip()
+                })
+                return
+            # Detectar si es una edición
+            if keywords.group("edit"):
+                self.is_edit_block = True
+
+        # Detectar inicio de bloque de código
+        if line.startswith("```solidity"):
+            self.in_code_block = True
+            self.code_lines = []
+        # Detectar fin de bloque de código
+        elif line.startswith("```") and self.in_code_block:
+            self.in_code_block = False
+            self._close_code_block(actions)
+            self.is_suggestion_block = False
+            self.is_edit_block = False
+        # Acumular contenido del bloque de código
+        elif self.in_code_block:
+            self.code_lines.append(line)
+        # Si la línea no es parte de un bloque de código y no está vacía
+        elif line.strip():
+            actions.append({
+                "type": "message",
+                "content": line.strip()
+            })
+
+    def _close_code_block(self, actions: List[Dict]) -> None:
+        code = "\n".join(self.code_lines).strip()
+        self.code_lines = []
+        if not code:
+            return
+        active_contract = self.edit_actions.active_contract
+        # Si es un bloque de sugerencia, solo mostrar el código como mensaje
+        if self.is_suggestion_block:
+            actions.append({
+                "type": "message",
+                "content": f"Example code:\n```solidity\n{code}\n```"
+            })
+        # Si estamos en modo edición o es un bloque de edición
+        elif self.is_editing_mode or self.is_edit_block:
+            if active_contract["content"] and not code.startswith("//"):
+                # Si el código no parece un contrato completo, integrarlo en el existente
+                merged_content = self.edit_actions.merge_code(active_contract["content"], code)
+                actions.append({
+                    "type": "edit_file",
+                    "path": active_contract["path"],
+                    "edit": {"replace": merged_content}
+                })
+                active_contract["content"] = merged_content
+            else:
+                # Si es un contrato completo o no hay contrato activo, reemplazar/crear
+                actions.append({
+                    "type": "create_file" if not active_contract["content"] else "edit_file",
+                    "path": active_contract["path"],
+                    "content" if not active_contract["content"] else "edit": {
+                        "replace": code
+                    }
+                })
+                active_contract["content"] = code
+                active_contract["is_complete"] = True
+        else:
+            # Nuevo contrato
+            actions.append({
+                "type": "create_file",
+                "path": active_contract["path"],
+                "content": code
+            })
+            active_contract["content"] = code
+            active_contract["is_complete"] = True
+
 class EditActions:
     def __init__(self):
         self.current_contract_context = {
@@ -19,90 +154,12 @@ class EditActions:
 
     def parse_actions(self, response: str) -> List[Dict]:
         """Analiza la respuesta para extraer acciones."""
-        actions = []
-        lines = response.split('\n')
-        in_code_block = False
-        code_content = ""
-        is_suggestion_block = False
-        is_edit_block = False
-        
-        # Si hay un contrato actual, cualquier código solidity debería ser una edición
-        is_editing_mode = self.current_contract_context["file"] is not None or self.active_contract["is_complete"]
-
-        for i, line in enumerate(lines):
-            # Detectar si es una sugerencia antes del bloque de código
-            if not in_code_block and any(keyword in line.lower() for keyword in ["suggestion:", "idea:", "you could:", "consider:", "recommendation:", "proposal:"]):
-                is_suggestion_block = True
-                actions.append({
-                    "type": "message",
-                    "content": line.strip()
-                })
-                continue
-
-            # Detectar si es una edición
-            if not in_code_block and any(keyword in line.lower() for keyword in ["edit", "modify", "update", "change", "add", "include"]):
-                is_edit_block = True
-
-            # Detectar inicio de bloque de código
-            if line.startswith("```solidity"):
-                in_code_block = True
-                code_content = ""
-                continue
-            # Detectar fin de bloque de código
-            elif line.startswith("```") and in_code_block:
-                in_code_block = False
-                if code_content.strip():
-                    # Si es un bloque de sugerencia, solo mostrar el código como mensaje
-                    if is_suggestion_block:
-                        actions.append({
-                            "type": "message",
-                            "content": f"Example code:\n```solidity\n{code_content.strip()}\n```"
-                        })
-                    # Si estamos en modo edición o es un bloque de edición
-                    elif is_editing_mode or is_edit_block:
-                        if self.active_contract["content"] and not code_content.strip().startswith("//"):
-                            # Si el código no parece un contrato completo, integrarlo en el existente
-                            merged_content = self.merge_code(self.active_contract["content"], code_content.strip())
-                            actions.append({
-                                "type": "edit_file",
-                                "path": self.active_contract["path"],
-                                "edit": {"replace": merged_content}
-                            })
-                            self.active_contract["content"] = merged_content
-                        else:
-                            # Si es un contrato completo o no hay contrato activo, reemplazar/crear
-                            actions.append({
-                                "type": "create_file" if not self.active_contract["content"] else "edit_file",
-                                "path": self.active_contract["path"],
-                                "content" if not self.active_contract["content"] else "edit": {
-                                    "replace": code_content.strip()
-                                }
-                            })
-                            self.active_contract["content"] = code_content.strip()
-                            self.active_contract["is_complete"] = True
-                    else:
-                        # Nuevo contrato
-                        actions.append({
-                            "type": "create_file",
-                            "path": self.active_contract["path"],
-                            "content": code_content.strip()
-                        })
-                        self.active_contract["content"] = code_content.strip()
-                        self.active_contract["is_complete"] = True
-                is_suggestion_block = False
-                is_edit_block = False
-                continue
-            # Acumular contenido del bloque de código
-            elif in_code_block:
-                code_content += line + "\n"
-            # Si la línea no es parte de un bloque de código y no está vacía
-            elif line.strip():
-                actions.append({
-                    "type": "message",
-                    "content": line.strip()
-                })
+        parser = self.create_stream_parser()
+        return parser.feed(response) + parser.close()
 
-        return actions
+    def create_stream_parser(self) -> "ActionStreamParser":
+        """Crea un parser incremental para una respuesta que llega por fragmentos."""
+        return ActionStreamParser(self)
 
     def merge_code(self, existing_code: str, new_code: str) -> str:
         """Integra nuevo código en el contrato existente."""
@@ -1,21 +1,69 @@
+import os
+import time
 import logging
-from typing import Dict, List, AsyncGenerator
 import asyncio
+import contextlib
+from collections import OrderedDict
+from typing import Dict, List, AsyncGenerator
 import uuid
 from datetime import datetime
+from conversation_history import HistoryManager, HistoryStore, new_turn_stats, record_usage
+from metrics import LLM_ERRORS, LLM_TOKENS, observe_stage, timed
+from response_cache import ResponseCache
+from .edit_actions import EditActions
 
 logger = logging.getLogger(__name__)
 
+MODEL = "claude-3-5-sonnet-20241022"
+# Chats con estado de contrato en memoria por agente; el cliente reenvía el contrato en cada mensaje
+MAX_CONTRACT_STATES = int(os.getenv("MAX_CONTRACT_STATES", "32"))
+
+SYSTEM_PROMPT = """You are an AI assistant specialized in Solidity smart contract development using OpenZeppelin v5.0.0.
+Your primary role is to write, edit, and debug smart contracts with a focus on security and best practices.
+
+CRITICAL RULES FOR SMART CONTRACT DEVELOPMENT:
+
+
+      
+   c) Access:
+      - Ownable: "@openzeppelin/contracts/access/Ownable.sol"
+      - AccessControl: "@openzeppelin/contracts/access/AccessControl.sol"
+      - AccessManager: "@openzeppelin/contracts/access/AccessManager.sol"
+
+5. Response Format:
+   - First: Explain planned changes/approach
+   - Then: Show complete contract code
+   - Finally: Explain security considerations
+   - Use ```solidity for code blocks
+
+6. Error Prevention:
+   - Double-check all imports exist in v5.0.0
+   - Verify function visibility
+   - Ensure proper event emissions
+   - Add input validation
+   - Include require/revert messages"""
+
 class MessageActions:
-    def __init__(self, anthropic_client, edit_actions, compilation_actions):
+    def __init__(self, anthropic_client, compilation_actions, limiter=None,
+                 history_store: HistoryStore | None = None, wallet_address: str = "",
+                 response_cache: ResponseCache | None = None):
         self.anthropic = anthropic_client
-        self.edit_actions = edit_actions
+        self.limiter = limiter
+        # Estado del contrato por chat: los turnos concurrentes de una wallet no comparten el contrato activo
+        self.contract_states: OrderedDict[str, EditActions] = OrderedDict()
         self.compilation_actions = compilation_actions
-        self.conversation_histories: Dict[str, List[Dict]] = {}
+        # Historiales compartidos y acotados; se reconstruyen desde el chat persistido si no están en memoria
+        self.conversation_histories = history_store if history_store is not None else HistoryStore()
+        self.wallet_address = wallet_address
+        self.history_manager = HistoryManager()
         self.max_retries = 3
+        # Caché opcional de respuestas completas (RESPONSE_CACHE_ENABLED), compartida por el proceso
+        self.response_cache = response_cache
 
+    @timed("turn")
     async def process_message(self, message: str, context: Dict, context_id: str | None = None) -> AsyncGenerator[Dict, None]:
         """Procesa un mensaje del usuario y genera respuestas."""
+        current_history = None
         try:
             # Validar que el mensaje no esté vacío
             if not message or not message.strip():
@@ -25,17 +73,15 @@ class MessageActions:
                 }
                 return
 
-            # Inicializar el historial del contexto si no existe
-            if context_id and context_id not in self.conversation_histories:
-                self.conversation_histories[context_id] = []
-            
-            # Actualizar el historial del contexto actual
+            edit_actions = self._edit_actions_for(context_id)
+
+            # Actualizar el historial del contexto actual (se reconstruye si no está en memoria)
             if context_id:
-                self.conversation_histories[context_id].append({
+                current_history = self.conversation_histories.get(self.wallet_address, context_id)
+                current_history.append({
                     "role": "user",
                     "content": message
                 })
-                current_history = self.conversation_histories[context_id]
             else:
                 # Si no hay context_id, usar un historial temporal
                 current_history = [{
@@ -45,74 +91,161 @@ class MessageActions:
 
             # Update contract context if provided in the message
             if context.get("currentFile"):
-                self.edit_actions.update_contract_context(
+                edit_actions.update_contract_context(
                     file=context["currentFile"],
                     code=context.get("currentCode"),
                     file_system=context.get("fileSystem", {})
                 )
 
-            # Obtener la respuesta de Claude con parámetros optimizados
-            response = await self.anthropic.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=8096,  # Aumentado para permitir respuestas más completas
-                temperature=0.3,  # Reducido para respuestas más consistentes y precisas
-                system="""You are an AI assistant specialized in Solidity smart contract development using OpenZeppelin v5.0.0.
-Your primary role is to write, edit, and debug smart contracts with a focus on security and best practices.
+            yield {"type": "message", "content": "Analyzing your request..."}
 
-CRITICAL RULES FOR SMART CONTRACT DEVELOPMENT:
+            # Mantener el historial dentro del presupuesto de tokens y preparar la caché de prompts
+            trimmed = self.history_manager.trim(current_history)
+            system, request_messages, extra_headers = self.history_manager.build_request(SYSTEM_PROMPT, current_history)
+            stats = new_turn_stats(current_history, self.history_manager, trimmed)
+            if context_id:
+                self.conversation_histories.set_turn_stats(self.wallet_address, context_id, stats)
 
+            cache_key = None
+            if self.response_cache is not None:
+                cache_key = self.response_cache.key(message, SYSTEM_PROMPT, MODEL, self._contract_state(edit_actions),
+                                                   current_history[:-1])
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    # Misma petición sobre el mismo contrato: se reproduce por el mismo pipeline sin llamar al LLM
+                    stats["cached"] = True
+                    async for response in self._replay(cached, context_id, edit_actions):
+                        yield response
+                    logger.info(f"Served cached response for {context_id}")
+                    if context_id:
+                        current_history.append({
+                            "role": "assistant",
+                            "content": cached
+                        })
+                    return
 
-      
-   c) Access:
-      - Ownable: "@openzeppelin/contracts/access/Ownable.sol"
-      - AccessControl: "@openzeppelin/contracts/access/AccessControl.sol"
-      - AccessManager: "@openzeppelin/contracts/access/AccessManager.sol"
+            # Ocupa un hueco del limitador global mientras dure la llamada al LLM
+            async with self._upstream_slot():
+                request_start = time.perf_counter()
+                # Obtener la respuesta de Claude en streaming con parámetros optimizados
+                stream = await self.anthropic.messages.create(
+                    model=MODEL,
+                    max_tokens=8096,  # Aumentado para permitir respuestas más completas
+                    temperature=0.3,  # Reducido para respuestas más consistentes y precisas
+                    system=system,
+                    messages=request_messages,
+                    stop_sequences=["\```"],  # Detener después de bloques de código
+                    stream=True,
+                    extra_headers=extra_headers
+                )
 
-5. Response Format:
-   - First: Explain planned changes/approach
-   - Then: Show complete contract code
-   - Finally: Explain security considerations
-   - Use ```solidity for code blocks
+                # Reenviar cada fragmento al cliente y emitir las acciones en cuanto se cierran
+                parser = edit_actions.create_stream_parser()
+                chunks = []
+                try:
+                    async for event in stream:
+                        if event.type == "message_start":
+                            record_usage(stats, getattr(event.message, "usage", None))
+                            continue
+                        if event.type == "message_delta":
+                            record_usage(stats, getattr(event, "usage", None))
+                            continue
+                        if event.type != "content_block_delta":
+                            continue
+                        text = getattr(event.delta, "text", "")
+                        if not text:
+                            continue
+                        if not chunks:
+                            observe_stage("llm_first_token", time.perf_counter() - request_start)
+                        chunks.append(text)
+                        yield {
+                            "type": "message_delta",
+                            "content": text,
+                            "metadata": {"chat_id": context_id}
+                        }
+                        for action in parser.feed(text):
+                            yield await self.handle_action(action, context_id)
+                finally:
+                    # Cerrar la conexión HTTP del stream si se abandona antes de terminar
+                    await stream.response.aclose()
+                    observe_stage("llm_stream", time.perf_counter() - request_start)
+                    for field in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "output_tokens"):
+                        if stats[field]:
+                            LLM_TOKENS.inc(stats[field], operation="chat", kind=field[:-len("_tokens")])
 
-6. Error Prevention:
-   - Double-check all imports exist in v5.0.0
-   - Verify function visibility
-   - Ensure proper event emissions
-   - Add input validation
-   - Include require/revert messages""",
-                messages=current_history,
-                stop_sequences=["\```"]  # Detener después de bloques de código
-            )
-            
-            if not response or not hasattr(response, 'content') or not response.content:
+            for action in parser.close():
+                yield await self.handle_action(action, context_id)
+
+            if not chunks:
                 raise ValueError("Respuesta inválida de la API de Anthropic")
 
+            logger.info(
+                f"Turn stats for {context_id}: input={stats['input_tokens']} "
+                f"cached={stats['cache_read_input_tokens']} output={stats['output_tokens']} "
+                f"history={stats['history_messages']} msgs/~{stats['history_tokens_estimate']} tokens"
+            )
+
             # Guardar la respuesta en el historial del contexto
             if context_id:
-                self.conversation_histories[context_id].append({
+                current_history.append({
                     "role": "assistant",
-                    "content": response.content[0].text
+                    "content": "".join(chunks)
                 })
 
-            # Procesar la respuesta
-            response_content = response.content[0].text
-            yield {"type": "message", "content": "Analyzing your request..."}
-            await asyncio.sleep(0.5)  # Pequeña pausa inicial
-
-            # Analizar la respuesta para acciones específicas
-            actions = self.edit_actions.parse_actions(response_content)
-            
-            for action in actions:
-                yield await self.handle_action(action, context_id)
-                await asyncio.sleep(0.4)  # Pausa entre acciones
+            if cache_key is not None:
+                await asyncio.to_thread(self.response_cache.put, cache_key, "".join(chunks))
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # Turno cancelado en cualquier punto (cola del limitador, petición o stream): el mensaje
+            # del usuario queda sin respuesta y se retira del historial
+            if context_id and current_history and current_history[-1]["role"] == "user":
+                current_history.pop()
+            raise
         except Exception as api_error:
+            LLM_ERRORS.inc(operation="chat")
             logger.error(f"Error en la API de Anthropic: {str(api_error)}")
             yield {
                 "type": "error",
                 "content": f"Error al comunicarse con la API de Anthropic: {str(api_error)}"
             }
 
+    def _edit_actions_for(self, context_id: str | None) -> EditActions:
+        """Estado del contrato del chat; un turno sin chat usa uno propio que se descarta al terminar."""
+        if not context_id:
+            return EditActions()
+        edit_actions = self.contract_states.get(context_id)
+        if edit_actions is None:
+            edit_actions = self.contract_states[context_id] = EditActions()
+            while len(self.contract_states) > MAX_CONTRACT_STATES:
+                self.contract_states.popitem(last=False)
+        else:
+            self.contract_states.move_to_end(context_id)
+        return edit_actions
+
+    @staticmethod
+    def _contract_state(edit_actions: EditActions) -> Dict:
+        """Estado del contrato del que depende cómo se interpretan los bloques de código de la respuesta."""
+        active_contract = edit_actions.active_contract
+        return {
+            "path": active_contract["path"],
+            "content": active_contract["content"],
+            "editing": edit_actions.current_contract_context["file"] is not None or active_contract["is_complete"]
+        }
+
+    async def _replay(self, text: str, context_id: str | None, edit_actions: EditActions) -> AsyncGenerator[Dict, None]:
+        """Reproduce una respuesta cacheada como si llegara del LLM en un único fragmento."""
+        yield {
+            "type": "message_delta",
+            "content": text,
+            "metadata": {"chat_id": context_id, "cached": True}
+        }
+        parser = edit_actions.create_stream_parser()
+        for action in parser.feed(text) + parser.close():
+            yield await self.handle_action(action, context_id)
+
+    def _upstream_slot(self):
+        return self.limiter if self.limiter is not None else contextlib.nullcontext()
+
     async def handle_action(self, action: Dict, context_id: str | None = None) -> Dict:
         """Maneja una acción específica y retorna la respuesta apropiada."""
         action_type = action.get("type")
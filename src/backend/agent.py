@@ -1,28 +1,30 @@
-import os
 import logging
 from typing import Dict, AsyncGenerator
-from anthropic import AsyncAnthropic
-from dotenv import load_dotenv
 from file_manager import FileManager
-from actions import CompilationActions, EditActions, MessageActions
+from llm_client import get_anthropic_client, get_upstream_limiter
+from actions import CompilationActions, MessageActions
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
 class Agent:
-    def __init__(self, file_manager: FileManager):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY no encontrada en las variables de entorno")
-        
-        self.anthropic = AsyncAnthropic(api_key=api_key)
+    def __init__(self, file_manager: FileManager, chat_manager=None, wallet_address: str = "", history_store=None,
+                 response_cache=None):
+        # Cliente y limitador compartidos por todos los agentes del proceso
+        self.anthropic = get_anthropic_client()
+        self.limiter = get_upstream_limiter()
         self.file_manager = file_manager
+        self.chat_manager = chat_manager
         
-        # Inicializar las acciones
-        self.edit_actions = EditActions()
-        self.compilation_actions = CompilationActions(self.anthropic, self.file_manager)
-        self.message_actions = MessageActions(self.anthropic, self.edit_actions, self.compilation_actions)
-
+        # Inicializar las acciones (el estado del contrato de cada chat vive en MessageActions)
+        self.compilation_actions = CompilationActions(self.anthropic, self.file_manager, self.limiter)
+        self.message_actions = MessageActions(
+            self.anthropic,
+            self.compilation_actions,
+            self.limiter,
+            history_store=history_store,
+            wallet_address=wallet_address,
+            response_cache=response_cache
+        )
     async def process_message(self, message: str, context: Dict, context_id: str | None = None) -> AsyncGenerator[Dict, None]:
         """Procesa un mensaje del usuario y genera respuestas."""
         async for response in self.message_actions.process_message(message, context, context_id):
@@ -0,0 +1,114 @@
+"""Compara los codecs de websocket: bytes en el cable y tiempo de codificación.
+
+Uso (desde src/backend):
+    python benchmarks/bench_encoding.py [--chats 20] [--file-kb 16] [--repeat 200]
+
+Para cargas típicas del chat (`contexts_loaded` completo, `file_create` y
+`file_version` con un contrato y un `message_delta`) mide el tamaño
+y el tiempo de codificar con `json.dumps` tal como se hacía antes (la línea
+base), con el codec JSON compacto y con MessagePack (si `msgpack` está
+instalado). La columna "deflate" es el tamaño tras permessage-deflate, simulado
+con zlib sin context takeover (el caso más desfavorable: cada frame se
+comprime por separado), y "deflate µs" incluye codificar y comprimir.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import CODECS
+
+WORDS = ["balance", "allowance", "owner", "supply", "reward", "stake", "vault", "fee", "limit", "nonce",
+         "treasury", "epoch", "claim", "deposit", "withdraw", "price", "oracle", "round", "share", "debt"]
+
+def build_contract(kb: int, seed: int = 0) -> str:
+    """Contrato sintético con identificadores y constantes variados (no trivialmente comprimible)."""
+    rng = random.Random(seed)
+    lines = ["// SPDX-License-Identifier: MIT", "pragma solidity ^0.8.20;", "", f"contract Token{seed} {{"]
+    while sum(len(line) + 1 for line in lines) < kb * 1024:
+        a, b = rng.sample(WORDS, 2)
+        name = f"{a}{b.capitalize()}{rng.randint(0, 999)}"
+        lines.append(f"    mapping(address => uint256) public {name};")
+        lines.append(f"    /// @notice Updates {a} for {b} ({rng.getrandbits(32):08x})")
+        lines.append(f"    function set{name[0].upper()}{name[1:]}(address account, uint256 amount) external {{")
+        lines.append(f"        require(amount <= {rng.randint(1, 10**12)}, \"{a} exceeds {b} limit\");")
+        lines.append(f"        {name}[account] = amount * {rng.randint(2, 997)} / {rng.randint(2, 997)};")
+        lines.append("    }")
+    lines.append("}")
+    return "\n".join(lines)
+
+def build_payloads(chats: int, file_kb: int) -> dict:
+    contract = build_contract(file_kb)
+    messages = [{
+        "id": f"msg-{i}",
+        "text": "Añade una función de mint con control de acceso" if i % 2 == 0 else "He añadido la función `mint`.",
+        "sender": "user" if i % 2 == 0 else "ai",
+        "timestamp": 1700000000000.0 + i,
+        "type": "message"
+    } for i in range(20)]
+    chat_list = [{
+        "id": f"chat-{i}",
+        "name": f"Token {i}",
+        "wallet_address": "0x" + "ab" * 20,
+        "created_at": "2024-01-01T00:00:00",
+        "last_updated": "2024-01-02T00:00:00",
+        "messages": messages,
+        "virtualFiles": {"contracts/Token.sol": {"content": build_contract(file_kb // 2, i), "language": "solidity",
+                                                 "timestamp": 1700000000000.0}}
+    } for i in range(chats)]
+    return {
+        "contexts_loaded": {"type": "contexts_loaded", "content": chat_list},
+        "file_create": {"type": "file_create", "content": contract,
+                        "metadata": {"path": "contracts/Token.sol", "language": "solidity"}},
+        "file_version": {"type": "file_version", "content": build_contract(file_kb, 1),
+                         "metadata": {"path": "contracts/Token.sol", "chat_id": "chat-0", "version": 3,
+                                      "timestamp": 1700000000000.0}},
+        "message_delta": {"type": "message_delta", "content": "Voy a revisar el contrato ",
+                          "metadata": {"chat_id": "chat-0"}}
+    }
+
+def as_bytes(data) -> bytes:
+    return data if isinstance(data, bytes) else data.encode("utf-8")
+
+def deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)[:-4]
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--chats", type=int, default=20, help="chats incluidos en contexts_loaded")
+    arg_parser.add_argument("--file-kb", type=int, default=16, help="tamaño del contrato")
+    arg_parser.add_argument("--repeat", type=int, default=200, help="iteraciones por medida")
+    args = arg_parser.parse_args()
+
+    encoders = {"json (baseline)": json.dumps}
+    for name, codec_class in CODECS.items():
+        encoders[name] = codec_class().encode
+    if "msgpack" not in CODECS:
+        print("msgpack is not installed; only JSON codecs are measured\n")
+
+    print(f"{'payload':<16} {'encoding':<16} {'bytes':>10} {'deflate':>10} {'ratio':>7} {'encode µs':>11} {'deflate µs':>11}")
+    for payload_name, payload in build_payloads(args.chats, args.file_kb).items():
+        baseline = len(as_bytes(json.dumps(payload)))
+        repeat = max(1, args.repeat if payload_name == "message_delta" else args.repeat // 10)
+        for encoding, encode in encoders.items():
+            raw = as_bytes(encode(payload))
+            compressed = deflate(raw)
+            encode_us = timed(lambda: encode(payload), repeat)
+            deflate_us = timed(lambda: deflate(as_bytes(encode(payload))), repeat)
+            print(f"{payload_name:<16} {encoding:<16} {len(raw):>10} {len(compressed):>10} "
+                  f"{len(compressed) / baseline:>7.2f} {encode_us:>11.1f} {deflate_us:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark del parser de acciones sobre respuestas grandes con muchos bloques de código.
+
+Uso (desde src/backend):
+    python benchmarks/bench_parse_actions.py [--blocks 50] [--lines 40] [--steps 5] [--chunk 24]
+
+Para cada tamaño (que se duplica en cada paso) mide el tiempo de
+`parse_actions` sobre la respuesta completa y el de `ActionStreamParser`
+alimentado en fragmentos de `--chunk` caracteres, junto con el pico de memoria
+asignada (tracemalloc). Un tiempo por KB constante indica coste lineal y un
+pico que crece con el bloque más grande, no con la respuesta, indica
+asignaciones acotadas.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.edit_actions import EditActions
+
+def build_response(blocks: int, lines_per_block: int) -> str:
+    parts = []
+    for b in range(blocks):
+        parts.append(f"Step {b}: we will add a new function to the contract.")
+        parts.append("Suggestion: consider emitting an event." if b % 5 == 0 else "Here is the update.")
+        parts.append("```solidity")
+        parts.append("// SPDX-License-Identifier: MIT")
+        parts.append("pragma solidity ^0.8.20;")
+        parts.append(f"contract Token{b} {{")
+        for i in range(lines_per_block):
+            parts.append(f"    function f{i}(uint256 value) public pure returns (uint256) {{ return value + {i}; }}")
+        parts.append("}")
+        parts.append("```")
+        parts.append("Security considerations: validate inputs and keep access control tight.")
+    return "\n".join(parts)
+
+def measure(fn) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def parse_whole(response: str) -> None:
+    EditActions().parse_actions(response)
+
+def parse_streamed(response: str, chunk_size: int) -> None:
+    parser = EditActions().create_stream_parser()
+    for i in range(0, len(response), chunk_size):
+        parser.feed(response[i:i + chunk_size])
+    parser.close()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--blocks", type=int, default=50, help="bloques de código en el tamaño inicial")
+    arg_parser.add_argument("--lines", type=int, default=40, help="líneas por bloque")
+    arg_parser.add_argument("--steps", type=int, default=5, help="número de duplicaciones del tamaño")
+    arg_parser.add_argument("--chunk", type=int, default=24, help="caracteres por fragmento en modo streaming")
+    args = arg_parser.parse_args()
+
+    print(f"{'blocks':>8} {'KB':>10} {'whole ms':>10} {'us/KB':>8} {'peak KB':>9} "
+          f"{'stream ms':>10} {'us/KB':>8} {'peak KB':>9}")
+    for step in range(args.steps):
+        blocks = args.blocks * (2 ** step)
+        response = build_response(blocks, args.lines)
+        size_kb = len(response) / 1024
+        whole_time, whole_peak = measure(lambda: parse_whole(response))
+        stream_time, stream_peak = measure(lambda: parse_streamed(response, args.chunk))
+        print(f"{blocks:>8} {size_kb:>10.1f} {whole_time * 1000:>10.1f} {whole_time * 1e6 / size_kb:>8.1f} "
+              f"{whole_peak / 1024:>9.1f} {stream_time * 1000:>10.1f} {stream_time * 1e6 / size_kb:>8.1f} "
+              f"{stream_peak / 1024:>9.1f}")
+
+if __name__ == "__main__":
+    main()
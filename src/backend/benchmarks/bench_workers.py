@@ -0,0 +1,137 @@
+"""Prueba de carga del servidor con distinto número de workers y el backend SQLite compartido.
+
+Uso (desde src/backend):
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--clients 64] [--duration 15] [--file-kb 8]
+
+Para cada número de workers arranca `main.py --production` sobre una base de
+datos temporal y conecta `--clients` wallets. Cada cliente crea un chat y,
+durante `--duration` segundos, alterna `save_file` (un contrato de `--file-kb`
+KB con una línea distinta cada vez) y `get_messages`, esperando cada
+respuesta. No se llama al LLM. Los clientes se reparten en varios procesos
+para que no sean ellos el cuello de botella. Se informa de operaciones por
+segundo y de la latencia por operación; con un servidor limitado por CPU, el
+throughput debe crecer con los workers hasta el número de núcleos.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import ServerStartError, free_port, start_server, stop_server, summarize
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+def build_contract(kb: int, revision: int) -> str:
+    lines = ["// SPDX-License-Identifier: MIT", "pragma solidity ^0.8.20;", "contract Load {"]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < kb * 1024:
+        lines.append(f"    uint256 public value{i} = {i};")
+        i += 1
+    lines.insert(3, f"    // revision {revision}")
+    lines.append("}")
+    return "\n".join(lines)
+
+# Espera máxima por respuesta: un servidor caído no deja la ronda colgada
+RESPONSE_TIMEOUT = 30.0
+
+async def run_client(port: int, index: int, duration: float, file_kb: int) -> dict:
+    wallet = f"0x{index:040x}"
+    uri = f"ws://127.0.0.1:{port}/ws/agent?wallet_address={wallet}&contexts=summary"
+    latencies, errors = [], 0
+    async with websockets.connect(uri, max_size=None) as ws:
+        await asyncio.wait_for(ws.recv(), RESPONSE_TIMEOUT)  # contexts_loaded
+        await ws.send(json.dumps({"type": "create_context", "content": "load test"}))
+        chat_id = json.loads(await asyncio.wait_for(ws.recv(), RESPONSE_TIMEOUT))["content"]["id"]
+        deadline = time.monotonic() + duration
+        revision = 0
+        while time.monotonic() < deadline:
+            revision += 1
+            if revision % 2:
+                request = {"type": "save_file", "chat_id": chat_id, "path": "contracts/Load.sol",
+                           "content": build_contract(file_kb, revision)}
+            else:
+                request = {"type": "get_messages", "chat_id": chat_id, "limit": 20}
+            start = time.perf_counter()
+            await ws.send(json.dumps(request))
+            response = json.loads(await asyncio.wait_for(ws.recv(), RESPONSE_TIMEOUT))
+            latencies.append(time.perf_counter() - start)
+            if response.get("type") == "error":
+                errors += 1
+    return {"latencies": latencies, "errors": errors}
+
+def client_process(args: tuple) -> dict:
+    port, indices, duration, file_kb = args
+
+    async def run_all():
+        results = await asyncio.gather(
+            *(run_client(port, index, duration, file_kb) for index in indices), return_exceptions=True
+        )
+        latencies, errors, failed = [], 0, 0
+        for result in results:
+            if isinstance(result, Exception):
+                failed += 1
+                continue
+            latencies.extend(result["latencies"])
+            errors += result["errors"]
+        return {"latencies": latencies, "errors": errors, "failed_clients": failed}
+
+    return asyncio.run(run_all())
+
+def run_round(workers: int, clients: int, duration: float, file_kb: int, client_procs: int) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = start_server(port, workers, {
+            "CHAT_BACKEND": "sqlite",
+            "CHAT_BASE_PATH": data_dir
+        })
+        try:
+            batches = [list(range(i, clients, client_procs)) for i in range(client_procs)]
+            start = time.perf_counter()
+            with multiprocessing.Pool(client_procs) as pool:
+                results = pool.map(client_process, [(port, batch, duration, file_kb) for batch in batches if batch])
+            elapsed = time.perf_counter() - start
+        finally:
+            stop_server(server)
+
+    latencies = [latency for result in results for latency in result["latencies"]]
+    return dict(
+        summarize(latencies),
+        workers=workers,
+        ops_per_second=len(latencies) / elapsed,
+        errors=sum(result["errors"] for result in results),
+        failed_clients=sum(result["failed_clients"] for result in results)
+    )
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="números de workers a probar")
+    arg_parser.add_argument("--clients", type=int, default=64, help="conexiones concurrentes (una wallet cada una)")
+    arg_parser.add_argument("--duration", type=float, default=15.0, help="segundos de carga por ronda")
+    arg_parser.add_argument("--file-kb", type=int, default=8, help="tamaño del contrato guardado")
+    arg_parser.add_argument("--client-procs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                            help="procesos que generan la carga")
+    args = arg_parser.parse_args()
+    if websockets is None:
+        sys.exit("This benchmark requires the 'websockets' package")
+
+    print(f"{'workers':>8} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'failed':>7}")
+    for workers in args.workers:
+        try:
+            result = run_round(workers, args.clients, args.duration, args.file_kb, args.client_procs)
+        except ServerStartError as e:
+            print(f"{workers:>8} server failed to start: {e}")
+            continue
+        print(f"{workers:>8} {result['ops_per_second']:>10.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['errors']:>7} {result['failed_clients']:>7}")
+
+if __name__ == "__main__":
+    main()
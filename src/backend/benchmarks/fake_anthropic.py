@@ -0,0 +1,225 @@
+"""Sustituto local de la API de Anthropic para las pruebas de carga.
+
+Uso (desde src/backend):
+    python benchmarks/fake_anthropic.py [--port 8089] [--latency 0.5] [--tokens-per-second 200] [--error-rate 0]
+
+Atiende `POST /v1/messages` con respuestas Solidity predefinidas: en
+streaming (SSE, los mismos eventos que la API real) o como un mensaje
+completo. `--latency` es la espera antes del primer token y
+`--tokens-per-second` el ritmo al que se emiten después. Con `--error-rate`
+una fracción de las peticiones responde 529 (overloaded), como la API real
+bajo carga. Solo usa la biblioteca estándar. El backend se apunta aquí con
+ANTHROPIC_BASE_URL=http://127.0.0.1:<port>.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import uuid
+
+# Última línea de cada respuesta: el cliente de carga la usa para detectar el fin del turno
+END_MARKER = "[end of canned response]"
+
+CONTRACTS = [
+    """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+import "@openzeppelin/contracts/token/ERC20/ERC20.sol";
+import "@openzeppelin/contracts/access/Ownable.sol";
+
+contract LoadToken is ERC20, Ownable {
+    uint256 public constant MAX_SUPPLY = 1_000_000 ether;
+
+    constructor(address initialOwner) ERC20("Load Token", "LOAD") Ownable(initialOwner) {}
+
+    function mint(address to, uint256 amount) external onlyOwner {
+        require(totalSupply() + amount <= MAX_SUPPLY, "Max supply exceeded");
+        _mint(to, amount);
+    }
+}""",
+    """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+import "@openzeppelin/contracts/token/ERC721/ERC721.sol";
+import "@openzeppelin/contracts/access/Ownable.sol";
+
+contract LoadCollection is ERC721, Ownable {
+    uint256 private _nextTokenId;
+    uint256 public price = 0.01 ether;
+
+    constructor(address initialOwner) ERC721("Load Collection", "LCOL") Ownable(initialOwner) {}
+
+    function safeMint(address to) external payable {
+        require(msg.value >= price, "Insufficient payment");
+        _safeMint(to, _nextTokenId++);
+    }
+
+    function withdraw() external onlyOwner {
+        (bool ok, ) = owner().call{value: address(this).balance}("");
+        require(ok, "Withdraw failed");
+    }
+}""",
+    """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+import "@openzeppelin/contracts/utils/ReentrancyGuard.sol";
+
+contract LoadVault is ReentrancyGuard {
+    mapping(address => uint256) public balances;
+
+    event Deposited(address indexed account, uint256 amount);
+    event Withdrawn(address indexed account, uint256 amount);
+
+    function deposit() external payable {
+        require(msg.value > 0, "Nothing to deposit");
+        balances[msg.sender] += msg.value;
+        emit Deposited(msg.sender, msg.value);
+    }
+
+    function withdraw(uint256 amount) external nonReentrant {
+        require(balances[msg.sender] >= amount, "Insufficient balance");
+        balances[msg.sender] -= amount;
+        (bool ok, ) = msg.sender.call{value: amount}("");
+        require(ok, "Transfer failed");
+        emit Withdrawn(msg.sender, amount);
+    }
+}"""
+]
+
+TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+def canned_response(index: int) -> str:
+    contract = CONTRACTS[index % len(CONTRACTS)]
+    return (
+        "I will write the contract using OpenZeppelin v5.0.0 building blocks.\n"
+        "The owner controls privileged functions and every external input is validated.\n\n"
+        f"```solidity\n{contract}\n```\n\n"
+        "Security considerations: privileged functions are restricted and checks happen before effects.\n"
+        f"{END_MARKER}"
+    )
+
+class FakeAnthropic:
+    def __init__(self, latency: float, tokens_per_second: float, error_rate: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._counter = itertools.count()
+        # Conexiones TCP aceptadas: permite comprobar que el backend reutiliza su pool
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            # Conexiones keep-alive: varias peticiones por conexión, como hace httpx
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                if method != "POST" or not path.startswith("/v1/messages"):
+                    await self._send_json(writer, 404, {"type": "error", "error": {"type": "not_found_error", "message": path}})
+                    continue
+                request = json.loads(body or b"{}")
+                if self.error_rate and random.random() < self.error_rate:
+                    await asyncio.sleep(self.latency / 10)
+                    await self._send_json(writer, 529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+                    continue
+                text = canned_response(next(self._counter))
+                input_tokens = max(1, len(body) // 4)
+                if request.get("stream"):
+                    await self._stream(writer, request, text, input_tokens)
+                else:
+                    await self._complete(writer, request, text, input_tokens)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"content-type: application/json\r\ncontent-length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _complete(self, writer: asyncio.StreamWriter, request: dict, text: str, input_tokens: int) -> None:
+        tokens = TOKEN_PATTERN.findall(text)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        await self._send_json(writer, 200, {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "fake"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": len(tokens)}
+        })
+
+    async def _stream(self, writer: asyncio.StreamWriter, request: dict, text: str, input_tokens: int) -> None:
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ncache-control: no-cache\r\n"
+                     b"transfer-encoding: chunked\r\n\r\n")
+
+        async def event(name: str, data: dict) -> None:
+            payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            writer.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            await writer.drain()
+
+        await event("message_start", {"type": "message_start", "message": {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant", "content": [],
+            "model": request.get("model", "fake"), "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1}
+        }})
+        await event("content_block_start", {"type": "content_block_start", "index": 0,
+                                            "content_block": {"type": "text", "text": ""}})
+        await asyncio.sleep(self.latency)
+        tokens = TOKEN_PATTERN.findall(text)
+        interval = 1.0 / self.tokens_per_second
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i, token in enumerate(tokens):
+            await event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                "delta": {"type": "text_delta", "text": token}})
+            # Ritmo absoluto: no acumula el retraso de cada sleep
+            delay = start + (i + 1) * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        await event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": len(tokens)}})
+        await event("message_stop", {"type": "message_stop"})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+async def serve(host: str, port: int, latency: float, tokens_per_second: float, error_rate: float = 0.0) -> None:
+    fake = FakeAnthropic(latency, tokens_per_second, error_rate)
+    server = await asyncio.start_server(fake.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8089)
+    arg_parser.add_argument("--latency", type=float, default=0.5, help="segundos hasta el primer token")
+    arg_parser.add_argument("--tokens-per-second", type=float, default=200.0, help="ritmo de emisión de tokens")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de peticiones que responden 529")
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.latency, args.tokens_per_second, args.error_rate))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Utilidades compartidas por los benchmarks de carga: arranque del servidor y estadísticas.
+
+Requiere el paquete `websockets` (incluido en requirements.txt) para los clientes.
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import urllib.request
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Server did not start listening on port {port}")
+
+class ServerStartError(RuntimeError):
+    """El servidor terminó o no respondió al arrancar; el mensaje incluye el final de su salida de error."""
+
+def _tail(log, lines: int = 20) -> str:
+    log.seek(0)
+    return "".join(log.read().decode("utf-8", "replace").splitlines(keepends=True)[-lines:])
+
+def wait_for_server(process: subprocess.Popen, port: int, log, timeout: float = 60.0) -> None:
+    """Espera a que un worker responda por HTTP; falla en cuanto el proceso termina."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise ServerStartError(f"Server exited with code {process.returncode}:\n{_tail(log)}")
+        try:
+            # Con varios workers el proceso padre ya escucha aunque ningún worker haya arrancado
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1.0):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise ServerStartError(f"Server did not answer on port {port} within {timeout:.0f}s:\n{_tail(log)}")
+
+def start_server(port: int, workers: int, env: Dict[str, str] | None = None) -> subprocess.Popen:
+    """Arranca `main.py --production` con `workers` procesos y espera a que responda.
+
+    Si el servidor termina o no responde lanza `ServerStartError` con el
+    final de su salida de error, en vez de esperar a que los clientes agoten
+    su tiempo.
+    """
+    server_env = dict(os.environ)
+    server_env.setdefault("ANTHROPIC_API_KEY", "benchmark")
+    server_env.update(env or {})
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--production", "--workers", str(workers), "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=server_env,
+        stderr=log
+    )
+    process.log = log
+    try:
+        wait_for_server(process, port, log)
+        # Los demás workers pueden tardar algo más que el primero en arrancar
+        time.sleep(0.25 * workers)
+    except Exception:
+        stop_server(process)
+        raise
+    return process
+
+def stop_server(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    log = getattr(process, "log", None)
+    if log is not None:
+        log.close()
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 y máximo en milisegundos."""
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0
+    }
@@ -0,0 +1,269 @@
+"""Prueba de carga extremo a extremo con un LLM falso local.
+
+Uso (desde src/backend):
+    python benchmarks/load_test.py [--clients 32] [--turns 3] [--workers 1]
+        [--latency 0.5] [--tokens-per-second 200] [--output results.json] [--compare previous.json]
+
+Arranca `benchmarks/fake_anthropic.py` y `main.py --production` apuntando a
+él (ANTHROPIC_BASE_URL), con los datos de chat en un directorio temporal.
+Cada uno de los `--clients` clientes websocket conecta con su propia wallet,
+crea un chat y repite `--turns` veces: un mensaje al agente (hasta recibir la
+última línea de la respuesta predefinida), `save_file` con el contrato y
+`get_file_version` de su primera versión.
+
+Informa del throughput, la latencia p50/p95/p99 de cada operación, el
+tiempo hasta el primer frame y hasta el primer token de cada turno, y la
+memoria residente (RSS) del servidor, incluidos sus workers, muestreada
+desde /proc. Los resultados se guardan en JSON junto con el commit de git,
+en `benchmarks/results/` por defecto. `--compare` muestra la variación
+respecto a un resultado anterior.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import BACKEND_DIR, ServerStartError, free_port, start_server, stop_server, summarize, wait_for_port
+from fake_anthropic import END_MARKER
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+CONTRACT_PATH = "contracts/Contract.sol"
+
+async def run_client(port: int, index: int, turns: int, timeout: float) -> dict:
+    wallet = f"0x{index:040x}"
+    uri = f"ws://127.0.0.1:{port}/ws/agent?wallet_address={wallet}&contexts=summary"
+    latencies = {"connect": [], "create_context": [], "message": [], "save_file": [], "get_file_version": []}
+    first_frame, first_token, errors = [], [], 0
+
+    async def request(ws, payload: dict, expected: str) -> dict:
+        start = time.perf_counter()
+        await ws.send(json.dumps(payload))
+        while True:
+            frame = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+            if frame.get("type") in (expected, "error"):
+                latencies[payload["type"]].append(time.perf_counter() - start)
+                return frame
+
+    start = time.perf_counter()
+    async with websockets.connect(uri, max_size=None) as ws:
+        await asyncio.wait_for(ws.recv(), timeout)  # contexts_loaded
+        latencies["connect"].append(time.perf_counter() - start)
+        chat = await request(ws, {"type": "create_context", "content": f"load test {index}"}, "context_created")
+        chat_id = chat["content"]["id"]
+
+        for turn in range(turns):
+            start = time.perf_counter()
+            await ws.send(json.dumps({"type": "message", "chat_id": chat_id, "content": f"Write a token contract ({turn})",
+                                      "context": {}}))
+            got_frame, got_token, contract = False, False, None
+            while True:
+                frame = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+                elapsed = time.perf_counter() - start
+                if not got_frame:
+                    first_frame.append(elapsed)
+                    got_frame = True
+                if frame.get("type") == "message_delta" and not got_token:
+                    first_token.append(elapsed)
+                    got_token = True
+                if frame.get("type") in ("file_create", "code_edit"):
+                    contract = frame["content"]
+                if frame.get("type") == "error":
+                    errors += 1
+                    break
+                if frame.get("type") == "message" and frame.get("content") == END_MARKER:
+                    break
+            latencies["message"].append(time.perf_counter() - start)
+
+            saved = await request(ws, {"type": "save_file", "chat_id": chat_id, "path": CONTRACT_PATH,
+                                       "content": contract if isinstance(contract, str) else f"// turn {turn}"},
+                                  "file_saved")
+            version = await request(ws, {"type": "get_file_version", "chat_id": chat_id, "path": CONTRACT_PATH,
+                                         "version": 0}, "file_version")
+            errors += sum(1 for frame in (saved, version) if frame.get("type") == "error")
+    return {"latencies": latencies, "first_frame": first_frame, "first_token": first_token, "errors": errors}
+
+class RssSampler(threading.Thread):
+    """Muestrea la RSS del servidor y de sus procesos hijo (workers) desde /proc."""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    @staticmethod
+    def _rss_kb(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def _tree(self) -> list:
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children") as children:
+                    pending.extend(int(child) for child in children.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def run(self):
+        while not self._done.is_set():
+            self.samples.append(sum(self._rss_kb(pid) for pid in self._tree()))
+            self._done.wait(self.interval)
+
+    def stop(self) -> dict:
+        self._done.set()
+        self.join()
+        samples = [sample for sample in self.samples if sample] or [0]
+        return {"rss_start_mb": samples[0] / 1024, "rss_peak_mb": max(samples) / 1024, "rss_end_mb": samples[-1] / 1024}
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+async def run_clients(port: int, clients: int, turns: int, timeout: float) -> list:
+    return await asyncio.gather(*(run_client(port, index, turns, timeout) for index in range(clients)),
+                                return_exceptions=True)
+
+def run_load_test(args) -> dict:
+    fake_port, port = free_port(), free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_anthropic.py"), "--port", str(fake_port),
+         "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+         "--error-rate", str(args.error_rate)]
+    )
+    try:
+        wait_for_port(fake_port)
+        with tempfile.TemporaryDirectory() as data_dir:
+            server = start_server(port, args.workers, {
+                "ANTHROPIC_API_KEY": "load-test",
+                "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{fake_port}",
+                "ANTHROPIC_MAX_CONCURRENCY": str(args.llm_concurrency),
+                "CHAT_BASE_PATH": data_dir,
+                "CHAT_BACKEND": "sqlite" if args.workers > 1 else os.getenv("CHAT_BACKEND", "file")
+            })
+            sampler = RssSampler(server.pid)
+            sampler.start()
+            try:
+                start = time.perf_counter()
+                results = asyncio.run(run_clients(port, args.clients, args.turns, args.timeout))
+                elapsed = time.perf_counter() - start
+            finally:
+                memory = sampler.stop()
+                stop_server(server)
+    finally:
+        stop_server(fake)
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    completed = [result for result in results if not isinstance(result, Exception)]
+    operations = {}
+    for name in ("connect", "create_context", "message", "save_file", "get_file_version"):
+        operations[name] = summarize([value for result in completed for value in result["latencies"][name]])
+    total_ops = sum(summary["count"] for summary in operations.values())
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "config": {key: getattr(args, key) for key in ("clients", "turns", "workers", "latency", "tokens_per_second",
+                                                       "error_rate", "llm_concurrency")},
+        "elapsed_seconds": elapsed,
+        "ops_per_second": total_ops / elapsed,
+        "turns_per_second": operations["message"]["count"] / elapsed,
+        "operations": operations,
+        "time_to_first_frame": summarize([value for result in completed for value in result["first_frame"]]),
+        "time_to_first_token": summarize([value for result in completed for value in result["first_token"]]),
+        "memory": memory,
+        "errors": sum(result["errors"] for result in completed),
+        "failed_clients": len(failures),
+        "failure_samples": sorted({repr(failure) for failure in failures})[:5]
+    }
+
+def print_report(result: dict, previous: dict | None = None) -> None:
+    def delta(current: float, before: float | None) -> str:
+        if not before:
+            return ""
+        return f" ({(current - before) / before * 100:+.1f}%)"
+
+    print(f"commit {result['git']['commit'][:12]}{' (dirty)' if result['git']['dirty'] else ''}  "
+          f"clients={result['config']['clients']} turns={result['config']['turns']} workers={result['config']['workers']}")
+    print(f"throughput: {result['ops_per_second']:.1f} ops/s{delta(result['ops_per_second'], previous and previous['ops_per_second'])}, "
+          f"{result['turns_per_second']:.2f} turns/s")
+    print(f"{'operation':<22} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = dict(result["operations"], time_to_first_frame=result["time_to_first_frame"],
+                time_to_first_token=result["time_to_first_token"])
+    for name, summary in rows.items():
+        before = None
+        if previous:
+            before = (previous["operations"].get(name) or previous.get(name) or {}).get("p95_ms")
+        print(f"{name:<22} {summary['count']:>6} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} "
+              f"{summary['p99_ms']:>9.1f} {summary['max_ms']:>9.1f}{delta(summary['p95_ms'], before)}")
+    memory = result["memory"]
+    print(f"server RSS: start {memory['rss_start_mb']:.1f} MB, peak {memory['rss_peak_mb']:.1f} MB"
+          f"{delta(memory['rss_peak_mb'], previous and previous['memory']['rss_peak_mb'])}, end {memory['rss_end_mb']:.1f} MB")
+    print(f"errors: {result['errors']}, failed clients: {result['failed_clients']}")
+    for sample in result["failure_samples"]:
+        print(f"  {sample}")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--clients", type=int, default=32, help="conexiones concurrentes (una wallet cada una)")
+    arg_parser.add_argument("--turns", type=int, default=3, help="turnos por cliente")
+    arg_parser.add_argument("--workers", type=int, default=1, help="workers del servidor (con más de uno, backend SQLite)")
+    arg_parser.add_argument("--latency", type=float, default=0.5, help="segundos hasta el primer token del LLM falso")
+    arg_parser.add_argument("--tokens-per-second", type=float, default=200.0, help="ritmo de tokens del LLM falso")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de llamadas al LLM que fallan con 529")
+    arg_parser.add_argument("--llm-concurrency", type=int, default=16, help="ANTHROPIC_MAX_CONCURRENCY del servidor")
+    arg_parser.add_argument("--timeout", type=float, default=120.0, help="espera máxima por frame")
+    arg_parser.add_argument("--output", help="archivo JSON de resultados")
+    arg_parser.add_argument("--compare", help="resultado JSON anterior con el que comparar")
+    args = arg_parser.parse_args()
+    if websockets is None:
+        sys.exit("This benchmark requires the 'websockets' package")
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    try:
+        result = run_load_test(args)
+    except ServerStartError as e:
+        sys.exit(f"Server failed to start: {e}")
+    print_report(result, previous)
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(BACKEND_DIR, "benchmarks", "results")
+        os.makedirs(results_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(results_dir, f"load_test-{result['git']['commit'][:12] or 'nogit'}-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """Almacén de contenidos direccionado por hash (sha256 -> cuerpo comprimido con zlib).
+
+    Los textos grandes que se repiten (código de contratos en mensajes,
+    archivos virtuales e historial) se guardan una sola vez en
+    `<base>/<hash[:2]>/<hash>.z` y los chats guardan solo la referencia.
+    Cada propietario (un chat) declara el conjunto de hashes que usa; un blob
+    se borra cuando ningún propietario lo referencia. El conjunto de cada
+    propietario se persiste en su propio archivo, `refs/<wallet>/<chat_id>.refs`
+    (un hash por línea): añadir referencias solo anexa líneas a ese archivo y
+    sustituirlas lo reescribe, sin tocar los de otros chats. Es seguro entre
+    hilos (lo usan los hilos del escritor de chats); el lock global solo
+    protege los contadores en memoria y el borrado de blobs.
+    """
+
+    def __init__(self, base_path: str, min_bytes: int | None = None, compression_level: int = 6, cache_size: int = 256):
+        self.base_path = base_path
+        self.min_bytes = min_bytes if min_bytes is not None else int(os.getenv("BLOB_MIN_BYTES", "1024"))
+        self.compression_level = compression_level
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        # Serializa las escrituras del archivo de refs de un mismo propietario
+        self._owner_locks = [threading.Lock() for _ in range(64)]
+        self._owners: Dict[str, Set[str]] | None = None
+        self._counts: Dict[str, int] = {}
+        # Contenidos decodificados recientes: chats que comparten un blob comparten el mismo str
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self.writes = 0
+        self.collected = 0
+        os.makedirs(self.base_path, exist_ok=True)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.base_path, digest[:2], f"{digest}.z")
+
+    def _refs_dir(self) -> str:
+        return os.path.join(self.base_path, "refs")
+
+    def _owner_refs_path(self, owner: str) -> str:
+        return os.path.join(self._refs_dir(), *owner.split("/")) + ".refs"
+
+    def _owner_lock(self, owner: str) -> threading.Lock:
+        return self._owner_locks[hash(owner) % len(self._owner_locks)]
+
+    def _load_refs(self) -> None:
+        if self._owners is not None:
+            return
+        self._owners = {}
+        refs_dir = self._refs_dir()
+        for root, _, files in os.walk(refs_dir):
+            for name in files:
+                if not name.endswith(".refs"):
+                    continue
+                path = os.path.join(root, name)
+                owner = os.path.relpath(path, refs_dir)[:-len(".refs")].replace(os.sep, "/")
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        # Una línea truncada por una escritura interrumpida no es un hash válido
+                        hashes = {line.strip() for line in f if len(line.strip()) == 64}
+                except OSError as e:
+                    # Los chats vuelven a registrar sus referencias al cargarse
+                    logger.warning(f"Ignoring unreadable blob refs {path}: {str(e)}")
+                    continue
+                if hashes:
+                    self._owners[owner] = hashes
+        self._migrate_legacy_refs()
+        self._counts = {}
+        for hashes in self._owners.values():
+            for digest in hashes:
+                self._counts[digest] = self._counts.get(digest, 0) + 1
+
+    def _migrate_legacy_refs(self) -> None:
+        """Convierte el antiguo `refs.json` global en archivos por propietario."""
+        path = os.path.join(self.base_path, "refs.json")
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            for owner, hashes in legacy.items():
+                if owner not in self._owners and hashes:
+                    self._owners[owner] = set(hashes)
+                    self._write_owner_refs(owner, self._owners[owner], replace=True)
+            os.remove(path)
+            logger.info(f"Migrated blob refs of {len(legacy)} owners to per-chat files")
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable blob refs: {str(e)}")
+
+    def _write_owner_refs(self, owner: str, hashes: Set[str], replace: bool) -> None:
+        """Persiste las refs de un propietario: anexa `hashes` o, con `replace`, reescribe el archivo."""
+        path = self._owner_refs_path(owner)
+        if replace and not hashes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = "".join(f"{digest}\n" for digest in sorted(hashes))
+        if not replace:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def digest(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _ensure_blob(self, digest: str, content: str) -> None:
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(content.encode("utf-8"), self.compression_level))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.writes += 1
+
+    def get(self, digest: str) -> str:
+        with self._lock:
+            content = self._cache.get(digest)
+            if content is not None:
+                self._cache.move_to_end(digest)
+                return content
+        with open(self._blob_path(digest), 'rb') as f:
+            content = zlib.decompress(f.read()).decode("utf-8")
+        with self._lock:
+            self._cache[digest] = content
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return content
+
+    def set_refs(self, owner: str, refs: Dict[str, str]) -> None:
+        """Sustituye los blobs de un propietario ({hash: contenido}) y borra los que quedan sin referencias."""
+        self._update(owner, refs, replace=True)
+
+    def add_refs(self, owner: str, refs: Dict[str, str]) -> None:
+        """Añade blobs ({hash: contenido}) a los de un propietario (p. ej. al escribir en su journal)."""
+        self._update(owner, refs, replace=False)
+
+    def release(self, owner: str) -> None:
+        self._update(owner, {}, replace=True)
+
+    def _update(self, owner: str, refs: Dict[str, str], replace: bool) -> None:
+        hashes = set(refs)
+        with self._owner_lock(owner):
+            with self._lock:
+                self._load_refs()
+                previous = self._owners.get(owner, set())
+                current = hashes if replace else previous | hashes
+                if current == previous:
+                    return
+                missing = self._apply_refs(owner, previous, current)
+            # Fuera del lock global: solo se toca el archivo de este propietario
+            try:
+                if replace or not previous:
+                    self._write_owner_refs(owner, current, replace=True)
+                else:
+                    self._write_owner_refs(owner, set(missing), replace=False)
+            except OSError as e:
+                # Las refs en memoria siguen siendo correctas; el chat las vuelve a registrar al cargarse
+                logger.error(f"Error persisting blob refs of {owner}: {str(e)}")
+        # Se escriben después de registrarlos: con la referencia ya contada ningún GC concurrente los borra
+        for digest in missing:
+            if digest in refs:
+                self._ensure_blob(digest, refs[digest])
+
+    def _apply_refs(self, owner: str, previous: Set[str], current: Set[str]) -> List[str]:
+        """Actualiza contadores y recoge basura. Llamar con el lock tomado; devuelve los hashes nuevos."""
+        for digest in current - previous:
+            self._counts[digest] = self._counts.get(digest, 0) + 1
+        garbage = []
+        for digest in previous - current:
+            self._counts[digest] -= 1
+            if self._counts[digest] <= 0:
+                del self._counts[digest]
+                garbage.append(digest)
+        if current:
+            self._owners[owner] = current
+        else:
+            self._owners.pop(owner, None)
+        # El borrado va dentro del lock: quien vuelva a usar el hash lo registra antes de escribirlo
+        for digest in garbage:
+            self._cache.pop(digest, None)
+            try:
+                os.remove(self._blob_path(digest))
+                self.collected += 1
+                os.rmdir(os.path.dirname(self._blob_path(digest)))
+            except OSError:
+                # Ya borrado, o el directorio aún contiene otros blobs
+                pass
+        return list(current - previous)
+
+    def pack(self, data: Dict, field: str, refs: Dict[str, str]) -> Dict:
+        """Copia de `data` con `field` sustituido por `<field>Ref` si el texto es grande.
+
+        El contenido se anota en `refs`; se escribe al registrar las referencias.
+        """
+        value = data.get(field)
+        if not isinstance(value, str) or len(value) < self.min_bytes:
+            return data
+        digest = self.digest(value)
+        refs[digest] = value
+        packed = {key: item for key, item in data.items() if key != field}
+        packed[f"{field}Ref"] = digest
+        return packed
+
+    def unpack(self, data: Dict, field: str, refs: Dict[str, str] | None = None) -> Dict:
+        """Inverso de `pack`: resuelve `<field>Ref` al texto original."""
+        digest = data.get(f"{field}Ref")
+        if digest is None:
+            return data
+        unpacked = {key: item for key, item in data.items() if key != f"{field}Ref"}
+        unpacked[field] = self.get(digest)
+        if refs is not None:
+            refs[digest] = unpacked[field]
+        return unpacked
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._load_refs()
+            return {
+                "blobs": len(self._counts),
+                "owners": len(self._owners),
+                "writes": self.writes,
+                "collected": self.collected
+            }
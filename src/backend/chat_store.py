@@ -0,0 +1,243 @@
+import json
+import os
+import logging
+from typing import Dict, List, Tuple
+from blob_store import BlobStore
+from state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+class ChatStore(StateBackend):
+    """Almacenamiento en disco de los chats: snapshot JSON + journal JSON Lines.
+
+    Cada chat se guarda como `<wallet>/<chat_id>.json` (snapshot completo) y
+    `<wallet>/<chat_id>.jsonl` (operaciones añadidas desde el último snapshot).
+    Cada entrada del journal lleva un `seq` creciente; el snapshot guarda el
+    último `seq` que ya incluye (`journal_seq`), de modo que un fallo entre
+    escribir el snapshot y truncar el journal no duplica operaciones al
+    reproducirlas.
+
+    Con el almacén de blobs activado (CHAT_BLOBS, por defecto sí), los textos
+    grandes de mensajes, archivos virtuales e historial se guardan una sola vez
+    en `.blobs/` y el JSON solo lleva su hash (`textRef` / `contentRef`).
+    La deduplicación solo existe en este backend; `SqliteStateBackend` guarda
+    los textos en línea.
+    """
+
+    def __init__(self, base_path: str = "./chats", blob_store: BlobStore | None = None):
+        self.base_path = base_path
+        self._known_dirs: set[str] = set()
+        self._ensure_dir(self.base_path)
+        if blob_store is None and os.getenv("CHAT_BLOBS", "1") not in ("0", "false", "False"):
+            blob_store = BlobStore(os.path.join(self.base_path, ".blobs"))
+        self.blob_store = blob_store
+
+    def _ensure_dir(self, path: str) -> None:
+        if path in self._known_dirs:
+            return
+        os.makedirs(path, exist_ok=True)
+        self._known_dirs.add(path)
+
+    @staticmethod
+    def _owner(wallet_address: str, chat_id: str) -> str:
+        return f"{wallet_address}/{chat_id}"
+
+    def _pack_entry(self, entry: Dict, refs: Dict[str, str]) -> Dict:
+        if entry.get("op") == "message" and isinstance(entry.get("message"), dict):
+            return dict(entry, message=self.blob_store.pack(entry["message"], "text", refs))
+        if entry.get("op") == "file":
+            return self.blob_store.pack(entry, "content", refs)
+        return entry
+
+    def _unpack_entry(self, entry: Dict, refs: Dict[str, str]) -> Dict:
+        if entry.get("op") == "message" and isinstance(entry.get("message"), dict):
+            return dict(entry, message=self.blob_store.unpack(entry["message"], "text", refs))
+        if entry.get("op") == "file":
+            return self.blob_store.unpack(entry, "content", refs)
+        return entry
+
+    def _convert_snapshot(self, data: Dict, convert, refs: Dict[str, str]) -> Dict:
+        """Aplica pack/unpack a los textos de un snapshot sin mutar el original."""
+        converted = dict(data)
+        converted["messages"] = [convert(message, "text", refs) for message in data.get("messages", [])]
+        converted["virtualFiles"] = {
+            path: convert(file_data, "content", refs)
+            for path, file_data in data.get("virtualFiles", {}).items()
+        }
+        if "fileHistory" in data:
+            # Solo los keyframes llevan contenido completo; los deltas se quedan en línea
+            converted["fileHistory"] = {
+                name: [convert(entry, "content", refs) for entry in entries]
+                for name, entries in data["fileHistory"].items()
+            }
+        return converted
+
+    def _wallet_dir(self, wallet_address: str) -> str:
+        return os.path.join(self.base_path, wallet_address)
+
+    def snapshot_path(self, wallet_address: str, chat_id: str) -> str:
+        return os.path.join(self._wallet_dir(wallet_address), f"{chat_id}.json")
+
+    def journal_path(self, wallet_address: str, chat_id: str) -> str:
+        return os.path.join(self._wallet_dir(wallet_address), f"{chat_id}.jsonl")
+
+    def index_path(self, wallet_address: str) -> str:
+        return os.path.join(self._wallet_dir(wallet_address), "index.json")
+
+    def load_index(self, wallet_address: str) -> Dict | None:
+        """Carga el índice de chats de una wallet ({chat_id: entrada}) o None si no existe o está dañado."""
+        path = self.index_path(wallet_address)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable chat index for {wallet_address}: {str(e)}")
+            return None
+
+    def write_index(self, wallet_address: str, index: Dict) -> None:
+        """Escribe el índice de una wallet de forma atómica."""
+        self._ensure_dir(self._wallet_dir(wallet_address))
+        path = self.index_path(wallet_address)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def file_sizes(self, wallet_address: str, chat_id: str) -> Tuple[int, int]:
+        """Devuelve (bytes del snapshot, bytes del journal) del chat."""
+        sizes = []
+        for path in (self.snapshot_path(wallet_address, chat_id), self.journal_path(wallet_address, chat_id)):
+            sizes.append(os.path.getsize(path) if os.path.exists(path) else 0)
+        return sizes[0], sizes[1]
+
+    def list_wallets(self) -> List[str]:
+        if not os.path.exists(self.base_path):
+            return []
+        return [
+            wallet_dir for wallet_dir in os.listdir(self.base_path)
+            if not wallet_dir.startswith(".") and os.path.isdir(os.path.join(self.base_path, wallet_dir))
+        ]
+
+    def list_chats(self, wallet_address: str) -> List[str]:
+        """Lista los chat_id de una wallet presentes en disco (sin leerlos)."""
+        chat_ids = set()
+        for chat_file in os.listdir(self._wallet_dir(wallet_address)):
+            if chat_file == "index.json":
+                continue
+            if chat_file.endswith(".json"):
+                chat_ids.add(chat_file[:-len(".json")])
+            elif chat_file.endswith(".jsonl"):
+                chat_ids.add(chat_file[:-len(".jsonl")])
+        return list(chat_ids)
+
+    def append(self, wallet_address: str, chat_id: str, entries: List[Dict],
+               expected_version: int | None = None) -> None:
+        """Añade entradas al journal del chat. El coste no depende del tamaño del chat.
+
+        El journal es la única copia durable de los cambios posteriores al
+        snapshot, así que se sincroniza con fsync como el snapshot y el índice.
+        """
+        if not entries:
+            return
+        self._ensure_dir(self._wallet_dir(wallet_address))
+        if self.blob_store is not None:
+            refs: Dict[str, str] = {}
+            entries = [self._pack_entry(entry, refs) for entry in entries]
+            if refs:
+                # Los blobs se escriben antes que las entradas que los referencian
+                self.blob_store.add_refs(self._owner(wallet_address, chat_id), refs)
+        payload = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for entry in entries
+        )
+        with open(self.journal_path(wallet_address, chat_id), 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_snapshot(self, wallet_address: str, chat_id: str, data: Dict, truncate_journal: bool = True,
+                       expected_version: int | None = None) -> None:
+        """Escribe el snapshot de forma atómica y, opcionalmente, vacía el journal."""
+        self._ensure_dir(self._wallet_dir(wallet_address))
+        path = self.snapshot_path(wallet_address, chat_id)
+        refs: Dict[str, str] = {}
+        if self.blob_store is not None:
+            data = self._convert_snapshot(data, self.blob_store.pack, refs)
+            self.blob_store.add_refs(self._owner(wallet_address, chat_id), refs)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if truncate_journal:
+            journal_path = self.journal_path(wallet_address, chat_id)
+            if os.path.exists(journal_path):
+                # El snapshot ya contiene todas las entradas hasta journal_seq
+                open(journal_path, 'w', encoding='utf-8').close()
+            if self.blob_store is not None:
+                # Con el snapshot ya publicado, los blobs que solo usaban versiones anteriores son basura
+                self.blob_store.set_refs(self._owner(wallet_address, chat_id), refs)
+
+    def load(self, wallet_address: str, chat_id: str) -> Tuple[Dict | None, List[Dict]]:
+        """Carga el snapshot y las entradas del journal posteriores a él.
+
+        Una última línea incompleta (escritura interrumpida) se descarta y se
+        trunca del journal para que las siguientes escrituras no queden detrás
+        de basura.
+        """
+        snapshot = None
+        snapshot_path = self.snapshot_path(wallet_address, chat_id)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+
+        entries = []
+        journal_path = self.journal_path(wallet_address, chat_id)
+        if not os.path.exists(journal_path):
+            return self._resolve_blobs(wallet_address, chat_id, snapshot, entries)
+
+        snapshot_seq = snapshot.get("journal_seq", 0) if snapshot else 0
+        good_offset = 0
+        with open(journal_path, 'rb') as f:
+            for raw_line in f:
+                if not raw_line.endswith(b"\n"):
+                    logger.warning(f"Discarding torn journal tail for chat {chat_id}")
+                    break
+                good_offset += len(raw_line)
+                try:
+                    entry = json.loads(raw_line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.warning(f"Skipping corrupt journal entry for chat {chat_id}")
+                    continue
+                if entry.get("seq", 0) > snapshot_seq:
+                    entries.append(entry)
+
+        if good_offset != os.path.getsize(journal_path):
+            with open(journal_path, 'r+b') as f:
+                f.truncate(good_offset)
+
+        return self._resolve_blobs(wallet_address, chat_id, snapshot, entries)
+
+    def _resolve_blobs(self, wallet_address: str, chat_id: str, snapshot: Dict | None,
+                       entries: List[Dict]) -> Tuple[Dict | None, List[Dict]]:
+        """Sustituye las referencias por su contenido y vuelve a registrar las que usa el chat."""
+        if self.blob_store is None:
+            return snapshot, entries
+        refs: Dict[str, str] = {}
+        if snapshot is not None:
+            snapshot = self._convert_snapshot(snapshot, self.blob_store.unpack, refs)
+        entries = [self._unpack_entry(entry, refs) for entry in entries]
+        self.blob_store.set_refs(self._owner(wallet_address, chat_id), refs)
+        return snapshot, entries
+
+    def delete(self, wallet_address: str, chat_id: str) -> None:
+        for path in (self.snapshot_path(wallet_address, chat_id), self.journal_path(wallet_address, chat_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        if self.blob_store is not None:
+            self.blob_store.release(self._owner(wallet_address, chat_id))
@@ -1,9 +1,17 @@
 from fastapi import WebSocket
-from typing import Dict
+from typing import Awaitable, Callable, Dict, List
+import asyncio
 import logging
+import os
 from agent import Agent
+from llm_client import close_anthropic_client, get_upstream_limiter
 from file_manager import FileManager
 from session_manager import ChatManager
+from conversation_history import HistoryStore
+from outbound_queue import OutboundQueue, aggregate_stats
+from serialization import get_codec
+from response_cache import create_response_cache
+from metrics import gauge, register_stats
 
 logger = logging.getLogger(__name__)
 
@@ -13,27 +21,147 @@ class ConnectionManager:
         self.agents: Dict[str, Agent] = {}
         self.file_manager = FileManager()
         self.chat_manager = ChatManager()
+        # Historiales del modelo compartidos entre conexiones (sobreviven a las reconexiones)
+        self.history_store = HistoryStore(self.chat_manager)
+        # Respuestas del LLM reutilizables entre conexiones (opt-in con RESPONSE_CACHE_ENABLED)
+        self.response_cache = create_response_cache()
+        # Generaciones del LLM en curso: wallet_address -> {chat_id -> Task}
+        self.generations: Dict[str, Dict[str, asyncio.Task]] = {}
+        self.max_generations_per_wallet = int(os.getenv("MAX_GENERATIONS_PER_WALLET", "2"))
+        # Cola de salida por conexión: los envíos no esperan al cliente
+        self.outbound: Dict[str, OutboundQueue] = {}
+        self._register_metrics()
 
-    async def connect(self, websocket: WebSocket, wallet_address: str):
+    def _register_metrics(self):
+        """Gauges leídos al exportar /metrics a partir del estado y los stats() existentes."""
+        gauge("zephyrus_active_connections", "Open websocket connections",
+              callback=lambda: len(self.active_connections))
+        gauge("zephyrus_active_generations", "LLM generations in progress",
+              callback=lambda: sum(len(tasks) for tasks in self.generations.values()))
+        gauge("zephyrus_chats_in_memory", "Chats loaded in memory",
+              callback=lambda: self.chat_manager.loaded_chat_count)
+        gauge("zephyrus_conversation_histories", "Model histories held in memory",
+              callback=lambda: len(self.history_store))
+        gauge("zephyrus_cached_bytes", "Bytes held by in-memory caches", ("cache",),
+              callback=lambda: {("file_cache",): self.file_manager.file_cache.total_bytes})
+        register_stats("zephyrus_outbound", "Outbound websocket queues", self.outbound_stats)
+        register_stats("zephyrus_llm_limiter", "Upstream LLM concurrency limiter", lambda: get_upstream_limiter().stats())
+        register_stats("zephyrus_history_store", "Model history cache", self.history_store.stats)
+        register_stats("zephyrus_file_cache", "File content cache", self.file_manager.file_cache.stats)
+        register_stats("zephyrus_line_index", "Line offset index cache", self.file_manager.line_index.stats)
+        register_stats("zephyrus_file_tree", "Directory listing index", self.file_manager.tree_index.stats)
+        blob_store = getattr(self.chat_manager.store, "blob_store", None)
+        if blob_store is not None:
+            register_stats("zephyrus_blob_store", "Chat text blob store", blob_store.stats)
+        if self.response_cache is not None:
+            register_stats("zephyrus_response_cache", "Cached LLM responses", self.response_cache.stats)
+
+    async def startup(self):
+        """Arranca los servicios en segundo plano al iniciar la aplicación."""
+        await self.chat_manager.start_background_writer()
+        # Los cambios del watcher se aplican en el loop, no en el hilo del observer
+        self.file_manager.bind_loop(asyncio.get_running_loop())
+
+    async def shutdown(self):
+        """Detiene los servicios en segundo plano persistiendo lo pendiente."""
+        await self.chat_manager.stop_background_writer()
+        self.chat_manager.close()
+        await close_anthropic_client()
+        self.file_manager.close()
+
+    async def connect(self, websocket: WebSocket, wallet_address: str, contexts_mode: str = "full", encoding: str = "json"):
         await websocket.accept()
+        previous = self.outbound.pop(wallet_address, None)
+        if previous is not None:
+            previous.stop()
+        previous_socket = self.active_connections.get(wallet_address)
         self.active_connections[wallet_address] = websocket
-        self.agents[wallet_address] = Agent(self.file_manager, self.chat_manager)
+        if previous_socket is not None and previous_socket is not websocket:
+            # Cerrar el socket sustituido termina su bucle de recepción; su disconnect ya no afecta a este
+            try:
+                await asyncio.wait_for(previous_socket.close(code=4000, reason="Replaced by a new connection"), timeout=5)
+            except Exception as e:
+                logger.info(f"Could not close replaced connection of {wallet_address}: {str(e)}")
+        codec = get_codec(encoding)
+        queue = OutboundQueue(websocket, wallet_address, codec=codec)
+        queue.start()
+        self.outbound[wallet_address] = queue
+        self.agents[wallet_address] = Agent(
+            self.file_manager,
+            self.chat_manager,
+            wallet_address=wallet_address,
+            history_store=self.history_store,
+            response_cache=self.response_cache
+        )
         
-        # Load existing chats for the wallet
-        chats = self.chat_manager.get_user_chats(wallet_address)
-        await websocket.send_json({
-            "type": "contexts_loaded",
-            "content": chats
-        })
-        logger.info(f"Wallet {wallet_address} connected")
-
-    def disconnect(self, wallet_address: str):
+        # Load existing chats for the wallet ("summary": sin mensajes ni archivos,
+        # que el cliente pide después con get_messages / get_file)
+        if contexts_mode != "summary":
+            await self.chat_manager.preload_chats(wallet_address)
+        chats = self.chat_manager.get_user_chats(wallet_address, summary=contexts_mode == "summary")
+        await self.send_message(
+            {
+                "type": "contexts_loaded",
+                "content": chats,
+                "metadata": {"encoding": codec.name}
+            },
+            wallet_address
+        )
+        logger.info(f"Wallet {wallet_address} connected ({codec.name})")
+        return codec
+
+    def start_generation(self, wallet_address: str, chat_id: str, run: Callable[[], Awaitable]) -> str | None:
+        """Lanza una generación como tarea. Devuelve un mensaje de error si no se puede iniciar."""
+        wallet_generations = self.generations.setdefault(wallet_address, {})
+        if chat_id in wallet_generations:
+            return f"A response is already being generated for chat {chat_id}"
+        if len(wallet_generations) >= self.max_generations_per_wallet:
+            return f"Too many concurrent generations (max {self.max_generations_per_wallet})"
+
+        task = asyncio.create_task(run())
+        wallet_generations[chat_id] = task
+
+        def _on_done(finished: asyncio.Task):
+            if wallet_generations.get(chat_id) is finished:
+                del wallet_generations[chat_id]
+
+        task.add_done_callback(_on_done)
+        return None
+
+    def cancel_generations(self, wallet_address: str, chat_id: str | None = None) -> List[str]:
+        """Cancela la generación de un chat (o todas las de la wallet si no hay chat_id)."""
+        wallet_generations = self.generations.get(wallet_address, {})
+        chat_ids = [chat_id] if chat_id else list(wallet_generations)
+        cancelled = []
+        for cid in chat_ids:
+            task = wallet_generations.get(cid)
+            if task and not task.done():
+                task.cancel()
+                cancelled.append(cid)
+        return cancelled
+
+    def disconnect(self, wallet_address: str, websocket: WebSocket | None = None):
+        """Libera la conexión de la wallet. Con `websocket`, solo si sigue siendo la registrada:
+        un socket antiguo que se cierra tras una reconexión no desmonta la conexión nueva."""
+        if websocket is not None and self.active_connections.get(wallet_address) is not websocket:
+            logger.info(f"Stale connection of wallet {wallet_address} closed")
+            return
+        self.cancel_generations(wallet_address)
         if wallet_address in self.active_connections:
             del self.active_connections[wallet_address]
         if wallet_address in self.agents:
             del self.agents[wallet_address]
+        queue = self.outbound.pop(wallet_address, None)
+        if queue is not None:
+            queue.stop()
         logger.info(f"Wallet {wallet_address} disconnected")
 
-    async def send_message(self, message: str, wallet_address: str):
-        if wallet_address in self.active_connections:
-            await self.active_connections[wallet_address].send_text(message) 
\ No newline at end of file
+    async def send_message(self, message: Dict | str, wallet_address: str):
+        """Encola un mensaje (dict o JSON ya serializado) para la wallet sin esperar al envío."""
+        queue = self.outbound.get(wallet_address)
+        if queue is not None:
+            queue.put(message)
+
+    def outbound_stats(self) -> Dict:
+        """Profundidad de las colas de salida y latencia de envío."""
+        return aggregate_stats(list(self.outbound.values())) 
\ No newline at end of file
@@ -0,0 +1,228 @@
+import os
+import time
+import weakref
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Marca de caché de prompts del proveedor (prefijo estable reutilizable entre turnos)
+CACHE_CONTROL = {"type": "ephemeral"}
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+def estimate_tokens(content) -> int:
+    """Estimación barata de tokens (~4 caracteres por token) sin tokenizador."""
+    if isinstance(content, str):
+        return len(content) // 4 + 1
+    # Lista de bloques de contenido
+    return sum(len(block.get("text", "")) // 4 + 1 for block in content)
+
+class HistoryManager:
+    """Prepara el historial de una conversación para el LLM.
+
+    Mantiene el historial dentro de un presupuesto de tokens recortando los
+    turnos más antiguos, y marca el system prompt y el prefijo estable del
+    historial para la caché de prompts del proveedor.
+    """
+
+    def __init__(self, token_budget: int | None = None, trim_ratio: float = 0.75, prompt_caching: bool | None = None):
+        self.token_budget = token_budget or int(os.getenv("HISTORY_TOKEN_BUDGET", "50000"))
+        # Al recortar se baja hasta trim_ratio * presupuesto para que el prefijo
+        # cacheado se mantenga estable durante varios turnos
+        self.trim_ratio = trim_ratio
+        if prompt_caching is None:
+            prompt_caching = os.getenv("ANTHROPIC_PROMPT_CACHING", "1") not in ("0", "false", "False")
+        self.prompt_caching = prompt_caching
+
+    def history_tokens(self, history: List[Dict]) -> int:
+        return sum(estimate_tokens(message["content"]) for message in history)
+
+    def trim(self, history: List[Dict]) -> int:
+        """Recorta en sitio los turnos más antiguos si se supera el presupuesto.
+
+        Devuelve el número de mensajes eliminados. El último mensaje nunca se
+        elimina y el historial resultante siempre empieza por un turno de usuario.
+        """
+        tokens = self.history_tokens(history)
+        if tokens <= self.token_budget:
+            return 0
+
+        target = int(self.token_budget * self.trim_ratio)
+        dropped = 0
+        while len(history) > 1 and (tokens > target or history[0]["role"] != "user"):
+            tokens -= estimate_tokens(history.pop(0)["content"])
+            dropped += 1
+
+        if dropped:
+            note = f"[{dropped} earlier messages of this conversation were omitted to fit the context budget]"
+            first = history[0]
+            if isinstance(first["content"], str):
+                history[0] = {"role": first["role"], "content": f"{note}\n\n{first['content']}"}
+            logger.info(f"Trimmed {dropped} messages from conversation history ({tokens} tokens left)")
+        return dropped
+
+    def build_request(self, system_prompt: str, history: List[Dict]) -> Tuple[object, List[Dict], Dict]:
+        """Devuelve (system, messages, extra_headers) para messages.create.
+
+        Con la caché activada, el system prompt y el último mensaje anterior al
+        turno actual llevan cache_control, de modo que el proveedor reutiliza
+        todo el prefijo y solo procesa el turno nuevo.
+        """
+        if not self.prompt_caching:
+            return system_prompt, list(history), {}
+
+        system = [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+        messages = list(history)
+        if len(messages) >= 2:
+            prefix_end = messages[-2]
+            content = prefix_end["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            else:
+                content = [dict(block) for block in content]
+            content[-1]["cache_control"] = CACHE_CONTROL
+            messages[-2] = {"role": prefix_end["role"], "content": content}
+        return system, messages, {"anthropic-beta": PROMPT_CACHING_BETA}
+
+def new_turn_stats(history: List[Dict], history_manager: HistoryManager, trimmed: int) -> Dict:
+    """Contadores de un turno; los de tokens se completan con el uso que informa la API."""
+    return {
+        "input_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "cache_creation_input_tokens": 0,
+        "output_tokens": 0,
+        "history_messages": len(history),
+        "history_tokens_estimate": history_manager.history_tokens(history),
+        "trimmed_messages": trimmed
+    }
+
+def record_usage(stats: Dict, usage) -> None:
+    """Acumula en `stats` los campos de uso de un evento de streaming."""
+    if usage is None:
+        return
+    for field in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "output_tokens"):
+        value = getattr(usage, field, None)
+        if value:
+            stats[field] = value
+
+# Texto de estado que el agente envía antes de cada respuesta; no forma parte de la conversación
+STATUS_MESSAGES = {"Analyzing your request...", "Ready to help you with your smart contract development."}
+
+def history_from_chat_messages(messages: List[Dict]) -> List[Dict]:
+    """Reconstruye el historial del modelo a partir de los mensajes persistidos de un chat.
+
+    Las respuestas del agente se guardan fragmentadas (una por acción), así que
+    los mensajes consecutivos del mismo rol se unen en un solo turno. Un turno
+    final del usuario sin respuesta se descarta: es el mensaje que se está
+    procesando y el llamador lo añade.
+    """
+    history = []
+    for message in messages:
+        text = message.get("text")
+        if not isinstance(text, str) or not text:
+            continue
+        if message.get("sender") == "user":
+            role = "user"
+        else:
+            if message.get("type") in ("error", "file_delete") or text in STATUS_MESSAGES:
+                continue
+            role = "assistant"
+            if message.get("type") in ("file_create", "code_edit"):
+                text = f"```solidity\n{text}\n```"
+        if history and history[-1]["role"] == role:
+            history[-1]["content"] += "\n" + text
+        else:
+            history.append({"role": role, "content": text})
+
+    while history and history[0]["role"] != "user":
+        history.pop(0)
+    if history and history[-1]["role"] == "user":
+        history.pop()
+    return history
+
+class HistoryStore:
+    """Historiales del modelo compartidos por todas las conexiones, acotados por LRU y TTL.
+
+    En un fallo de caché el historial se reconstruye desde los mensajes del
+    chat persistido, así que reconectar no pierde la conversación y la memoria
+    no crece con el número de chats abiertos alguna vez.
+    """
+
+    def __init__(self, chat_manager=None, max_entries: int | None = None, ttl_seconds: float | None = None):
+        self.chat_manager = chat_manager
+        self.max_entries = max_entries or int(os.getenv("HISTORY_CACHE_SIZE", "512"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("HISTORY_TTL_SECONDS", "3600"))
+        # (wallet_address, context_id) -> {"history", "turn_stats", "last_used"}
+        self._entries: OrderedDict[Tuple[str, str], Dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _entry(self, wallet_address: str, context_id: str) -> Dict:
+        key = (wallet_address, context_id)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry["last_used"] <= self.ttl_seconds and not self._changed_elsewhere(entry, key):
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            chat = self._get_chat(wallet_address, context_id)
+            entry = {
+                "history": history_from_chat_messages(chat.messages) if chat else [],
+                "turn_stats": {},
+                # Referencia débil: no debe retener el chat si ChatManager lo descarga
+                "chat": weakref.ref(chat) if chat else None
+            }
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+        entry["last_used"] = now
+        self._evict(now)
+        return entry
+
+    def get(self, wallet_address: str, context_id: str) -> List[Dict]:
+        """Devuelve el historial (mutable) de un contexto, reconstruyéndolo si no está en memoria."""
+        return self._entry(wallet_address, context_id)["history"]
+
+    def set_turn_stats(self, wallet_address: str, context_id: str, stats: Dict) -> None:
+        self._entry(wallet_address, context_id)["turn_stats"] = stats
+
+    def get_turn_stats(self, wallet_address: str, context_id: str) -> Dict:
+        entry = self._entries.get((wallet_address, context_id))
+        return entry["turn_stats"] if entry else {}
+
+    def discard(self, wallet_address: str, context_id: str) -> None:
+        self._entries.pop((wallet_address, context_id), None)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def _get_chat(self, wallet_address: str, context_id: str):
+        if self.chat_manager is None:
+            return None
+        return self.chat_manager.get_chat(wallet_address, context_id)
+
+    def _changed_elsewhere(self, entry: Dict, key: Tuple[str, str]) -> bool:
+        """Con un backend compartido, el chat pudo recargarse porque otro worker lo modificó."""
+        if self.chat_manager is None or not self.chat_manager.store.shared:
+            return False
+        chat = entry["chat"]() if entry["chat"] else None
+        return self._get_chat(*key) is not chat
+
+    def _evict(self, now: float) -> None:
+        # El último (recién usado) nunca se expulsa
+        while len(self._entries) > 1:
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - entry["last_used"] <= self.ttl_seconds:
+                break
+            del self._entries[key]
+            self.evictions += 1
@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+class FileCache:
+    """Caché LRU de contenidos de archivos acotada por bytes.
+
+    Los archivos mayores que `max_file_bytes` no se cachean. Es segura entre
+    hilos porque el watcher del sistema de archivos la invalida desde su propio hilo.
+    """
+
+    def __init__(self, max_bytes: int | None = None, max_file_bytes: int | None = None):
+        self.max_bytes = max_bytes or int(os.getenv("FILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.max_file_bytes = max_file_bytes or int(os.getenv("FILE_CACHE_MAX_FILE_BYTES", str(1024 * 1024)))
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size_of(content: str) -> int:
+        # Memoria real del str en O(1), sin codificarlo
+        return sys.getsizeof(content)
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return path in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, path: str) -> str | None:
+        with self._lock:
+            content = self._entries.get(path)
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(path)
+            return content
+
+    def put(self, path: str, content: str) -> bool:
+        """Cachea un contenido. Devuelve False si es demasiado grande para cachearlo."""
+        size = self._size_of(content)
+        with self._lock:
+            self._remove(path)
+            if size > self.max_file_bytes or size > self.max_bytes:
+                return False
+            self._entries[path] = content
+            self._sizes[path] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._remove(path)
+
+    def invalidate_prefix(self, directory: str) -> None:
+        """Invalida todos los archivos bajo un directorio (borrado o movido)."""
+        prefix = directory.rstrip("/") + "/"
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                self._remove(path)
+
+    def move(self, source: str, target: str) -> None:
+        with self._lock:
+            content = self._entries.get(source)
+            self._remove(source)
+            self._remove(target)
+        if content is not None:
+            self.put(target, content)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def _remove(self, path: str) -> None:
+        if path in self._entries:
+            del self._entries[path]
+            self.total_bytes -= self._sizes.pop(path)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_file_bytes": self.max_file_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -1,168 +1,380 @@
 import os
 import json
+import fnmatch
 import aiofiles
+import uuid
+import shutil
 import logging
-from typing import Dict, List, Optional
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from typing import AsyncGenerator, Callable, Dict, List, Optional
 import asyncio
 import typing
+from solc_compiler import SolcCompiler
+from file_cache import FileCache
+from metrics import timed
+from fs_watcher import Changes, FileSystemWatcher
+from file_tree import FileTreeIndex
+from line_index import LineIndexCache
 
 logger = logging.getLogger(__name__)
 
-class FileSystemWatcher(FileSystemEventHandler):
-    def __init__(self, callback):
-        self.callback = callback
+def _fsync_directory(directory: str) -> None:
+    # Persiste las entradas del directorio tras os.replace (no disponible en Windows)
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
-    def on_modified(self, event):
-        if not event.is_directory:
-            self.callback(event.src_path)
+def commit_files(files: Dict[str, str]) -> None:
+    """Escribe varios archivos (ruta absoluta -> contenido) de forma transaccional.
+
+    Cada contenido se escribe y sincroniza en un temporal junto a su destino;
+    después se sustituyen los destinos con os.replace. Si alguna sustitución
+    falla, los destinos ya sustituidos se restauran desde copias de seguridad
+    (enlaces duros), así que se publican todos los cambios o ninguno.
+    Bloqueante: ejecutar en un hilo.
+    """
+    token = uuid.uuid4().hex[:8]
+    staged: List[tuple] = []  # (destino, temporal, copia de seguridad o None)
+    replaced: List[tuple] = []
+    try:
+        for full_path, content in files.items():
+            directory, name = os.path.split(full_path)
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = os.path.join(directory, f".{name}.{token}.tmp")
+            staged.append((full_path, tmp_path, None))
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(full_path):
+                backup_path = os.path.join(directory, f".{name}.{token}.bak.tmp")
+                try:
+                    os.link(full_path, backup_path)
+                except OSError:
+                    shutil.copy2(full_path, backup_path)
+                staged[-1] = (full_path, tmp_path, backup_path)
+
+        for entry in staged:
+            full_path, tmp_path, _ = entry
+            os.replace(tmp_path, full_path)
+            replaced.append(entry)
+
+        for directory in {os.path.dirname(full_path) for full_path, _, _ in staged}:
+            _fsync_directory(directory)
+    except BaseException:
+        for full_path, _, backup_path in reversed(replaced):
+            try:
+                if backup_path:
+                    os.replace(backup_path, full_path)
+                else:
+                    os.remove(full_path)
+            except OSError as e:
+                logger.error(f"Error rolling back {full_path}: {str(e)}")
+        raise
+    finally:
+        for _, tmp_path, backup_path in staged:
+            for leftover in (tmp_path, backup_path):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
 
 class FileManager:
-    def __init__(self, base_path: str = "../"):
+    def __init__(self, base_path: str = "../", watch_roots: List[str] | None = None, watch_ignore: List[str] | None = None):
         self.base_path = os.path.abspath(base_path)
-        self.file_cache: dict[str, str] = {}
-        self.observers: list[Observer] = [] # type: ignore
-        self._setup_watcher()
-
-    def _setup_watcher(self):
-        observer = Observer()
-        event_handler = FileSystemWatcher(self._on_file_changed)
-        observer.schedule(event_handler, self.base_path, recursive=True)
-        observer.start()
-        self.observers.append(observer)
-
-    def _on_file_changed(self, file_path: str):
-        relative_path = os.path.relpath(file_path, self.base_path)
-        if relative_path in self.file_cache:
-            del self.file_cache[relative_path]
+        self.file_cache = FileCache()
+        self.line_index = LineIndexCache()
+        self.compiler = SolcCompiler(base_path=self.base_path)
+        # Consumidores de los cambios agrupados del watcher (índices, etc.)
+        self.change_listeners: List[Callable[[Changes], None]] = []
+        # Serializa las transacciones de escritura
+        self._write_lock = asyncio.Lock()
+        self.watcher: FileSystemWatcher | None = None
+        self._setup_watcher(watch_roots, watch_ignore)
+        self.tree_index = FileTreeIndex(self.base_path, self._is_watched)
+        self.change_listeners.append(self.tree_index.apply_changes)
+
+    def _setup_watcher(self, roots: List[str] | None, ignore: List[str] | None):
+        self.watcher = FileSystemWatcher(self.base_path, self._on_files_changed, roots=roots, ignore=ignore)
+        self.watcher.start()
+
+    def _is_watched(self, relative_path: str) -> bool:
+        return self.watcher is not None and self.watcher.covers(relative_path)
+
+    def _relative(self, path: str) -> str:
+        relative_path = os.path.relpath(os.path.join(self.base_path, path), self.base_path).replace("\\", "/")
+        return "" if relative_path == "." else relative_path
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Entrega los cambios del watcher en el event loop indicado."""
+        if self.watcher is not None:
+            self.watcher.bind_loop(loop)
+
+    def _on_files_changed(self, changes: Changes):
+        for relative_path, (kind, is_directory) in changes.items():
+            if is_directory:
+                if kind == "deleted":
+                    self.file_cache.invalidate_prefix(relative_path)
+                    self.line_index.invalidate_prefix(relative_path)
+            else:
+                self.file_cache.invalidate(relative_path)
+                self.line_index.invalidate(relative_path)
+        for listener in self.change_listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Error in file change listener: {str(e)}")
 
     async def read_file(self, path: str) -> str:
         """Lee el contenido de un archivo."""
         full_path = os.path.join(self.base_path, path)
         try:
-            if path in self.file_cache:
-                return self.file_cache[path]
+            content = self.file_cache.get(path)
+            if content is not None:
+                return content
 
             async with aiofiles.open(full_path, mode='r', encoding='utf-8') as file:
                 content = await file.read()
-                self.file_cache[path] = content
+                # Los archivos mayores que max_file_bytes no se guardan en la caché
+                self.file_cache.put(path, content)
                 return content
         except Exception as e:
             logger.error(f"Error reading file {path}: {str(e)}")
             raise
 
-    async def write_file(self, path: str, content: str) -> None:
-        """Escribe contenido en un archivo."""
+    async def stream_file(self, path: str, chunk_size: int = 64 * 1024) -> AsyncGenerator[str, None]:
+        """Lee un archivo por fragmentos sin cargarlo entero en memoria ni en la caché."""
         full_path = os.path.join(self.base_path, path)
+        content = self.file_cache.get(path)
+        if content is not None:
+            for start in range(0, len(content), chunk_size):
+                yield content[start:start + chunk_size]
+            return
         try:
-            # Asegurarse de que el directorio existe
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
-            async with aiofiles.open(full_path, mode='w', encoding='utf-8') as file:
-                await file.write(content)
-                self.file_cache[path] = content
+            async with aiofiles.open(full_path, mode='r', encoding='utf-8') as file:
+                while True:
+                    chunk = await file.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
         except Exception as e:
-            logger.error(f"Error writing file {path}: {str(e)}")
+            logger.error(f"Error streaming file {path}: {str(e)}")
             raise
 
+    async def write_file(self, path: str, content: str) -> None:
+        """Escribe contenido en un archivo de forma atómica."""
+        await self.write_files({path: content})
+
+    async def write_files(self, files: Dict[str, str]) -> None:
+        """Escribe varios archivos en una sola transacción: se publican todos o ninguno.
+
+        La caché y el índice del árbol solo se actualizan tras confirmar la escritura.
+        """
+        if not files:
+            return
+        full_paths = {os.path.join(self.base_path, path): content for path, content in files.items()}
+        try:
+            async with self._write_lock:
+                await asyncio.to_thread(commit_files, full_paths)
+        except Exception as e:
+            logger.error(f"Error writing files {', '.join(files)}: {str(e)}")
+            raise
+
+        for path, content in files.items():
+            self.file_cache.put(path, content)
+            self.line_index.invalidate(self._relative(path))
+        self.tree_index.apply_changes({self._relative(path): ("created", False) for path in files})
+
     async def delete_file(self, path: str) -> None:
         """Elimina un archivo."""
         full_path = os.path.join(self.base_path, path)
         try:
-            os.remove(full_path)
-            if path in self.file_cache:
-                del self.file_cache[path]
+            await asyncio.to_thread(os.remove, full_path)
+            self.file_cache.invalidate(path)
+            self.line_index.invalidate(self._relative(path))
+            self.tree_index.apply_changes({self._relative(path): ("deleted", False)})
         except Exception as e:
             logger.error(f"Error deleting file {path}: {str(e)}")
             raise
 
-    async def list_files(self, directory: str = "") -> List[Dict[str, str]]:
-        """Lista todos los archivos en un directorio."""
-        full_path = os.path.join(self.base_path, directory)
-        try:
-            files = []
-            for root, dirs, filenames in os.walk(full_path):
-                rel_root = os.path.relpath(root, self.base_path)
-                for dir_name in dirs:
-                    files.append({
-                        "name": dir_name,
-                        "path": os.path.join(rel_root, dir_name).replace("\\", "/"),
-                        "type": "directory"
-                    })
-                for filename in filenames:
-                    files.append({
-                        "name": filename,
-                        "path": os.path.join(rel_root, filename).replace("\\", "/"),
-                        "type": "file"
-                    })
-            return files
-        except Exception as e:
-            logger.error(f"Error listing files in {directory}: {str(e)}")
-            raise
+    async def iter_files(
+        self,
+        directory: str = "",
+        batch_size: int = 256,
+        max_depth: int | None = None,
+        ignore: List[str] | None = None
+    ) -> AsyncGenerator[List[Dict[str, str]], None]:
+        """Recorre un directorio y entrega sus entradas por lotes.
+
+        Los directorios ya indexados se sirven desde memoria; el resto se lee
+        con `os.scandir` en un hilo. `max_depth=1` lista solo el contenido
+        directo de `directory`. Por defecto se lista todo, como antes;
+        `ignore=self.watcher.ignore` omite lo mismo que el watcher
+        (node_modules, .git, ...).
+
+        Las rutas conservan el formato de os.walk + relpath que usa el árbol de
+        archivos del cliente: las entradas de la raíz llevan el prefijo "./".
+        """
+        ignore = ignore or []
+        root = self._relative(directory)
+
+        batch: List[Dict[str, str]] = []
+        # Recorrido en preorden, como os.walk: primero directorios y luego archivos de cada nivel
+        stack = [(root, 1)]
+        while stack:
+            current, depth = stack.pop()
+            entries = self.tree_index.get(current)
+            if entries is None:
+                try:
+                    entries = await asyncio.to_thread(self.tree_index.scan, current)
+                except OSError as e:
+                    if current == root:
+                        logger.error(f"Error listing files in {directory}: {str(e)}")
+                        raise
+                    continue
+
+            entries = sorted(
+                (entry for entry in entries if not any(fnmatch.fnmatch(entry[0], pattern) for pattern in ignore)),
+                key=lambda entry: (not entry[1], entry[0])
+            )
+            subdirs = []
+            for name, is_directory in entries:
+                path = f"{current}/{name}" if current else name
+                batch.append({
+                    "name": name,
+                    "path": path if current else f"./{name}",
+                    "type": "directory" if is_directory else "file"
+                })
+                if is_directory:
+                    subdirs.append(path)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if max_depth is None or depth < max_depth:
+                stack.extend((path, depth + 1) for path in reversed(subdirs))
+        if batch:
+            yield batch
+
+    async def list_files(self, directory: str = "", max_depth: int | None = None, ignore: List[str] | None = None) -> List[Dict[str, str]]:
+        """Lista todos los archivos en un directorio (sin omitir nada salvo que se pase `ignore`)."""
+        files = []
+        async for batch in self.iter_files(directory, max_depth=max_depth, ignore=ignore):
+            files.extend(batch)
+        return files
 
     async def move_file(self, source: str, target: str) -> None:
         """Mueve un archivo de una ubicación a otra."""
         source_path = os.path.join(self.base_path, source)
         target_path = os.path.join(self.base_path, target)
         try:
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-            os.rename(source_path, target_path)
-            if source in self.file_cache:
-                self.file_cache[target] = self.file_cache[source]
-                del self.file_cache[source]
+            await asyncio.to_thread(os.makedirs, os.path.dirname(target_path), exist_ok=True)
+            await asyncio.to_thread(os.rename, source_path, target_path)
+            self.file_cache.move(source, target)
+            self.line_index.invalidate(self._relative(source))
+            self.line_index.invalidate(self._relative(target))
+            self.tree_index.apply_changes({
+                self._relative(source): ("deleted", False),
+                self._relative(target): ("created", False)
+            })
         except Exception as e:
             logger.error(f"Error moving file from {source} to {target}: {str(e)}")
             raise
 
+    def close(self):
+        """Detiene el watcher y libera el pool de procesos del compilador."""
+        self.compiler.shutdown()
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
     def __del__(self):
         """Limpieza al destruir la instancia."""
-        for observer in self.observers:
-            observer.stop()
-        for observer in self.observers:
-            observer.join()
+        if getattr(self, "watcher", None) is not None:
+            self.watcher.stop()
 
     async def get_file_content(self, path: str, start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
         """Obtiene el contenido de un archivo, opcionalmente solo un rango de líneas."""
-        content = await self.read_file(path)
         if start_line is None or end_line is None:
-            return content
-            
-        lines = content.splitlines()
-        if start_line < 1:
-            start_line = 1
-        if end_line > len(lines):
-            end_line = len(lines)
-            
-        return '\n'.join(lines[start_line - 1:end_line])
+            return await self.read_file(path)
+        return (await self.get_file_ranges(path, [(start_line, end_line)]))[0]
+
+    async def get_file_ranges(self, path: str, ranges: List[typing.Tuple[int, int]]) -> List[str]:
+        """Obtiene varios rangos de líneas (1-indexados, inclusivos) de un archivo en una sola llamada.
+
+        Usa el índice de líneas del archivo, así que cada rango cuesta lo que
+        ocupa y no lo que ocupa el archivo entero.
+        """
+        full_path = os.path.join(self.base_path, path)
+        try:
+            results = await asyncio.to_thread(self.line_index.read_ranges, self._relative(path), full_path, ranges)
+        except Exception as e:
+            logger.error(f"Error reading line ranges of {path}: {str(e)}")
+            raise
+        if results is not None:
+            return results
+
+        # Separadores de línea poco comunes: se recorre el archivo por fragmentos
+        return await self._stream_ranges(path, ranges)
+
+    async def _stream_ranges(self, path: str, ranges: List[typing.Tuple[int, int]]) -> List[str]:
+        """Rangos de líneas con la semántica de `str.splitlines`, leyendo el archivo por fragmentos.
+
+        Solo se guardan las líneas que caen en algún rango (un `end_line`
+        negativo, contado desde el final, obliga a guardar hasta el final).
+        """
+        def wanted(number: int) -> bool:
+            return any(start <= number and (end < 0 or number <= end) for start, end in ranges)
+
+        kept: Dict[int, str] = {}
+        count = 0
+        pending = ""
+        async for chunk in self.stream_file(path):
+            pieces = (pending + chunk).splitlines(keepends=True)
+            # La última pieza puede ser una línea a medias
+            pending = pieces.pop() if pieces else ""
+            for piece in pieces:
+                count += 1
+                if wanted(count):
+                    kept[count] = piece.splitlines()[0]
+        if pending:
+            count += 1
+            if wanted(count):
+                kept[count] = pending.splitlines()[0]
+
+        results = []
+        for start_line, end_line in ranges:
+            first = max(start_line, 1)
+            stop = min(end_line, count)
+            if stop < 0:
+                stop = max(count + stop, 0)
+            results.append('\n'.join(kept[number] for number in range(first, stop + 1)))
+        return results
 
     async def compile_solidity(self, file_path: str) -> Dict:
         """Compila un contrato Solidity y retorna los errores si los hay."""
-        # Esta es una implementación simulada. En un entorno real,
-        # necesitarías integrar con solc o usar una biblioteca como py-solc-x
         try:
             content = await self.read_file(file_path)
-            # Aquí iría la lógica real de compilación
-            # Por ahora, solo verificamos algunas reglas básicas
-            errors = []
-            lines = content.splitlines()
-            
-            for i, line in enumerate(lines, 1):
-                if "pragma solidity" not in content:
-                    errors.append({
-                        "line": 1,
-                        "message": "Missing pragma solidity directive"
-                    })
-                if "contract" not in content:
-                    errors.append({
-                        "line": 1,
-                        "message": "No contract definition found"
-                    })
-                    
+            return await self.compile_source(content, file_path)
+        except Exception as e:
+            logger.error(f"Error compiling {file_path}: {str(e)}")
             return {
-                "success": len(errors) == 0,
-                "errors": errors
+                "success": False,
+                "errors": [{
+                    "line": 1,
+                    "message": f"Compilation error: {str(e)}"
+                }]
             }
+
+    @timed("compile")
+    async def compile_source(self, content: str, file_path: str = "Contract.sol") -> Dict:
+        """Compila código Solidity en memoria (sin escribirlo a disco).
+
+        Usa el `solc` local en un pool de procesos con caché por contenido; si
+        no hay solc instalado, solo se hacen comprobaciones básicas.
+        """
+        try:
+            return await self.compiler.compile(content, file_path.replace("\\", "/"))
         except Exception as e:
             logger.error(f"Error compiling {file_path}: {str(e)}")
             return {
@@ -171,4 +383,4 @@ class FileManager:
                     "line": 1,
                     "message": f"Compilation error: {str(e)}"
                 }]
-            } 
\ No newline at end of file
+            }
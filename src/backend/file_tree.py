@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+from fs_watcher import Changes
+
+class FileTreeIndex:
+    """Índice en memoria del árbol de directorios, mantenido por el watcher.
+
+    Cada directorio se lee de disco (con `os.scandir`) la primera vez que se
+    lista y a partir de ahí sus entradas se actualizan con los cambios del
+    watcher, así que los listados repetidos no tocan el disco. Solo se indexan
+    los directorios que el watcher vigila (`is_tracked`); el resto se lee
+    siempre de disco.
+    """
+
+    def __init__(self, base_path: str, is_tracked: Callable[[str], bool] | None = None, max_dirs: int | None = None):
+        self.base_path = os.path.abspath(base_path)
+        self.is_tracked = is_tracked or (lambda relative_path: False)
+        self.max_dirs = max_dirs or int(os.getenv("FILE_TREE_MAX_DIRS", "20000"))
+        # directorio relativo ("" es la raíz) -> {nombre: es_directorio}
+        self._dirs: OrderedDict[str, Dict[str, bool]] = OrderedDict()
+        # Versión por directorio para descartar lecturas que compiten con un cambio
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._dirs)
+
+    def get(self, directory: str) -> List[Tuple[str, bool]] | None:
+        """Entradas (nombre, es_directorio) de un directorio indexado, o None."""
+        with self._lock:
+            entries = self._dirs.get(directory)
+            if entries is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._dirs.move_to_end(directory)
+            return list(entries.items())
+
+    def scan(self, directory: str) -> List[Tuple[str, bool]]:
+        """Lee un directorio de disco y lo indexa si está vigilado. Bloqueante: ejecutar en un hilo."""
+        with self._lock:
+            version = self._versions.get(directory, 0)
+        entries: Dict[str, bool] = {}
+        with os.scandir(os.path.join(self.base_path, directory)) as iterator:
+            for entry in iterator:
+                try:
+                    entries[entry.name] = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+
+        if self.is_tracked(directory):
+            with self._lock:
+                if self._versions.get(directory, 0) == version:
+                    self._dirs[directory] = entries
+                    self._dirs.move_to_end(directory)
+                    while len(self._dirs) > self.max_dirs:
+                        self._dirs.popitem(last=False)
+        return list(entries.items())
+
+    def apply_changes(self, changes: Changes) -> None:
+        """Aplica un lote de cambios del watcher (rutas relativas con '/')."""
+        with self._lock:
+            for path, (kind, is_directory) in changes.items():
+                parent, _, name = path.rpartition("/")
+                self._versions[parent] = self._versions.get(parent, 0) + 1
+                siblings = self._dirs.get(parent)
+                if kind == "deleted":
+                    if siblings is not None:
+                        siblings.pop(name, None)
+                    if is_directory:
+                        self._drop_subtree(path)
+                elif kind == "created":
+                    if siblings is not None:
+                        siblings[name] = is_directory
+                    # Los directorios intermedios creados con el archivo también aparecen en sus padres
+                    while parent:
+                        parent, _, name = parent.rpartition("/")
+                        ancestors = self._dirs.get(parent)
+                        if ancestors is not None and name not in ancestors:
+                            ancestors[name] = True
+
+    def invalidate(self, directory: str) -> None:
+        with self._lock:
+            self._versions[directory] = self._versions.get(directory, 0) + 1
+            self._dirs.pop(directory, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._dirs.clear()
+
+    def _drop_subtree(self, directory: str) -> None:
+        prefix = directory + "/"
+        for path in [p for p in self._dirs if p == directory or p.startswith(prefix)]:
+            del self._dirs[path]
+            self._versions[path] = self._versions.get(path, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "directories": len(self._dirs),
+                "max_directories": self.max_dirs,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,149 @@
+import os
+import fnmatch
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IGNORE = [
+    "node_modules", ".git", "__pycache__", ".venv", "venv", "dist", "build",
+    "artifacts", "cache", "chats", ".pytest_cache", "*.tmp", "*.swp", "*~"
+]
+
+# Cambio agrupado: ruta relativa -> (tipo, es_directorio); tipo es "created", "modified" o "deleted"
+Changes = Dict[str, Tuple[str, bool]]
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "FileSystemWatcher"):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        self.watcher.submit("created", event.src_path, event.is_directory)
+
+    def on_deleted(self, event):
+        self.watcher.submit("deleted", event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        # Las modificaciones de directorios solo reflejan cambios de sus hijos, que ya llegan aparte
+        if not event.is_directory:
+            self.watcher.submit("modified", event.src_path, False)
+
+    def on_moved(self, event):
+        self.watcher.submit("deleted", event.src_path, event.is_directory)
+        self.watcher.submit("created", event.dest_path, event.is_directory)
+
+class FileSystemWatcher:
+    """Watcher del sistema de archivos acotado a unas raíces y filtrado por globs.
+
+    Cada raíz se vigila con un único watch recursivo (una instancia de
+    inotify y un hilo por raíz, no por directorio) y los eventos de rutas
+    ignoradas (node_modules, .git, ...) se descartan al llegar. Si el watch
+    no se puede crear (p. ej. por el límite de instancias de inotify) se
+    sigue sin vigilar: `covers` devuelve False y quien lo use lee del disco.
+    Los eventos se agrupan por ruta durante `debounce` segundos y se
+    entregan juntos a `on_changes` en el event loop (o en un hilo
+    temporizador si no hay loop asociado).
+    """
+
+    def __init__(
+        self,
+        base_path: str,
+        on_changes: Callable[[Changes], None],
+        roots: List[str] | None = None,
+        ignore: List[str] | None = None,
+        debounce: float | None = None
+    ):
+        self.base_path = os.path.abspath(base_path)
+        self.on_changes = on_changes
+        env_roots = os.getenv("FILE_WATCH_ROOTS")
+        if roots is None:
+            roots = [root for root in env_roots.split(os.pathsep) if root] if env_roots else [""]
+        self.roots = [os.path.abspath(os.path.join(self.base_path, root)) for root in roots]
+        env_ignore = os.getenv("FILE_WATCH_IGNORE")
+        self.ignore = ignore if ignore is not None else (
+            [pattern for pattern in env_ignore.split(",") if pattern] if env_ignore else DEFAULT_IGNORE
+        )
+        self.debounce = debounce if debounce is not None else float(os.getenv("FILE_WATCH_DEBOUNCE", "0.2"))
+        self.observer = Observer()
+        self._handler = _EventHandler(self)
+        self._pending: Changes = {}
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def is_ignored(self, relative_path: str) -> bool:
+        for part in relative_path.replace("\\", "/").split("/"):
+            if part and any(fnmatch.fnmatch(part, pattern) for pattern in self.ignore):
+                return True
+        return False
+
+    def covers(self, relative_path: str) -> bool:
+        """Indica si los cambios bajo esta ruta relativa llegan al watcher."""
+        if not self.observer.is_alive() or self.is_ignored(relative_path):
+            return False
+        full_path = os.path.abspath(os.path.join(self.base_path, relative_path))
+        return any(full_path == root or full_path.startswith(root + os.sep) for root in self.roots)
+
+    def start(self) -> None:
+        roots = sorted({root for root in self.roots if os.path.isdir(root)})
+        # Una raíz dentro de otra ya la cubre el watch recursivo de la exterior
+        roots = [root for root in roots if not any(root.startswith(other + os.sep) for other in roots)]
+        try:
+            for root in roots:
+                self.observer.schedule(self._handler, root, recursive=True)
+            self.observer.start()
+        except OSError as e:
+            logger.warning(f"File watching disabled for {self.base_path}: {str(e)}")
+            try:
+                self.observer.unschedule_all()
+            except Exception:
+                pass
+
+    def stop(self) -> None:
+        # Sin hilo arrancado (watch fallido o start() sin llamar) no hay nada que parar
+        if not self.observer.is_alive():
+            return
+        self.observer.stop()
+        self.observer.join()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Entrega los cambios en este event loop a partir de ahora."""
+        self._loop = loop
+
+    def submit(self, kind: str, full_path: str, is_directory: bool) -> None:
+        """Registra un evento (llamado desde el hilo del observer)."""
+        relative_path = os.path.relpath(full_path, self.base_path).replace("\\", "/")
+        if self.is_ignored(relative_path):
+            return
+
+        with self._lock:
+            previous = self._pending.get(relative_path)
+            if previous and previous[0] == "created" and kind == "modified":
+                kind = "created"
+            self._pending[relative_path] = (kind, is_directory)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(loop.call_later, self.debounce, self._flush)
+        else:
+            timer = threading.Timer(self.debounce, self._flush)
+            timer.daemon = True
+            timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            changes, self._pending = self._pending, {}
+            self._flush_scheduled = False
+        if not changes:
+            return
+        try:
+            self.on_changes(changes)
+        except Exception as e:
+            logger.error(f"Error handling file changes: {str(e)}")
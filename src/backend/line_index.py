@@ -0,0 +1,139 @@
+import os
+import re
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Tuple
+
+# Separadores que str.splitlines reconoce además de \n y \r\n; con ellos el índice no aplica
+IRREGULAR_SEPARATORS = re.compile(rb"\r(?!\n)|[\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+
+class LineIndex:
+    """Offsets en bytes del inicio de cada línea de un archivo."""
+
+    __slots__ = ("size", "mtime_ns", "starts", "regular")
+
+    def __init__(self, size: int, mtime_ns: int, starts: array, regular: bool):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.starts = starts
+        self.regular = regular
+
+    @classmethod
+    def build(cls, full_path: str) -> "LineIndex":
+        with open(full_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            starts = array("Q")
+            if stat.st_size == 0:
+                return cls(0, stat.st_mtime_ns, starts, True)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                regular = IRREGULAR_SEPARATORS.search(mm) is None
+                position = 0
+                while position < stat.st_size:
+                    starts.append(position)
+                    newline = mm.find(b"\n", position)
+                    if newline < 0:
+                        break
+                    position = newline + 1
+        return cls(stat.st_size, stat.st_mtime_ns, starts, regular)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.starts)
+
+    def byte_range(self, start_line: int, end_line: int) -> Tuple[int, int] | None:
+        """Rango de bytes de las líneas [start_line, end_line], con la misma semántica
+        de recorte que `'\\n'.join(content.splitlines()[start_line - 1:end_line])`."""
+        count = self.line_count
+        first = max(start_line, 1) - 1
+        stop = min(end_line, count)
+        if stop < 0:
+            stop = max(count + stop, 0)
+        if first >= stop:
+            return None
+        end = self.starts[stop] if stop < count else self.size
+        return self.starts[first], end
+
+class LineIndexCache:
+    """Índices de líneas por archivo, construidos una vez y reutilizados.
+
+    Se invalidan con los cambios del watcher y además se validan por tamaño y
+    mtime, así que un cambio no observado nunca devuelve líneas obsoletas. Las
+    lecturas por rango solo tocan los bytes pedidos (con mmap para archivos grandes).
+    """
+
+    def __init__(self, max_entries: int | None = None, mmap_threshold: int | None = None):
+        self.max_entries = max_entries or int(os.getenv("LINE_INDEX_CACHE_SIZE", "1024"))
+        self.mmap_threshold = mmap_threshold or int(os.getenv("LINE_INDEX_MMAP_BYTES", str(1024 * 1024)))
+        self._entries: OrderedDict[str, LineIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, path: str, full_path: str) -> LineIndex:
+        """Devuelve el índice de un archivo, reconstruyéndolo si falta o está obsoleto. Bloqueante."""
+        stat = os.stat(full_path)
+        with self._lock:
+            index = self._entries.get(path)
+            if index is not None and index.size == stat.st_size and index.mtime_ns == stat.st_mtime_ns:
+                self._entries.move_to_end(path)
+                return index
+
+        index = LineIndex.build(full_path)
+        with self._lock:
+            self.builds += 1
+            self._entries[path] = index
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def read_ranges(self, path: str, full_path: str, ranges: List[Tuple[int, int]]) -> List[str] | None:
+        """Lee varios rangos de líneas (1-indexados, inclusivos) abriendo el archivo una sola vez.
+
+        Devuelve None si el archivo usa separadores de línea que el índice no modela. Bloqueante.
+        """
+        index = self.get(path, full_path)
+        if not index.regular:
+            return None
+        spans = [index.byte_range(start, end) for start, end in ranges]
+        chunks: List[bytes] = []
+        with open(full_path, "rb") as f:
+            if index.size >= self.mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    chunks = [mm[span[0]:span[1]] if span else b"" for span in spans]
+            else:
+                for span in spans:
+                    if span is None:
+                        chunks.append(b"")
+                        continue
+                    f.seek(span[0])
+                    chunks.append(f.read(span[1] - span[0]))
+
+        results = []
+        for chunk in chunks:
+            text = chunk.decode("utf-8")
+            if text.endswith("\n"):
+                text = text[:-1]
+            if text.endswith("\r"):
+                text = text[:-1]
+            results.append(text.replace("\r\n", "\n"))
+        return results
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate_prefix(self, directory: str) -> None:
+        prefix = directory.rstrip("/") + "/"
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[path]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "builds": self.builds}
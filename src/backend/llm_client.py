@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+import logging
+import httpx
+from anthropic import AsyncAnthropic
+from dotenv import load_dotenv
+from metrics import observe_stage
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+class UpstreamLimiter:
+    """Semáforo global para las llamadas al LLM con métricas de cola."""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.total_calls = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def __aenter__(self):
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - start
+        self.in_flight += 1
+        self.total_calls += 1
+        self.total_wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        observe_stage("llm_queue", wait)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "total_calls": self.total_calls,
+            "avg_wait_seconds": self.total_wait_seconds / self.total_calls if self.total_calls else 0.0,
+            "max_wait_seconds": self.max_wait_seconds
+        }
+
+_client: AsyncAnthropic | None = None
+_limiter: UpstreamLimiter | None = None
+
+def get_anthropic_client() -> AsyncAnthropic:
+    """Devuelve el cliente de Anthropic compartido por todo el proceso.
+
+    Un único pool de conexiones HTTP con keep-alive evita un handshake TLS por
+    cada conexión de wallet. ANTHROPIC_BASE_URL permite apuntar a un endpoint local.
+    """
+    global _client
+    if _client is None:
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY no encontrada en las variables de entorno")
+        max_connections = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "64"))
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=int(os.getenv("ANTHROPIC_MAX_KEEPALIVE", str(max_connections))),
+                keepalive_expiry=float(os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", "120"))
+            ),
+            timeout=httpx.Timeout(float(os.getenv("ANTHROPIC_TIMEOUT", "600")), connect=10.0)
+        )
+        _client = AsyncAnthropic(
+            api_key=api_key,
+            base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+            http_client=http_client
+        )
+        logger.info(f"Created shared Anthropic client (max_connections={max_connections})")
+    return _client
+
+def get_upstream_limiter() -> UpstreamLimiter:
+    """Devuelve el limitador global de llamadas concurrentes al LLM."""
+    global _limiter
+    if _limiter is None:
+        _limiter = UpstreamLimiter(int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "16")))
+    return _limiter
+
+async def close_anthropic_client() -> None:
+    """Cierra el pool de conexiones compartido (al apagar la aplicación)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
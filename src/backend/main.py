@@ -1,8 +1,10 @@
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import logging
 from connection_manager import ConnectionManager
 from websocket_handlers import handle_websocket_connection
+from metrics import REGISTRY
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -23,16 +25,70 @@ app.add_middleware(
 # Crear una única instancia de ConnectionManager
 manager = ConnectionManager()
 
+@app.on_event("startup")
+async def startup_event():
+    await manager.startup()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await manager.shutdown()
+
+# Métricas en formato de texto de Prometheus (con varios workers, cada uno expone las suyas)
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # WebSocket endpoint con manejo de sesiones
 @app.websocket("/ws/agent")
-async def websocket_endpoint(websocket: WebSocket, wallet_address: str | None = None):
-    await handle_websocket_connection(websocket, wallet_address, manager)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    wallet_address: str | None = None,
+    contexts: str = "full",
+    encoding: str = "json"  # "json" (texto) o "msgpack" (binario)
+):
+    await handle_websocket_connection(websocket, wallet_address, manager, contexts, encoding)
+
+def parse_args(argv=None):
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(description="Zephyrus agent backend")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))  # Cloudflare Tunnel se encarga de la exposición
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--production", action="store_true",
+                        help="Sin recarga automática y con varios workers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or None,
+                        help="Número de procesos (por defecto, uno por CPU en modo producción)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--no-ws-deflate", dest="ws_deflate", action="store_false",
+                        default=os.getenv("WS_PER_MESSAGE_DEFLATE", "1") != "0",
+                        help="Desactiva la compresión permessage-deflate de los websockets")
+    parser.add_argument("--import-chats", action="store_true",
+                        help="Copia los chats guardados como archivos en CHAT_BASE_PATH a la base SQLite y termina")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(
-        "main:app",
-        host="127.0.0.1",  # Cambiado a localhost ya que Cloudflare Tunnel se encargará de la exposición
-        port=8000,
-        reload=True
-    ) 
\ No newline at end of file
+    args = parse_args()
+    if args.import_chats:
+        from chat_store import ChatStore
+        from state_backend import SqliteStateBackend, import_chats, sqlite_path
+        base_path = os.getenv("CHAT_BASE_PATH", "./chats")
+        imported, skipped = import_chats(ChatStore(base_path), SqliteStateBackend(sqlite_path(base_path)))
+        logger.info(f"Imported {imported} chats into {sqlite_path(base_path)} ({skipped} skipped)")
+    elif not args.production:
+        # Desarrollo: un proceso con recarga automática
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True, log_level=args.log_level,
+                    ws_per_message_deflate=args.ws_deflate)
+    else:
+        workers = args.workers or os.cpu_count() or 1
+        if workers > 1 and os.getenv("CHAT_BACKEND", "file") != "sqlite":
+            # El backend de archivos no es seguro entre procesos. No se cambia en silencio:
+            # los chats guardados como archivos dejarían de verse hasta importarlos
+            raise SystemExit(
+                f"Running {workers} workers requires CHAT_BACKEND=sqlite. Import existing file-based chats first "
+                "with `python main.py --import-chats`, then start with CHAT_BACKEND=sqlite "
+                "(or use --workers 1 to keep the file backend)."
+            )
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level,
+                    ws_per_message_deflate=args.ws_deflate)
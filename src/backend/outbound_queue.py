@@ -0,0 +1,223 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List
+from serialization import JsonCodec
+from metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("coalesce", "summary", "disconnect")
+
+class OutboundQueue:
+    """Cola de salida acotada de un websocket, vaciada por una tarea escritora propia.
+
+    `put` nunca espera al cliente: serializar (con el codec de la conexión) y enviar ocurre en la tarea
+    escritora, así que un cliente lento no retiene al manejador ni la
+    persistencia del turno. Los `message_delta` consecutivos del mismo chat
+    que aún no se han enviado se fusionan en uno. Si la cola se llena se
+    aplica la política configurada:
+
+    - "coalesce": se descartan los deltas pendientes (el texto completo llega
+      igualmente en las acciones del turno); si no basta, como "summary".
+    - "summary": la cola se sustituye por un único `sync_required` con los
+      chats afectados, para que el cliente vuelva a pedirlos.
+    - "disconnect": se cierra la conexión.
+
+    Un envío que tarda más de `send_timeout` segundos cierra la conexión.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        wallet_address: str,
+        max_size: int | None = None,
+        policy: str | None = None,
+        send_timeout: float | None = None,
+        codec=None
+    ):
+        self.websocket = websocket
+        self.wallet_address = wallet_address
+        self.max_size = max_size or int(os.getenv("OUTBOUND_QUEUE_SIZE", "256"))
+        self.policy = policy or os.getenv("OUTBOUND_POLICY", "coalesce")
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown outbound policy: {self.policy}")
+        self.send_timeout = send_timeout or float(os.getenv("OUTBOUND_SEND_TIMEOUT", "30"))
+        # Codec negociado al conectar (JSON en texto o MessagePack en binario)
+        self.codec = codec or JsonCodec()
+        # (frame, instante de encolado); frame es un dict o un texto ya serializado
+        self._frames: deque = deque()
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.closed = False
+        # Métricas
+        self.max_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.summaries = 0
+        self.total_send_seconds = 0.0
+        self.max_send_seconds = 0.0
+        self.total_queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        """Detiene la tarea escritora descartando lo pendiente."""
+        self.closed = True
+        self._frames.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+
+    def put(self, frame: Dict | str) -> bool:
+        """Encola un frame sin bloquear. Devuelve False si la conexión está cerrada."""
+        if self.closed:
+            return False
+        now = time.perf_counter()
+        if self._merge_delta(frame):
+            return True
+        if len(self._frames) >= self.max_size:
+            self._apply_policy()
+            if self.closed:
+                return False
+        self._frames.append((frame, now))
+        self.max_depth = max(self.max_depth, len(self._frames))
+        self._ready.set()
+        return True
+
+    def _merge_delta(self, frame: Dict | str) -> bool:
+        if not self._frames or not isinstance(frame, dict) or frame.get("type") != "message_delta":
+            return False
+        last, queued_at = self._frames[-1]
+        if not isinstance(last, dict) or last.get("type") != "message_delta":
+            return False
+        if (last.get("metadata") or {}).get("chat_id") != (frame.get("metadata") or {}).get("chat_id"):
+            return False
+        # Copia: el dict encolado puede ser del llamador
+        self._frames[-1] = (dict(last, content=last.get("content", "") + frame.get("content", "")), queued_at)
+        self.coalesced += 1
+        return True
+
+    def _apply_policy(self) -> None:
+        if self.policy == "coalesce":
+            kept = deque(item for item in self._frames
+                         if not (isinstance(item[0], dict) and item[0].get("type") == "message_delta"))
+            self.dropped += len(self._frames) - len(kept)
+            self._frames = kept
+            if len(self._frames) < self.max_size:
+                return
+        if self.policy in ("coalesce", "summary"):
+            chat_ids, dropped = set(), 0
+            for frame, _ in self._frames:
+                metadata = (frame.get("metadata") or {}) if isinstance(frame, dict) else {}
+                if isinstance(frame, dict) and frame.get("type") == "sync_required":
+                    # Un resumen anterior aún sin enviar se acumula en el nuevo
+                    chat_ids.update(metadata.get("chat_ids", []))
+                    dropped += metadata.get("dropped", 0)
+                    continue
+                if metadata.get("chat_id"):
+                    chat_ids.add(metadata["chat_id"])
+                dropped += 1
+            self.dropped += len(self._frames)
+            self.summaries += 1
+            log = logger.warning if self.summaries == 1 else logger.debug
+            log(f"Outbound queue full for {self.wallet_address}; replacing {len(self._frames)} frames with a summary")
+            self._frames = deque([({
+                "type": "sync_required",
+                "content": f"{dropped} updates were dropped because the connection is too slow",
+                "metadata": {"chat_ids": sorted(chat_ids), "dropped": dropped}
+            }, time.perf_counter())])
+            return
+        logger.warning(f"Outbound queue full for {self.wallet_address}; closing slow connection")
+        self._close(1013, "Client too slow")
+
+    def _close(self, code: int, reason: str) -> None:
+        self.closed = True
+        self._frames.clear()
+        self._ready.set()
+        asyncio.get_running_loop().create_task(self._close_socket(code, reason))
+
+    async def _close_socket(self, code: int, reason: str) -> None:
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=5)
+        except Exception:
+            pass
+
+    async def _run(self) -> None:
+        while not self.closed:
+            if not self._frames:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            frame, queued_at = self._frames.popleft()
+            frame_type = frame.get("type", "") if isinstance(frame, dict) else ""
+            try:
+                # Los textos ya serializados (JSON) se envían tal cual
+                data = frame if isinstance(frame, str) else self.codec.encode(frame)
+            except Exception as e:
+                # Un frame que no se puede serializar se descarta sin detener la cola
+                logger.error(f"Cannot encode {frame_type or 'outbound'} frame for {self.wallet_address}: {str(e)}")
+                self.dropped += 1
+                continue
+            start = time.perf_counter()
+            try:
+                send = self.websocket.send_bytes(data) if isinstance(data, bytes) else self.websocket.send_text(data)
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Send to {self.wallet_address} timed out after {self.send_timeout}s; closing connection")
+                self._close(1013, "Send timeout")
+                return
+            except Exception as e:
+                # Socket cerrado: el bucle de recepción hará la limpieza
+                logger.info(f"Stopping outbound queue for {self.wallet_address}: {str(e)}")
+                self.closed = True
+                self._frames.clear()
+                return
+            end = time.perf_counter()
+            self.sent += 1
+            self.total_send_seconds += end - start
+            self.max_send_seconds = max(self.max_send_seconds, end - start)
+            self.total_queue_seconds += end - queued_at
+            self.max_queue_seconds = max(self.max_queue_seconds, end - queued_at)
+            observe_stage("ws_send", end - start, frame_type)
+            observe_stage("ws_queue", end - queued_at, frame_type)
+
+    def stats(self) -> Dict:
+        return {
+            "depth": len(self._frames),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "summaries": self.summaries,
+            "avg_send_seconds": self.total_send_seconds / self.sent if self.sent else 0.0,
+            "max_send_seconds": self.max_send_seconds,
+            "avg_latency_seconds": self.total_queue_seconds / self.sent if self.sent else 0.0,
+            "max_latency_seconds": self.max_queue_seconds
+        }
+
+def aggregate_stats(queues: List[OutboundQueue]) -> Dict:
+    """Métricas agregadas de todas las colas de salida."""
+    stats = [queue.stats() for queue in queues]
+    sent = sum(s["sent"] for s in stats)
+    return {
+        "connections": len(stats),
+        "depth": sum(s["depth"] for s in stats),
+        "max_depth": max((s["max_depth"] for s in stats), default=0),
+        "sent": sent,
+        "coalesced": sum(s["coalesced"] for s in stats),
+        "dropped": sum(s["dropped"] for s in stats),
+        "summaries": sum(s["summaries"] for s in stats),
+        "avg_latency_seconds": sum(s["avg_latency_seconds"] * s["sent"] for s in stats) / sent if sent else 0.0,
+        "max_latency_seconds": max((s["max_latency_seconds"] for s in stats), default=0.0)
+    }
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+class PersistenceWorker:
+    """Escritor en segundo plano que agrupa claves "sucias" y las persiste fuera del event loop.
+
+    `prepare(key)` se ejecuta en el event loop y devuelve los argumentos del
+    trabajo (o None si no hay nada que escribir); `write(*args)` se ejecuta en
+    el pool de hilos; `on_done` / `on_error` se llaman de vuelta en el event
+    loop, para que solo el loop toque el estado compartido. Las claves marcadas
+    varias veces dentro del intervalo de debounce se escriben una sola vez, y
+    una misma clave nunca se escribe en dos hilos a la vez.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[Hashable], tuple | None],
+        write: Callable[..., Any],
+        on_error: Callable[[Hashable, tuple, Exception], None] | None = None,
+        on_done: Callable[[Hashable, tuple, Any], None] | None = None,
+        debounce: float = 0.5,
+        max_workers: int = 4
+    ):
+        self.prepare = prepare
+        self.write = write
+        self.on_error = on_error
+        self.on_done = on_done
+        self.debounce = debounce
+        self.max_workers = max_workers
+        self._dirty: set = set()
+        self._dirty_event: asyncio.Event | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Arranca el worker en el event loop actual."""
+        if self.running:
+            return
+        self._stopping = False
+        self._dirty_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="persistence")
+        self._task = asyncio.create_task(self._run())
+        if self._dirty:
+            self._dirty_event.set()
+
+    async def stop(self) -> None:
+        """Detiene el worker escribiendo antes todo lo pendiente."""
+        if self._task is None:
+            return
+        # No se cancela la tarea: un lote a medio escribir debe terminar antes del flush final
+        self._stopping = True
+        self._dirty_event.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def mark_dirty(self, key: Hashable) -> None:
+        self._dirty.add(key)
+        if self._dirty_event is not None:
+            self._dirty_event.set()
+
+    async def flush(self) -> None:
+        """Escribe inmediatamente todas las claves pendientes y espera a que terminen."""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            while self._dirty:
+                if not await self._flush_batch():
+                    # Todas las escrituras fallaron: no reintentar en bucle
+                    break
+
+    async def wait_idle(self) -> None:
+        """Espera a que el worker no tenga escrituras pendientes ni en curso."""
+        while self._dirty and self.running:
+            await asyncio.sleep(self.debounce / 2 or 0.01)
+        if self._flush_lock is not None:
+            async with self._flush_lock:
+                pass
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._dirty_event.wait()
+            if self._stopping:
+                return
+            # Ventana de debounce para agrupar los cambios en ráfaga
+            await asyncio.sleep(self.debounce)
+            async with self._flush_lock:
+                self._dirty_event.clear()
+                await self._flush_batch()
+                if self._dirty:
+                    self._dirty_event.set()
+
+    async def _flush_batch(self) -> bool:
+        """Escribe un lote. Devuelve False si todos los trabajos del lote fallaron."""
+        keys, self._dirty = self._dirty, set()
+        loop = asyncio.get_running_loop()
+        jobs = []
+        for key in keys:
+            try:
+                args = self.prepare(key)
+            except Exception as e:
+                logger.error(f"Error preparing persistence job for {key}: {str(e)}")
+                continue
+            if args is not None:
+                jobs.append((key, args, loop.run_in_executor(self._executor, self.write, *args)))
+
+        failures = 0
+        for key, args, future in jobs:
+            try:
+                result = await future
+            except Exception as e:
+                failures += 1
+                log = logger.info if getattr(e, "retryable", False) else logger.error
+                log(f"Error persisting {key}: {str(e)}")
+                if self.on_error:
+                    self.on_error(key, args, e)
+                continue
+            if self.on_done:
+                self.on_done(key, args, result)
+        return not jobs or failures < len(jobs)
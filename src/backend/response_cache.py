@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r"\s+")
+
+def _digest(value) -> str:
+    data = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def normalize_prompt(prompt: str) -> str:
+    """Colapsa los espacios y recorta los extremos; mayúsculas y puntuación se respetan
+    porque en Solidity `owner` y `Owner` son identificadores distintos."""
+    return WHITESPACE.sub(" ", prompt).strip()
+
+class ResponseCache:
+    """Caché de respuestas completas del LLM para peticiones repetidas, acotada por LRU y TTL.
+
+    La clave combina el prompt normalizado, la versión del system prompt, el
+    modelo, el estado del contrato y los últimos mensajes del historial, así
+    que solo se reutiliza una respuesta cuando el modelo recibiría
+    prácticamente la misma petición. Las entradas se añaden a un journal JSONL
+    que se compacta al doblar el límite; al arrancar se recargan las vigentes.
+    Con varios workers cada proceso tiene su propia copia en memoria.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_entries: int | None = None,
+        ttl_seconds: float | None = None,
+        history_messages: int | None = None
+    ):
+        self.path = path or os.getenv(
+            "RESPONSE_CACHE_PATH",
+            os.path.join(os.getenv("CHAT_BASE_PATH", "./chats"), ".response_cache.jsonl")
+        )
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+        # Mensajes previos que forman parte de la clave (los más recientes)
+        self.history_messages = history_messages if history_messages is not None else int(
+            os.getenv("RESPONSE_CACHE_HISTORY_MESSAGES", "4")
+        )
+        # clave -> {"text", "created"}
+        self._entries: OrderedDict[str, Dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._journal_lines = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    def key(self, prompt: str, system_prompt: str, model: str, contract: Dict, history: List[Dict]) -> str:
+        """Clave de una petición; `history` son los mensajes anteriores al prompt."""
+        recent = history[-self.history_messages:] if self.history_messages else []
+        return _digest([
+            normalize_prompt(prompt),
+            _digest(system_prompt),
+            model,
+            _digest(contract),
+            _digest(recent)
+        ])
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry["text"]
+
+    def put(self, key: str, text: str) -> None:
+        """Guarda una respuesta y la añade al journal. Hace E/S: llamarla fuera del event loop."""
+        entry = {"key": key, "text": text, "created": time.time()}
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {"text": text, "created": entry["created"]}
+            self._evict()
+            try:
+                if self._journal_lines >= 2 * self.max_entries:
+                    self._compact()
+                else:
+                    self._append(entry)
+            except OSError as e:
+                logger.error(f"Error persisting response cache: {str(e)}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            try:
+                self._compact()
+            except OSError as e:
+                logger.error(f"Error clearing response cache: {str(e)}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._entries:
+            key, oldest = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - oldest["created"] <= self.ttl_seconds:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._journal_lines += 1
+                    try:
+                        entry = json.loads(line)
+                        key, text, created = entry["key"], entry["text"], float(entry["created"])
+                    except (ValueError, KeyError, TypeError):
+                        # Línea truncada por una escritura interrumpida
+                        continue
+                    self._entries.pop(key, None)
+                    self._entries[key] = {"text": text, "created": created}
+        except OSError as e:
+            logger.error(f"Error loading response cache: {str(e)}")
+            return
+        self._evict()
+        logger.info(f"Loaded {len(self._entries)} cached responses from {self.path}")
+
+    def _append(self, entry: Dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._journal_lines += 1
+
+    def _compact(self) -> None:
+        """Reescribe el journal solo con las entradas vigentes."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for key, entry in self._entries.items():
+                f.write(json.dumps({"key": key, "text": entry["text"], "created": entry["created"]},
+                                   ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(temp_path, self.path)
+        self._journal_lines = len(self._entries)
+
+def create_response_cache() -> ResponseCache | None:
+    """Caché de respuestas si RESPONSE_CACHE_ENABLED está activo (desactivada por defecto)."""
+    if os.getenv("RESPONSE_CACHE_ENABLED", "0") in ("0", "false", "False", ""):
+        return None
+    return ResponseCache()
@@ -0,0 +1,51 @@
+import json
+import logging
+from typing import Any, Dict
+
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional: sin ella solo se ofrece JSON
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+class JsonCodec:
+    """Frames de texto JSON (compacto y en UTF-8, sin escapes \\uXXXX)."""
+
+    name = "json"
+    binary = False
+
+    def encode(self, frame: Any) -> str:
+        return json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+
+    def decode(self, data: str | bytes) -> Any:
+        return json.loads(data)
+
+class MsgpackCodec:
+    """Frames binarios MessagePack; los frames de texto recibidos se siguen aceptando como JSON."""
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, frame: Any) -> bytes:
+        return msgpack.packb(frame, use_bin_type=True)
+
+    def decode(self, data: str | bytes) -> Any:
+        if isinstance(data, str):
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+CODECS: Dict[str, type] = {"json": JsonCodec}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec
+
+def available_encodings() -> list:
+    return list(CODECS)
+
+def get_codec(name: str | None):
+    """Devuelve el codec pedido por el cliente; si no está disponible, JSON."""
+    codec_class = CODECS.get((name or "json").lower())
+    if codec_class is None:
+        logger.warning(f"Unsupported websocket encoding {name!r}; falling back to json")
+        codec_class = JsonCodec
+    return codec_class()
@@ -1,13 +1,31 @@
-import json
 import os
+import asyncio
 from datetime import datetime
 import uuid
 import logging
+import time
+from collections import OrderedDict
 from typing import List
+from state_backend import StaleChatError, StateBackend, create_state_backend
+from persistence_worker import PersistenceWorker
+from version_store import VersionHistory
+from metrics import observe_stage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def summary_from_index_entry(entry: dict) -> dict:
+    return {
+        "id": entry["id"],
+        "name": entry["name"],
+        "wallet_address": entry["wallet_address"],
+        "created_at": entry["created_at"],
+        "last_accessed": entry["last_accessed"],
+        "message_count": entry.get("message_count", 0),
+        "files": entry.get("files", []),
+        "type": "chat"
+    }
+
 class Chat:
     def __init__(self, chat_id: str, name: str, wallet_address: str):
         self.chat_id = chat_id
@@ -17,7 +35,9 @@ class Chat:
         self.last_accessed = datetime.now().isoformat()
         self.messages = []
         self.active_files = {}  # {base_name: {content, language, timestamp}}
-        self.file_history = {}  # {base_name: [{content, timestamp}]}
+        self.file_history = {}  # {base_name: VersionHistory}
+        self.journal_seq = 0  # Última entrada del journal aplicada
+        self.entries_since_snapshot = 0
         logger.info(f"Created new chat: {chat_id} for wallet: {wallet_address}")
 
     def to_dict(self) -> dict:
@@ -36,6 +56,60 @@ class Chat:
             }
         }
 
+    def file_history_dict(self) -> dict:
+        """Historial de versiones serializado (deltas) para persistirlo con el chat."""
+        return {name: history.to_list() for name, history in self.file_history.items()}
+
+    def index_entry(self) -> dict:
+        """Metadatos ligeros del chat que se guardan en el índice."""
+        return {
+            "id": self.chat_id,
+            "name": self.name,
+            "wallet_address": self.wallet_address,
+            "created_at": self.created_at,
+            "last_accessed": self.last_accessed,
+            "message_count": len(self.messages),
+            "files": [f"contracts/{name}" for name in self.active_files]
+        }
+
+    def to_summary(self) -> dict:
+        """Resumen del chat sin mensajes ni contenido de archivos."""
+        return summary_from_index_entry(self.index_entry())
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Chat":
+        chat = cls(data["id"], data["name"], data["wallet_address"])
+        chat.created_at = data["created_at"]
+        chat.last_accessed = data["last_accessed"]
+        chat.messages = data.get("messages", [])
+        chat.active_files = {
+            os.path.basename(path): file_data
+            for path, file_data in data.get("virtualFiles", {}).items()
+        }
+        chat.file_history = {
+            name: VersionHistory.from_list(entries)
+            for name, entries in data.get("fileHistory", {}).items()
+        }
+        chat.journal_seq = data.get("journal_seq", 0)
+        return chat
+
+    def apply_journal_entry(self, entry: dict) -> None:
+        """Reproduce una operación del journal sobre el chat."""
+        op = entry.get("op")
+        if op == "message":
+            self.messages.append(entry["message"])
+        elif op == "file":
+            self.add_virtual_file(entry["path"], entry["content"], entry.get("language", "solidity"))
+            base_name = os.path.basename(entry["path"]).replace(".sol", "").split("_")[0] + ".sol"
+            self.active_files[base_name]["timestamp"] = entry["timestamp"]
+        elif op == "delete_file":
+            self.delete_virtual_file(entry["path"])
+        else:
+            logger.warning(f"Unknown journal op {op} for chat {self.chat_id}")
+        self.last_accessed = entry.get("last_accessed", self.last_accessed)
+        self.journal_seq = entry.get("seq", self.journal_seq)
+        self.entries_since_snapshot += 1
+
     def add_message(self, message: dict) -> None:
         self.messages.append(message)
         self.last_accessed = datetime.now().isoformat()
@@ -52,16 +126,10 @@ class Chat:
         if base_name in self.active_files:
             current = self.active_files[base_name]
             if content != current["content"]:
-                # Guardar versión anterior en el historial
+                # Guardar versión anterior en el historial (como delta)
                 if base_name not in self.file_history:
-                    self.file_history[base_name] = []
-                self.file_history[base_name].append({
-                    "content": current["content"],
-                    "timestamp": current["timestamp"]
-                })
-                # Mantener solo las últimas 5 versiones en el historial
-                if len(self.file_history[base_name]) > 5:
-                    self.file_history[base_name] = self.file_history[base_name][-5:]
+                    self.file_history[base_name] = VersionHistory()
+                self.file_history[base_name].append(current["content"], current["timestamp"])
         
         # Actualizar archivo activo
         self.active_files[base_name] = {
@@ -84,9 +152,7 @@ class Chat:
             
         # Retornar versión específica del historial
         if base_name in self.file_history:
-            history = self.file_history[base_name]
-            if 0 <= version < len(history):
-                return history[version]
+            return self.file_history[base_name].get(version)
         
         return None
 
@@ -103,76 +169,280 @@ class Chat:
         """Obtiene el historial de versiones de un archivo."""
         base_name = os.path.basename(path).replace(".sol", "").split("_")[0] + ".sol"
         if base_name in self.file_history:
-            return self.file_history[base_name]
+            return self.file_history[base_name].all()
         return []
 
+# Segundo elemento de la clave del índice de una wallet en la cola del escritor
+INDEX_KEY = "__index__"
+
 class ChatManager:
-    def __init__(self, base_path: str = "./chats"):
+    def __init__(
+        self,
+        base_path: str | None = None,
+        storage_mode: str | None = None,
+        compact_every: int = 200,
+        max_loaded_chats: int | None = None,
+        idle_seconds: float | None = None,
+        store: StateBackend | None = None
+    ):
+        base_path = base_path or os.getenv("CHAT_BASE_PATH", "./chats")
         self.base_path = base_path
-        self.chats = {}  # wallet_address -> {chat_id -> Chat}
-        self._ensure_base_path()
-        self._load_chats()
-
-    def _ensure_base_path(self):
-        if not os.path.exists(self.base_path):
-            os.makedirs(self.base_path)
-
-    def _get_chat_path(self, wallet_address: str, chat_id: str) -> str:
-        wallet_dir = os.path.join(self.base_path, wallet_address)
-        if not os.path.exists(wallet_dir):
-            os.makedirs(wallet_dir)
-        return os.path.join(wallet_dir, f"{chat_id}.json")
-
-    def _load_chats(self):
-        if not os.path.exists(self.base_path):
-            return
+        # "journal": cada cambio se añade a <chat_id>.jsonl y se compacta cada `compact_every` entradas
+        # "snapshot": cada cambio reescribe el chat completo en <chat_id>.json
+        self.storage_mode = storage_mode or os.getenv("CHAT_STORAGE_MODE", "journal")
+        if self.storage_mode not in ("journal", "snapshot"):
+            raise ValueError(f"Unknown chat storage mode: {self.storage_mode}")
+        self.compact_every = compact_every
+        # Límite de chats completos en memoria (LRU) y tiempo de inactividad antes de descargarlos
+        self.max_loaded_chats = max_loaded_chats or int(os.getenv("CHAT_CACHE_SIZE", "256"))
+        self.idle_seconds = idle_seconds if idle_seconds is not None else float(os.getenv("CHAT_IDLE_SECONDS", "1800"))
+        # Backend de almacenamiento (CHAT_BACKEND): "file" para un proceso, "sqlite" para varios workers
+        self.store = store or create_state_backend(base_path)
+        if self.store.shared and self.storage_mode == "snapshot":
+            # Un conflicto entre procesos se resuelve reaplicando las entradas del journal sobre el chat recargado
+            logger.warning("Shared chat backends require CHAT_STORAGE_MODE=journal; ignoring snapshot mode")
+            self.storage_mode = "journal"
+        # Con un backend compartido, versión conocida de cada chat y cada cuánto se comprueba
+        self._versions: dict[tuple, int] = {}
+        self._checked_at: dict[tuple, float] = {}
+        self.coherence_interval = float(os.getenv("CHAT_COHERENCE_SECONDS", "1.0"))
+        self.index = {}  # wallet_address -> {chat_id -> entrada del índice}
+        self._loaded: OrderedDict[tuple, Chat] = OrderedDict()  # (wallet, chat_id) -> Chat
+        self._last_used: dict[tuple, float] = {}
+        # Cambios pendientes de escribir, por (wallet_address, chat_id)
+        self._pending_entries: dict[tuple, list] = {}
+        self._snapshot_due: set[tuple] = set()
+        self._deleted: set[tuple] = set()
+        self._in_flight: set[tuple] = set()
+        self.writer = PersistenceWorker(
+            self._prepare_flush,
+            self._write_job,
+            on_error=self._on_write_error,
+            on_done=self._on_write_done,
+            debounce=float(os.getenv("CHAT_FLUSH_DEBOUNCE", "0.5"))
+        )
+        self._load_index()
 
-        for wallet_dir in os.listdir(self.base_path):
-            wallet_path = os.path.join(self.base_path, wallet_dir)
-            if os.path.isdir(wallet_path):
-                self.chats[wallet_dir] = {}
-                for chat_file in os.listdir(wallet_path):
-                    if chat_file.endswith(".json"):
-                        chat_path = os.path.join(wallet_path, chat_file)
-                        try:
-                            with open(chat_path, 'r', encoding='utf-8') as f:
-                                data = json.load(f)
-                                chat = Chat(
-                                    data["id"],
-                                    data["name"],
-                                    data["wallet_address"]
-                                )
-                                chat.created_at = data["created_at"]
-                                chat.last_accessed = data["last_accessed"]
-                                chat.messages = data.get("messages", [])
-                                chat.active_files = data.get("virtualFiles", {})  # Nuevo: cargar archivos virtuales
-                                self.chats[wallet_dir][chat.chat_id] = chat
-                        except Exception as e:
-                            logger.error(f"Error loading chat {chat_file}: {str(e)}")
+    async def start_background_writer(self) -> None:
+        """Mueve la persistencia a un worker en segundo plano (requiere event loop)."""
+        self.writer.start()
+
+    async def stop_background_writer(self) -> None:
+        """Escribe todos los cambios pendientes y detiene el worker."""
+        await self.writer.stop()
+
+    async def flush(self) -> None:
+        """Persiste inmediatamente todos los cambios pendientes."""
+        if self.writer.running:
+            await self.writer.flush()
+
+    def close(self) -> None:
+        """Cierra el backend de almacenamiento (tras detener el escritor)."""
+        self.store.close()
+
+    @property
+    def loaded_chat_count(self) -> int:
+        return len(self._loaded)
+
+    def _load_index(self):
+        """Carga los índices al arrancar; solo se parsean los chats que falten en ellos."""
+        for wallet_address in self.store.list_wallets():
+            stored = self.store.load_index(wallet_address) or {}
+            wallet_chats = {}
+            for chat_id in self.store.list_chats(wallet_address):
+                entry = stored.get(chat_id)
+                if entry is None:
+                    chat = self._read_chat(wallet_address, chat_id)
+                    if chat is None:
+                        continue
+                    entry = chat.index_entry()
+                wallet_chats[chat_id] = entry
+            self.index[wallet_address] = wallet_chats
+            if wallet_chats.keys() != stored.keys():
+                self._schedule((wallet_address, INDEX_KEY))
+
+    def _load_chat(self, wallet_address: str, chat_id: str) -> tuple:
+        """Lee de disco un chat completo (snapshot + journal) y su versión.
+
+        No toca el estado del manager, así que se puede ejecutar en un hilo.
+        """
+        try:
+            version = self.store.chat_version(wallet_address, chat_id)
+            snapshot, entries = self.store.load(wallet_address, chat_id)
+            if snapshot is None:
+                logger.error(f"Error loading chat {chat_id}: journal without snapshot")
+                return None, None
+            chat = Chat.from_dict(snapshot)
+            for entry in entries:
+                chat.apply_journal_entry(entry)
+            return chat, version
+        except Exception as e:
+            logger.error(f"Error loading chat {chat_id}: {str(e)}")
+            return None, None
+
+    def _read_chat(self, wallet_address: str, chat_id: str) -> Chat | None:
+        """Lee de disco un chat completo y registra su versión."""
+        chat, version = self._load_chat(wallet_address, chat_id)
+        if chat is not None:
+            self._remember_version((wallet_address, chat_id), version)
+        return chat
+
+    def _remember_version(self, key: tuple, version: int | None) -> None:
+        if version is not None:
+            self._versions[key] = version
+            self._checked_at[key] = time.monotonic()
+
+    def _touch(self, key: tuple, chat: Chat) -> None:
+        self._loaded[key] = chat
+        self._loaded.move_to_end(key)
+        self._last_used[key] = time.monotonic()
+        self._evict()
+
+    def _evict(self) -> None:
+        """Descarga de memoria los chats menos usados o inactivos que ya estén persistidos."""
+        now = time.monotonic()
+        # El chat recién usado (el último) nunca se descarga
+        for key in list(self._loaded)[:-1]:
+            over_capacity = len(self._loaded) > self.max_loaded_chats
+            idle = now - self._last_used.get(key, now) > self.idle_seconds
+            if not over_capacity and not idle:
+                break
+            if key in self._pending_entries or key in self._snapshot_due or key in self._in_flight:
+                continue
+            del self._loaded[key]
+            self._last_used.pop(key, None)
+            self._versions.pop(key, None)
+            self._checked_at.pop(key, None)
 
     def create_chat(self, wallet_address: str, name: str = None) -> Chat:
-        if wallet_address not in self.chats:
-            self.chats[wallet_address] = {}
-            
+        wallet_chats = self.index.setdefault(wallet_address, {})
         chat_id = str(uuid.uuid4())
-        chat_name = name or f"Chat {len(self.chats[wallet_address]) + 1}"
+        chat_name = name or f"Chat {len(wallet_chats) + 1}"
         chat = Chat(chat_id, chat_name, wallet_address)
         
-        self.chats[wallet_address][chat_id] = chat
+        wallet_chats[chat_id] = chat.index_entry()
+        key = (wallet_address, chat_id)
+        # Visible para _prepare_flush aunque el snapshot se escriba de forma síncrona
+        self._loaded[key] = chat
         self._save_chat(chat)
+        self._touch(key, chat)
         return chat
 
-    def get_user_chats(self, wallet_address: str) -> list:
-        return [chat.to_dict() for chat in self.chats.get(wallet_address, {}).values()]
+    def get_user_chats(self, wallet_address: str, summary: bool = False) -> list:
+        """Devuelve los chats de una wallet; en modo resumen solo se usa el índice."""
+        self._refresh_index(wallet_address)
+        if summary:
+            return [summary_from_index_entry(entry) for entry in self.index.get(wallet_address, {}).values()]
+        chats = [self.get_chat(wallet_address, chat_id) for chat_id in list(self.index.get(wallet_address, {}))]
+        return [chat.to_dict() for chat in chats if chat]
 
     def get_chat(self, wallet_address: str, chat_id: str) -> Chat | None:
-        return self.chats.get(wallet_address, {}).get(chat_id)
+        """Obtiene un chat, cargándolo de disco en el primer acceso."""
+        if not chat_id:
+            return None
+        if chat_id not in self.index.get(wallet_address, {}):
+            # Puede haberlo creado otro worker
+            self._refresh_index(wallet_address)
+            if chat_id not in self.index.get(wallet_address, {}):
+                return None
+        key = (wallet_address, chat_id)
+        chat = self._loaded.get(key)
+        if chat is not None and self._is_stale(key):
+            version = self.store.chat_version(wallet_address, chat_id)
+            if version == -1:
+                # Borrado por otro worker
+                self._loaded.pop(key, None)
+                self._last_used.pop(key, None)
+                self.index.get(wallet_address, {}).pop(chat_id, None)
+                return None
+            logger.info(f"Reloading chat {chat_id} changed by another worker")
+            chat = None
+        if chat is None:
+            chat = self._read_chat(wallet_address, chat_id)
+            if chat is None:
+                return None
+            self._check_index(chat)
+        self._touch(key, chat)
+        return chat
+
+    async def load_chat(self, wallet_address: str, chat_id: str) -> Chat | None:
+        """Como `get_chat`, pero la carga en frío (lectura y reproducción del journal) se hace en un hilo."""
+        key = (wallet_address, chat_id)
+        if not chat_id or key in self._loaded:
+            return self.get_chat(wallet_address, chat_id)
+        if chat_id not in self.index.get(wallet_address, {}):
+            self._refresh_index(wallet_address)
+            if chat_id not in self.index.get(wallet_address, {}):
+                return None
+        chat, version = await asyncio.to_thread(self._load_chat, wallet_address, chat_id)
+        if key in self._loaded or chat_id not in self.index.get(wallet_address, {}):
+            # Otra petición lo cargó (o lo borró) mientras se leía: esa copia manda
+            return self.get_chat(wallet_address, chat_id)
+        if chat is None:
+            return None
+        self._remember_version(key, version)
+        self._check_index(chat)
+        self._touch(key, chat)
+        return chat
+
+    async def preload_chats(self, wallet_address: str) -> None:
+        """Carga en hilos los chats de una wallet que aún no estén en memoria."""
+        self._refresh_index(wallet_address)
+        for chat_id in list(self.index.get(wallet_address, {})):
+            await self.load_chat(wallet_address, chat_id)
+
+    def _check_index(self, chat: Chat) -> None:
+        entry = self.index.get(chat.wallet_address, {}).get(chat.chat_id)
+        if entry is not None and entry.get("message_count") != len(chat.messages):
+            # Índice desfasado (p. ej. caída antes de reescribirlo)
+            self._update_index(chat)
+
+    def _is_stale(self, key: tuple) -> bool:
+        """Indica si otro proceso ha escrito el chat desde que se cargó (solo backends compartidos).
+
+        La comprobación se hace como mucho cada `coherence_interval` segundos
+        por chat, y nunca con cambios locales pendientes de escribir.
+        """
+        if not self.store.shared:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at.get(key, 0.0) < self.coherence_interval:
+            return False
+        if key in self._pending_entries or key in self._snapshot_due or key in self._in_flight:
+            return False
+        self._checked_at[key] = now
+        version = self.store.chat_version(*key)
+        return version is not None and version != self._versions.get(key)
+
+    def _refresh_index(self, wallet_address: str) -> None:
+        """Incorpora al índice en memoria los cambios hechos por otros workers (solo backends compartidos)."""
+        if not self.store.shared:
+            return
+        key = (wallet_address, INDEX_KEY)
+        now = time.monotonic()
+        if now - self._checked_at.get(key, 0.0) < self.coherence_interval:
+            return
+        self._checked_at[key] = now
+        stored = self.store.load_index(wallet_address) or {}
+        wallet_chats = self.index.setdefault(wallet_address, {})
+        for chat_id in list(wallet_chats):
+            # Los chats cargados aquí se validan por versión en get_chat
+            if chat_id not in stored and (wallet_address, chat_id) not in self._loaded:
+                del wallet_chats[chat_id]
+        for chat_id, entry in stored.items():
+            if (wallet_address, chat_id) not in self._loaded:
+                wallet_chats[chat_id] = entry
+
+    def _update_index(self, chat: Chat) -> None:
+        entry = self.index.setdefault(chat.wallet_address, {}).setdefault(chat.chat_id, {})
+        entry.update(chat.index_entry())
+        self._schedule((chat.wallet_address, INDEX_KEY))
 
     def add_message_to_chat(self, wallet_address: str, chat_id: str, message: dict) -> None:
         chat = self.get_chat(wallet_address, chat_id)
         if chat:
             chat.add_message(message)
-            self._save_chat(chat)
+            self._record(chat, {"op": "message", "message": message})
         else:
             raise ValueError(f"Chat {chat_id} not found for wallet {wallet_address}")
 
@@ -181,15 +451,40 @@ class ChatManager:
         chat = self.get_chat(wallet_address, chat_id)
         if chat:
             chat.add_virtual_file(path, content, language)
-            self._save_chat(chat)
+            base_name = os.path.basename(path).replace(".sol", "").split("_")[0] + ".sol"
+            self._record(chat, {
+                "op": "file",
+                "path": path,
+                "content": content,
+                "language": language,
+                "timestamp": chat.active_files[base_name]["timestamp"]
+            })
         else:
             raise ValueError(f"Chat {chat_id} not found for wallet {wallet_address}")
 
-    def get_virtual_file_from_chat(self, wallet_address: str, chat_id: str, path: str) -> dict | None:
-        """Obtiene un archivo virtual de un chat específico."""
+    def get_messages(self, wallet_address: str, chat_id: str, cursor: int | None = None, limit: int = 50) -> dict:
+        """Devuelve una página de mensajes anteriores a `cursor` (por defecto, los más recientes).
+
+        `next_cursor` es el cursor de la página anterior o None si no quedan mensajes.
+        """
+        chat = self.get_chat(wallet_address, chat_id)
+        if not chat:
+            raise ValueError(f"Chat {chat_id} not found for wallet {wallet_address}")
+        total = len(chat.messages)
+        end = total if cursor is None else max(0, min(int(cursor), total))
+        start = max(0, end - max(1, int(limit)))
+        return {
+            "messages": chat.messages[start:end],
+            "cursor": end,
+            "next_cursor": start if start > 0 else None,
+            "total": total
+        }
+
+    def get_virtual_file_from_chat(self, wallet_address: str, chat_id: str, path: str, version: int | None = None) -> dict | None:
+        """Obtiene un archivo virtual de un chat específico, opcionalmente una versión del historial."""
         chat = self.get_chat(wallet_address, chat_id)
         if chat:
-            return chat.get_virtual_file(path)
+            return chat.get_virtual_file(path, version)
         return None
 
     def delete_virtual_file_from_chat(self, wallet_address: str, chat_id: str, path: str) -> None:
@@ -197,17 +492,178 @@ class ChatManager:
         chat = self.get_chat(wallet_address, chat_id)
         if chat:
             chat.delete_virtual_file(path)
+            self._record(chat, {"op": "delete_file", "path": path})
+            # Compactar libera enseguida los blobs que solo usaba este archivo
             self._save_chat(chat)
         else:
             raise ValueError(f"Chat {chat_id} not found for wallet {wallet_address}")
 
+    def _record(self, chat: Chat, entry: dict) -> None:
+        """Registra un cambio del chat para persistirlo según el modo de almacenamiento."""
+        key = (chat.wallet_address, chat.chat_id)
+        if self.storage_mode == "snapshot":
+            self._snapshot_due.add(key)
+        else:
+            chat.journal_seq += 1
+            entry["seq"] = chat.journal_seq
+            entry["last_accessed"] = chat.last_accessed
+            self._pending_entries.setdefault(key, []).append(entry)
+            chat.entries_since_snapshot += 1
+            if chat.entries_since_snapshot >= self.compact_every:
+                self._snapshot_due.add(key)
+        self._schedule(key)
+        self._update_index(chat)
+
     def _save_chat(self, chat: Chat):
+        """Programa un snapshot completo del chat (compactando su journal)."""
+        key = (chat.wallet_address, chat.chat_id)
+        self._snapshot_due.add(key)
+        self._schedule(key)
+        self._update_index(chat)
+
+    def _schedule(self, key: tuple) -> None:
+        if self.writer.running:
+            self.writer.mark_dirty(key)
+            return
+        # Sin worker (p. ej. scripts o arranque) se escribe de forma síncrona
+        job = self._prepare_flush(key)
+        if job is None:
+            return
         try:
-            chat_path = self._get_chat_path(chat.wallet_address, chat.chat_id)
-            with open(chat_path, 'w', encoding='utf-8') as f:
-                json.dump(chat.to_dict(), f, indent=2, ensure_ascii=False)
+            result = self._write_job(*job)
         except Exception as e:
-            logger.error(f"Error saving chat {chat.chat_id}: {str(e)}")
+            if not isinstance(e, StaleChatError):
+                logger.error(f"Error saving chat {key[1]}: {str(e)}")
+            self._on_write_error(key, job, e)
+            return
+        self._on_write_done(key, job, result)
+
+    def _prepare_flush(self, key: tuple) -> tuple | None:
+        """Recoge en el event loop lo que hay que escribir para una clave."""
+        wallet_address, chat_id = key
+        if chat_id == INDEX_KEY:
+            index = {cid: dict(entry) for cid, entry in self.index.get(wallet_address, {}).items()}
+            return ("index", key, index)
+
+        entries = self._pending_entries.pop(key, [])
+        if key in self._deleted:
+            self._deleted.discard(key)
+            self._snapshot_due.discard(key)
+            self._in_flight.add(key)
+            return ("delete", key)
+
+        snapshot = None
+        if key in self._snapshot_due:
+            self._snapshot_due.discard(key)
+            chat = self._loaded.get(key)
+            if chat:
+                # Copia superficial: el hilo escritor no debe ver mutaciones posteriores
+                snapshot = chat.to_dict()
+                snapshot["messages"] = list(chat.messages)
+                snapshot["fileHistory"] = chat.file_history_dict()
+                snapshot["journal_seq"] = chat.journal_seq
+                chat.entries_since_snapshot = 0
+
+        if not entries and snapshot is None:
+            return None
+        self._in_flight.add(key)
+        # `progress` lo rellena el hilo escritor y lo aplica el event loop al terminar
+        return ("chat", key, entries, snapshot, {"expected_version": self._versions.get(key)})
+
+    def _write_job(self, kind: str, key: tuple, *args) -> None:
+        """Escribe en disco un trabajo preparado. Se ejecuta en el pool del worker.
+
+        No modifica el estado del manager (índice, versiones): lo que cambia se
+        anota en el `progress` del trabajo y lo aplica el event loop en
+        `_on_write_done` o `_on_write_error`.
+        """
+        start = time.perf_counter()
+        try:
+            wallet_address, chat_id = key
+            if kind == "index":
+                self.store.write_index(wallet_address, args[0])
+                return
+            if kind == "delete":
+                self.store.delete(wallet_address, chat_id)
+                return
+            entries, snapshot, progress = args
+            # Con un backend compartido, la escritura falla (StaleChatError) si otro proceso escribió el chat
+            version = progress["expected_version"]
+            if entries:
+                version = self.store.append(wallet_address, chat_id, entries, expected_version=version)
+                # Escrituras propias: no deben provocar una recarga
+                progress["version"] = version
+                # Ya persistidas: si el snapshot falla, _on_write_error no debe reaplicarlas
+                del entries[:]
+            if snapshot is not None:
+                version = self.store.write_snapshot(wallet_address, chat_id, snapshot, expected_version=version)
+                progress["version"] = version
+            # Tamaños en disco ya cubiertos por el índice; permiten detectar entradas desfasadas
+            progress["sizes"] = self.store.file_sizes(wallet_address, chat_id)
+        finally:
+            observe_stage("save_chat", time.perf_counter() - start, kind)
+
+    def _on_write_done(self, key: tuple, job: tuple, result=None) -> None:
+        """Aplica en el event loop lo que ha cambiado una escritura terminada."""
+        self._in_flight.discard(key)
+        if job[0] != "chat":
+            return
+        progress = job[4]
+        if progress.get("version") is not None:
+            self._versions[key] = progress["version"]
+        entry = self.index.get(key[0], {}).get(key[1])
+        if entry is not None and "sizes" in progress:
+            entry["snapshot_bytes"], entry["journal_bytes"] = progress["sizes"]
+
+    def _on_write_error(self, key: tuple, job: tuple, error: Exception) -> None:
+        """Vuelve a encolar un trabajo fallido para reintentarlo en el siguiente flush."""
+        # Lo que llegó a escribirse antes del fallo (p. ej. el journal sin el snapshot) cuenta
+        self._on_write_done(key, job)
+        kind = job[0]
+        if isinstance(error, StaleChatError) and kind == "chat":
+            self._reconcile(key, job[2], job[3] is not None)
+            return
+        if kind == "delete":
+            self._deleted.add(key)
+        elif kind == "chat":
+            entries, snapshot = job[2], job[3]
+            if entries:
+                self._pending_entries[key] = entries + self._pending_entries.get(key, [])
+            if snapshot is not None:
+                self._snapshot_due.add(key)
+        if self.writer.running:
+            self.writer.mark_dirty(key)
+
+    def _reconcile(self, key: tuple, entries: list, snapshot_due: bool) -> None:
+        """Otro proceso escribió el chat: lo recarga y reaplica encima los cambios locales sin escribir."""
+        wallet_address, chat_id = key
+        local_entries = entries + self._pending_entries.pop(key, [])
+        chat = self._read_chat(wallet_address, chat_id)
+        if chat is None:
+            # Borrado por otro worker: los cambios locales ya no tienen dónde ir
+            logger.warning(f"Dropping {len(local_entries)} changes to chat {chat_id} deleted by another worker")
+            self._loaded.pop(key, None)
+            self._last_used.pop(key, None)
+            self._snapshot_due.discard(key)
+            self.index.get(wallet_address, {}).pop(chat_id, None)
+            return
+        logger.info(f"Chat {chat_id} changed in another worker; reapplying {len(local_entries)} local changes")
+        pending = []
+        for entry in local_entries:
+            entry = dict(entry, seq=chat.journal_seq + 1)
+            chat.apply_journal_entry(entry)
+            pending.append(entry)
+        if pending:
+            self._pending_entries[key] = pending
+        if snapshot_due or chat.entries_since_snapshot >= self.compact_every:
+            self._snapshot_due.add(key)
+        # El objeto cambia: HistoryStore lo detecta y reconstruye su historial
+        self._touch(key, chat)
+        self._update_index(chat)
+        if self.writer.running:
+            self.writer.mark_dirty(key)
+        else:
+            self._schedule(key)
 
     def delete_chat(self, wallet_address: str, chat_id: str) -> None:
         """Elimina un chat específico."""
@@ -216,16 +672,18 @@ class ChatManager:
             if not chat:
                 raise ValueError(f"Chat {chat_id} not found for wallet {wallet_address}")
             
-            # Eliminar el archivo del chat
-            chat_path = self._get_chat_path(wallet_address, chat_id)
-            if os.path.exists(chat_path):
-                os.remove(chat_path)
+            # Eliminar los archivos del chat (snapshot y journal) tras las escrituras pendientes
+            key = (wallet_address, chat_id)
+            self._deleted.add(key)
+            self._schedule(key)
             
-            # Eliminar de la memoria
-            if wallet_address in self.chats and chat_id in self.chats[wallet_address]:
-                del self.chats[wallet_address][chat_id]
+            # Eliminar de la memoria y del índice
+            self._loaded.pop(key, None)
+            self._last_used.pop(key, None)
+            self.index.get(wallet_address, {}).pop(chat_id, None)
+            self._schedule((wallet_address, INDEX_KEY))
             
             logger.info(f"Deleted chat {chat_id} for wallet {wallet_address}")
         except Exception as e:
             logger.error(f"Error deleting chat {chat_id}: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
@@ -0,0 +1,188 @@
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "optimizer": {"enabled": True, "runs": 200},
+    "outputSelection": {"*": {"*": ["abi", "evm.bytecode.object"]}}
+}
+
+def _run_solc(solc_path: str, source_name: str, source: str, settings: Dict, base_path: str | None,
+              include_paths: List[str], timeout: float) -> Dict:
+    """Compila con `solc --standard-json` y normaliza la salida. Se ejecuta en el pool de procesos."""
+    standard_input = json.dumps({
+        "language": "Solidity",
+        "sources": {source_name: {"content": source}},
+        "settings": settings
+    })
+    command = [solc_path, "--standard-json"]
+    if base_path:
+        # Resuelve imports relativos al proyecto y a las rutas de librerías (p. ej. node_modules)
+        command += ["--base-path", base_path]
+        for path in include_paths:
+            command += ["--include-path", path]
+    completed = subprocess.run(command, input=standard_input, capture_output=True, text=True, timeout=timeout)
+    if not completed.stdout:
+        return {
+            "success": False,
+            "errors": [{"line": 1, "message": f"solc failed: {completed.stderr.strip()}", "severity": "error"}],
+            "warnings": [],
+            "contracts": {}
+        }
+
+    output = json.loads(completed.stdout)
+    source_bytes = source.encode("utf-8")
+    errors, warnings = [], []
+    for diagnostic in output.get("errors", []):
+        location = diagnostic.get("sourceLocation") or {}
+        line = 1
+        if location.get("file") == source_name and location.get("start", -1) >= 0:
+            # Los offsets de solc son en bytes UTF-8
+            line = source_bytes.count(b"\n", 0, location["start"]) + 1
+        entry = {
+            "line": line,
+            "message": diagnostic.get("message", ""),
+            "severity": diagnostic.get("severity", "error"),
+            "type": diagnostic.get("type"),
+            "file": location.get("file")
+        }
+        (errors if entry["severity"] == "error" else warnings).append(entry)
+
+    contracts = {}
+    for file_contracts in output.get("contracts", {}).values():
+        for name, data in file_contracts.items():
+            contracts[name] = {
+                "abi": data.get("abi", []),
+                "bytecode": data.get("evm", {}).get("bytecode", {}).get("object", "")
+            }
+
+    return {
+        "success": not errors,
+        "errors": errors,
+        "warnings": warnings,
+        "contracts": contracts
+    }
+
+def basic_checks(source: str) -> Dict:
+    """Validación mínima cuando no hay un solc instalado."""
+    errors = []
+    if "pragma solidity" not in source:
+        errors.append({"line": 1, "message": "Missing pragma solidity directive", "severity": "error"})
+    if "contract" not in source:
+        errors.append({"line": 1, "message": "No contract definition found", "severity": "error"})
+    return {"success": not errors, "errors": errors, "warnings": [], "contracts": {}}
+
+class SolcCompiler:
+    """Compilador Solidity sobre un `solc` local con caché de artefactos por contenido.
+
+    Las compilaciones se ejecutan en un pool de procesos para no bloquear el
+    event loop. El resultado (ABI, bytecode y diagnósticos) se cachea por el
+    hash del código, el nombre del archivo, los settings y la versión de solc;
+    recompilar un contrato sin cambios no lanza ningún proceso.
+    """
+
+    def __init__(self, solc_path: str | None = None, base_path: str | None = None, include_paths: List[str] | None = None,
+                 settings: Dict | None = None, max_workers: int | None = None, cache_size: int = 256):
+        self.solc_path = solc_path or os.getenv("SOLC_BINARY") or shutil.which("solc")
+        self.base_path = base_path
+        env_paths = os.getenv("SOLC_INCLUDE_PATHS")
+        if include_paths is None and env_paths:
+            include_paths = [path for path in env_paths.split(os.pathsep) if path]
+        elif include_paths is None and base_path:
+            include_paths = [
+                path for path in (os.path.join(base_path, "node_modules"), os.path.join(base_path, "..", "node_modules"))
+                if os.path.isdir(path)
+            ]
+        self.include_paths = include_paths or []
+        self.settings = settings or DEFAULT_SETTINGS
+        self.max_workers = max_workers or int(os.getenv("SOLC_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.timeout = float(os.getenv("SOLC_TIMEOUT", "60"))
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, Dict] = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._executor: ProcessPoolExecutor | None = None
+        self._version: str | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def available(self) -> bool:
+        return bool(self.solc_path)
+
+    async def _get_version(self) -> str:
+        """Versión de solc (se lee una vez, sin bloquear el event loop)."""
+        if self._version is None:
+            process = None
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.solc_path, "--version",
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+                )
+                stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
+                version = stdout.decode("utf-8", "replace").strip().splitlines()[-1]
+            except Exception as e:
+                if process is not None and process.returncode is None:
+                    process.kill()
+                logger.warning(f"Could not read solc version: {str(e)}")
+                version = "unknown"
+            # Otra llamada concurrente puede haberla leído ya
+            self._version = self._version or version
+        return self._version
+
+    def cache_key(self, source: str, source_name: str, settings: Dict, version: str) -> str:
+        digest = hashlib.sha256()
+        for part in (version, json.dumps(settings, sort_keys=True), source_name, source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def compile(self, source: str, source_name: str = "Contract.sol", settings: Dict | None = None) -> Dict:
+        """Compila un código fuente y devuelve {success, errors, warnings, contracts, cached}."""
+        if not self.available:
+            return dict(basic_checks(source), cached=False)
+
+        settings = settings or self.settings
+        key = self.cache_key(source, source_name, settings, await self._get_version())
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return dict(cached, cached=True)
+
+        # Compilaciones idénticas simultáneas comparten el mismo proceso
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            return dict(await asyncio.shield(pending), cached=True)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        future = loop.run_in_executor(
+            self._executor, _run_solc, self.solc_path, source_name, source, settings,
+            self.base_path, self.include_paths, self.timeout
+        )
+        self._in_flight[key] = future
+        try:
+            result = await future
+        finally:
+            self._in_flight.pop(key, None)
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,362 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class StaleChatError(Exception):
+    """La versión del chat en el almacenamiento ya no es la que cargó este proceso."""
+
+    # Conflicto esperado entre workers: se resuelve recargando y reintentando
+    retryable = True
+
+    def __init__(self, wallet_address: str, chat_id: str, expected: int | None, current: int | None):
+        super().__init__(f"Chat {chat_id} changed in storage (expected version {expected}, found {current})")
+        self.wallet_address = wallet_address
+        self.chat_id = chat_id
+        self.expected = expected
+        self.current = current
+
+class StateBackend(ABC):
+    """Interfaz del almacenamiento de chats que usa `ChatManager`.
+
+    Un chat se persiste como un snapshot más un journal de entradas con `seq`
+    creciente; el índice de una wallet es un dict {chat_id: entrada}.
+    Los backends compartidos entre procesos (`shared = True`) exponen además
+    una versión por chat que cambia con cada escritura, para que cada proceso
+    detecte cuándo su copia en memoria está desfasada. Sus escrituras aceptan
+    `expected_version` y lanzan `StaleChatError` si otro proceso escribió el
+    chat después; así ningún proceso escribe sobre una copia desfasada.
+    """
+
+    shared = False
+
+    @abstractmethod
+    def list_wallets(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def list_chats(self, wallet_address: str) -> List[str]:
+        ...
+
+    @abstractmethod
+    def load_index(self, wallet_address: str) -> Dict | None:
+        ...
+
+    @abstractmethod
+    def write_index(self, wallet_address: str, index: Dict) -> None:
+        ...
+
+    @abstractmethod
+    def append(self, wallet_address: str, chat_id: str, entries: List[Dict],
+               expected_version: int | None = None) -> int | None:
+        ...
+
+    @abstractmethod
+    def write_snapshot(self, wallet_address: str, chat_id: str, data: Dict, truncate_journal: bool = True,
+                       expected_version: int | None = None) -> int | None:
+        ...
+
+    @abstractmethod
+    def load(self, wallet_address: str, chat_id: str) -> Tuple[Dict | None, List[Dict]]:
+        ...
+
+    @abstractmethod
+    def delete(self, wallet_address: str, chat_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def file_sizes(self, wallet_address: str, chat_id: str) -> Tuple[int, int]:
+        ...
+
+    def chat_version(self, wallet_address: str, chat_id: str) -> int | None:
+        """Versión actual del chat en el almacenamiento (None si el backend no la lleva)."""
+        return None
+
+    def close(self) -> None:
+        pass
+
+class SqliteStateBackend(StateBackend):
+    """Backend SQLite (modo WAL) seguro para varios procesos.
+
+    Tablas:
+      chats(wallet, chat_id, entry, snapshot, journal_seq, version, deleted)
+      chat_events(id, wallet, chat_id, seq, entry)
+
+    `entry` es la entrada del índice. Las escrituras del índice solo
+    actualizan o insertan filas (nunca borran), así que dos procesos con
+    índices distintos no se pisan; los chats borrados quedan como lápidas
+    (`deleted = 1`) y una escritura tardía del índice no los resucita. Cada
+    escritura de un chat incrementa `version`.
+
+    No usa `BlobStore`: los textos grandes se guardan en línea en cada fila.
+    Los contadores de referencias del almacén de blobs viven en la memoria de
+    un proceso, y con varios workers uno podría borrar un blob que otro
+    todavía usa; la deduplicación solo aplica al backend de archivos.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, busy_timeout: float | None = None):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.busy_timeout = busy_timeout if busy_timeout is not None else float(os.getenv("CHAT_DB_BUSY_TIMEOUT", "10"))
+        # Una conexión por hilo (event loop e hilos del escritor)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _create_schema(self) -> None:
+        connection = self._connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS chats (
+                wallet TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                entry TEXT,
+                snapshot TEXT,
+                journal_seq INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (wallet, chat_id)
+            );
+            CREATE TABLE IF NOT EXISTS chat_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                wallet TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                entry TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chat_events_chat ON chat_events (wallet, chat_id, seq);
+        """)
+
+    def _transaction(self, immediate: bool = True):
+        return _Transaction(self._connection(), immediate)
+
+    def list_wallets(self) -> List[str]:
+        rows = self._connection().execute("SELECT DISTINCT wallet FROM chats WHERE deleted = 0").fetchall()
+        return [row[0] for row in rows]
+
+    def list_chats(self, wallet_address: str) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT chat_id FROM chats WHERE wallet = ? AND deleted = 0 AND snapshot IS NOT NULL",
+            (wallet_address,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def load_index(self, wallet_address: str) -> Dict | None:
+        rows = self._connection().execute(
+            "SELECT chat_id, entry FROM chats WHERE wallet = ? AND deleted = 0 AND entry IS NOT NULL",
+            (wallet_address,)
+        ).fetchall()
+        if not rows:
+            return None
+        return {chat_id: json.loads(entry) for chat_id, entry in rows}
+
+    def write_index(self, wallet_address: str, index: Dict) -> None:
+        with self._transaction() as connection:
+            connection.executemany(
+                """INSERT INTO chats (wallet, chat_id, entry) VALUES (?, ?, ?)
+                   ON CONFLICT (wallet, chat_id) DO UPDATE SET entry = excluded.entry
+                   WHERE chats.deleted = 0""",
+                [
+                    (wallet_address, chat_id, json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+                    for chat_id, entry in index.items()
+                ]
+            )
+
+    def _bump(self, connection: sqlite3.Connection, wallet_address: str, chat_id: str) -> int | None:
+        connection.execute(
+            """INSERT INTO chats (wallet, chat_id, version) VALUES (?, ?, 1)
+               ON CONFLICT (wallet, chat_id) DO UPDATE SET version = chats.version + 1
+               WHERE chats.deleted = 0""",
+            (wallet_address, chat_id)
+        )
+        row = connection.execute(
+            "SELECT version FROM chats WHERE wallet = ? AND chat_id = ?", (wallet_address, chat_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _check_version(self, connection: sqlite3.Connection, wallet_address: str, chat_id: str,
+                       expected_version: int | None) -> None:
+        """Compara la versión dentro de la transacción de escritura (ya con el lock tomado)."""
+        if expected_version is None:
+            return
+        row = connection.execute(
+            "SELECT version, deleted FROM chats WHERE wallet = ? AND chat_id = ?", (wallet_address, chat_id)
+        ).fetchone()
+        current = None if row is None else (-1 if row[1] else row[0])
+        if current != expected_version:
+            raise StaleChatError(wallet_address, chat_id, expected_version, current)
+
+    def append(self, wallet_address: str, chat_id: str, entries: List[Dict],
+               expected_version: int | None = None) -> int | None:
+        if not entries:
+            return None
+        with self._transaction() as connection:
+            self._check_version(connection, wallet_address, chat_id, expected_version)
+            connection.executemany(
+                "INSERT INTO chat_events (wallet, chat_id, seq, entry) VALUES (?, ?, ?, ?)",
+                [
+                    (wallet_address, chat_id, entry.get("seq", 0),
+                     json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+                    for entry in entries
+                ]
+            )
+            return self._bump(connection, wallet_address, chat_id)
+
+    def write_snapshot(self, wallet_address: str, chat_id: str, data: Dict, truncate_journal: bool = True,
+                       expected_version: int | None = None) -> int | None:
+        journal_seq = data.get("journal_seq", 0)
+        with self._transaction() as connection:
+            # Sin esta comprobación, el DELETE de abajo borraría entradas de otro proceso no incluidas en el snapshot
+            self._check_version(connection, wallet_address, chat_id, expected_version)
+            version = self._bump(connection, wallet_address, chat_id)
+            connection.execute(
+                "UPDATE chats SET snapshot = ?, journal_seq = ? WHERE wallet = ? AND chat_id = ? AND deleted = 0",
+                (json.dumps(data, ensure_ascii=False, separators=(",", ":")), journal_seq, wallet_address, chat_id)
+            )
+            if truncate_journal:
+                # Solo las entradas ya incluidas en el snapshot
+                connection.execute(
+                    "DELETE FROM chat_events WHERE wallet = ? AND chat_id = ? AND seq <= ?",
+                    (wallet_address, chat_id, journal_seq)
+                )
+            return version
+
+    def load(self, wallet_address: str, chat_id: str) -> Tuple[Dict | None, List[Dict]]:
+        # Lectura consistente de snapshot + journal sin tomar el lock de escritura
+        with self._transaction(immediate=False) as connection:
+            row = connection.execute(
+                "SELECT snapshot, journal_seq FROM chats WHERE wallet = ? AND chat_id = ? AND deleted = 0",
+                (wallet_address, chat_id)
+            ).fetchone()
+            if row is None:
+                return None, []
+            snapshot_json, journal_seq = row
+            events = connection.execute(
+                "SELECT entry FROM chat_events WHERE wallet = ? AND chat_id = ? AND seq > ? ORDER BY id",
+                (wallet_address, chat_id, journal_seq)
+            ).fetchall()
+        snapshot = json.loads(snapshot_json) if snapshot_json else None
+        return snapshot, [json.loads(entry) for (entry,) in events]
+
+    def delete(self, wallet_address: str, chat_id: str) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM chat_events WHERE wallet = ? AND chat_id = ?", (wallet_address, chat_id))
+            connection.execute(
+                """INSERT INTO chats (wallet, chat_id, deleted) VALUES (?, ?, 1)
+                   ON CONFLICT (wallet, chat_id) DO UPDATE SET
+                       entry = NULL, snapshot = NULL, deleted = 1, version = chats.version + 1""",
+                (wallet_address, chat_id)
+            )
+
+    def file_sizes(self, wallet_address: str, chat_id: str) -> Tuple[int, int]:
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT length(snapshot) FROM chats WHERE wallet = ? AND chat_id = ?", (wallet_address, chat_id)
+        ).fetchone()
+        events = connection.execute(
+            "SELECT coalesce(sum(length(entry)), 0) FROM chat_events WHERE wallet = ? AND chat_id = ?",
+            (wallet_address, chat_id)
+        ).fetchone()
+        return (row[0] or 0) if row else 0, events[0]
+
+    def chat_version(self, wallet_address: str, chat_id: str) -> int | None:
+        row = self._connection().execute(
+            "SELECT version, deleted FROM chats WHERE wallet = ? AND chat_id = ?", (wallet_address, chat_id)
+        ).fetchone()
+        if row is None:
+            return None
+        # Un chat borrado nunca coincide con la versión que se tenga en memoria
+        return -1 if row[1] else row[0]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+class _Transaction:
+    """Transacción explícita. Las de escritura usan BEGIN IMMEDIATE: toman el lock
+    al empezar y así evitan deadlocks entre procesos al promocionar una lectura."""
+
+    def __init__(self, connection: sqlite3.Connection, immediate: bool = True):
+        self.connection = connection
+        self.immediate = immediate
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute("BEGIN IMMEDIATE" if self.immediate else "BEGIN")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
+        return False
+
+def sqlite_path(base_path: str) -> str:
+    return os.getenv("CHAT_DB_PATH") or os.path.join(base_path, "chats.db")
+
+def create_state_backend(base_path: str, kind: str | None = None) -> StateBackend:
+    """Crea el backend de estado configurado (CHAT_BACKEND: "file" o "sqlite")."""
+    kind = kind or os.getenv("CHAT_BACKEND", "file")
+    if kind == "sqlite":
+        path = sqlite_path(base_path)
+        logger.info(f"Using SQLite chat backend at {path}")
+        return SqliteStateBackend(path)
+    if kind == "file":
+        # Import diferido: chat_store importa la interfaz de este módulo
+        from chat_store import ChatStore
+        return ChatStore(base_path)
+    raise ValueError(f"Unknown chat backend: {kind}")
+
+def import_chats(source: StateBackend, target: StateBackend) -> Tuple[int, int]:
+    """Copia los chats de un backend a otro (p. ej. de archivos a SQLite).
+
+    Los chats que ya existen en el destino se omiten, así que se puede
+    repetir sin duplicar nada. Devuelve (importados, omitidos).
+    """
+    imported = skipped = 0
+    for wallet_address in source.list_wallets():
+        stored_index = source.load_index(wallet_address) or {}
+        index = {}
+        for chat_id in source.list_chats(wallet_address):
+            if target.chat_version(wallet_address, chat_id) is not None:
+                skipped += 1
+                continue
+            snapshot, entries = source.load(wallet_address, chat_id)
+            if snapshot is None:
+                logger.warning(f"Skipping chat {chat_id} of {wallet_address}: no snapshot")
+                skipped += 1
+                continue
+            target.write_snapshot(wallet_address, chat_id, snapshot, truncate_journal=False)
+            target.append(wallet_address, chat_id, entries)
+            if chat_id in stored_index:
+                index[chat_id] = stored_index[chat_id]
+            imported += 1
+        # Las entradas que falten se reconstruyen desde los chats al arrancar
+        if index:
+            target.write_index(wallet_address, index)
+    return imported, skipped
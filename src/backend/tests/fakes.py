@@ -0,0 +1,44 @@
+"""Dobles de prueba del cliente de Anthropic para los tests del backend."""
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+class FakeStream:
+    """Stream de eventos como el de `messages.create(stream=True)`."""
+
+    def __init__(self, chunks: List[str], delay: float = 0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.response = SimpleNamespace(aclose=self._aclose)
+        self.closed = False
+
+    async def _aclose(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        yield SimpleNamespace(type="message_start", message=SimpleNamespace(usage=None))
+        for chunk in self.chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(text=chunk))
+
+class FakeAnthropic:
+    """Cliente que responde con textos predefinidos, en orden, y registra las peticiones."""
+
+    def __init__(self, responses: List[str], delay: float = 0.0, create_delay: float = 0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.create_delay = create_delay
+        self.requests = []
+        self.messages = SimpleNamespace(create=self._create)
+
+    async def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.create_delay:
+            await asyncio.sleep(self.create_delay)
+        text = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        # Fragmentos pequeños para que las respuestas se intercalen entre turnos concurrentes
+        return FakeStream([text[i:i + 16] for i in range(0, len(text), 16)], self.delay)
@@ -0,0 +1,42 @@
+import json
+import os
+
+from blob_store import BlobStore
+
+def blob(text: str) -> dict:
+    return {BlobStore.digest(text): text}
+
+def test_refs_are_persisted_per_owner(tmp_path):
+    store = BlobStore(str(tmp_path), min_bytes=0)
+    shared, first, second = blob("shared"), blob("first"), blob("second")
+    store.add_refs("0xa/chat1", shared)
+    store.add_refs("0xb/chat2", shared)
+    other_refs = tmp_path / "refs" / "0xb" / "chat2.refs"
+    other_before = other_refs.stat().st_mtime_ns
+
+    # Añadir referencias anexa al archivo del chat, sin reescribir un índice global ni los de otros chats
+    store.add_refs("0xa/chat1", first)
+    store.add_refs("0xa/chat1", second)
+    assert not (tmp_path / "refs.json").exists()
+    assert (tmp_path / "refs" / "0xa" / "chat1.refs").read_text().split() == [*shared, *first, *second]
+    assert other_refs.stat().st_mtime_ns == other_before
+
+    # Otro proceso reconstruye los contadores desde los archivos por chat
+    reloaded = BlobStore(str(tmp_path), min_bytes=0)
+    assert reloaded.stats()["owners"] == 2 and reloaded.stats()["blobs"] == 3
+    reloaded.release("0xa/chat1")
+    assert not (tmp_path / "refs" / "0xa" / "chat1.refs").exists()
+    assert reloaded.get(next(iter(shared))) == "shared"
+    assert not os.path.exists(reloaded._blob_path(next(iter(first))))
+
+def test_legacy_refs_json_is_migrated(tmp_path):
+    store = BlobStore(str(tmp_path), min_bytes=0)
+    store.add_refs("0xa/chat1", blob("legacy"))
+    digest = next(iter(blob("legacy")))
+    os.remove(tmp_path / "refs" / "0xa" / "chat1.refs")
+    (tmp_path / "refs.json").write_text(json.dumps({"0xa/chat1": [digest]}))
+
+    migrated = BlobStore(str(tmp_path), min_bytes=0)
+    assert migrated.stats()["blobs"] == 1
+    assert not (tmp_path / "refs.json").exists()
+    assert (tmp_path / "refs" / "0xa" / "chat1.refs").read_text().split() == [digest]
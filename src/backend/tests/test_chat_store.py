@@ -0,0 +1,13 @@
+import os
+
+from chat_store import ChatStore
+
+WALLET = "0x" + "7" * 40
+
+def test_append_is_fsynced(tmp_path, monkeypatch):
+    store = ChatStore(str(tmp_path))
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (synced.append(fd), real_fsync(fd)))
+    store.append(WALLET, "chat1", [{"seq": 1, "op": "message", "message": {"id": "1", "text": "hi"}}])
+    assert synced
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from actions import CompilationActions
+
+BROKEN = "contract Broken { uint x = }"
+
+class FakeFileManager:
+    """Compila con éxito solo el código que contiene `good`."""
+
+    def __init__(self, good: str | None):
+        self.good = good
+        self.files = {"contracts/Token.sol": BROKEN}
+
+    async def read_file(self, path):
+        return self.files[path]
+
+    async def write_file(self, path, content):
+        self.files[path] = content
+
+    async def compile_source(self, content, path):
+        if self.good and self.good in content:
+            return {"success": True, "errors": []}
+        return {"success": False, "errors": [{"line": 1, "message": "Expected expression"}]}
+
+class FakeFixer:
+    def __init__(self):
+        self.calls = 0
+        self.messages = SimpleNamespace(create=self._create)
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        code = f"contract Fixed{self.calls} {{ uint x = {self.calls}; }}"
+        return SimpleNamespace(content=[SimpleNamespace(text=f"```solidity\n{code}\n```")], usage=None)
+
+def test_fix_returns_bool_and_writes_the_winner():
+    files, client = FakeFileManager(good="Fixed"), FakeFixer()
+    fixed = asyncio.run(CompilationActions(client, files).fix_compilation_errors("contracts/Token.sol"))
+    assert fixed is True
+    assert files.files["contracts/Token.sol"].startswith("contract Fixed")
+
+def test_unfixable_file_is_false_within_the_attempt_limit():
+    files, client = FakeFileManager(good=None), FakeFixer()
+    actions = CompilationActions(client, files)
+    actions.candidates_per_round, actions.max_fix_rounds, actions.max_compilation_attempts = 3, 4, 5
+    assert asyncio.run(actions.fix_compilation_errors("contracts/Token.sol")) is False
+    assert client.calls == 5
+    assert files.files["contracts/Token.sol"] == BROKEN
+
+    report = asyncio.run(CompilationActions(FakeFixer(), files).fix_compilation_errors_report("contracts/Token.sol"))
+    assert report["success"] is False and report["rounds"] == 2 and report["errors"]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import pytest
+
+import connection_manager
+from connection_manager import ConnectionManager
+from file_manager import FileManager
+from session_manager import ChatManager
+
+WALLET = "0x" + "5" * 40
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = code
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(connection_manager, "FileManager", lambda: FileManager(base_path=str(tmp_path / "files")))
+    monkeypatch.setattr(connection_manager, "ChatManager", lambda: ChatManager(base_path=str(tmp_path / "chats")))
+    (tmp_path / "files").mkdir()
+    manager = ConnectionManager()
+    yield manager
+    manager.chat_manager.close()
+    manager.file_manager.close()
+
+def test_stale_socket_disconnect_keeps_the_new_connection(manager):
+    async def scenario():
+        old, new = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(old, WALLET)
+        await manager.connect(new, WALLET)
+        manager.start_generation(WALLET, "chat1", lambda: asyncio.sleep(10))
+        queue = manager.outbound[WALLET]
+
+        # El socket antiguo termina después de la reconexión
+        manager.disconnect(WALLET, old)
+        assert manager.active_connections[WALLET] is new
+        assert manager.outbound[WALLET] is queue and not queue.closed
+        assert not manager.generations[WALLET]["chat1"].cancelled()
+        await manager.send_message({"type": "message", "content": "still here"}, WALLET)
+        await asyncio.sleep(0.05)
+        assert any("still here" in frame for frame in new.sent)
+
+        generation = manager.generations[WALLET]["chat1"]
+        manager.disconnect(WALLET, new)
+        await asyncio.sleep(0.01)
+        assert WALLET not in manager.active_connections
+        assert generation.cancelled()
+
+    asyncio.run(scenario())
+
+def test_replacing_a_connection_closes_the_old_socket(manager):
+    async def scenario():
+        old, new = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(old, WALLET)
+        await manager.connect(new, WALLET)
+        assert old.closed_with == 4000
+        assert new.closed_with is None
+        manager.disconnect(WALLET, new)
+
+    asyncio.run(scenario())
+
+def test_summary_contexts_and_paged_messages(manager):
+    chats = manager.chat_manager
+    chat_id = chats.create_chat(WALLET, "big").chat_id
+    for i in range(120):
+        chats.add_message_to_chat(WALLET, chat_id, {"id": f"m{i}", "text": "x" * 1000, "sender": "user", "timestamp": i})
+    chats.add_virtual_file_to_chat(WALLET, chat_id, "contracts/Token.sol", "contract Token {}")
+
+    async def scenario():
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, WALLET, contexts_mode="summary")
+        await asyncio.sleep(0.05)
+        manager.disconnect(WALLET, websocket)
+        return websocket.sent[0]
+
+    frame = asyncio.run(scenario())
+    # El tamaño del payload no depende del historial
+    assert len(frame) < 2000
+    summary = json.loads(frame)["content"][0]
+    assert summary["id"] == chat_id and summary["message_count"] == 120
+    assert "contracts/Token.sol" in summary["files"]
+    assert "messages" not in summary
+
+    ids, cursor = [], None
+    while True:
+        page = chats.get_messages(WALLET, chat_id, cursor=cursor, limit=50)
+        ids = [message["id"] for message in page["messages"]] + ids
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == [f"m{i}" for i in range(120)]
+
+def test_connect_reports_the_negotiated_encoding(manager):
+    async def scenario():
+        websocket = FakeWebSocket()
+        codec = await manager.connect(websocket, WALLET, encoding="cbor")
+        await asyncio.sleep(0.05)
+        manager.disconnect(WALLET, websocket)
+        return codec, websocket.sent
+
+    codec, sent = asyncio.run(scenario())
+    assert codec.name == "json"
+    assert codec.decode(sent[0])["metadata"] == {"encoding": "json"}
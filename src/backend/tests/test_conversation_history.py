@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import httpx
+from anthropic import AsyncAnthropic
+
+from actions import MessageActions
+from conversation_history import CACHE_CONTROL, PROMPT_CACHING_BETA, HistoryStore
+from session_manager import ChatManager
+from fakes import FakeAnthropic
+
+WALLET = "0x" + "1" * 40
+
+async def collect(generator):
+    return [response async for response in generator]
+
+def make_actions(client, store):
+    return MessageActions(client, None, history_store=store, wallet_address=WALLET)
+
+def test_empty_store_is_shared(tmp_path):
+    store = HistoryStore(ChatManager(base_path=str(tmp_path)))
+    assert len(store) == 0
+    assert make_actions(FakeAnthropic(["ok"]), store).conversation_histories is store
+
+def test_second_agent_sees_turn_and_rebuilds_from_chat(tmp_path):
+    chat_manager = ChatManager(base_path=str(tmp_path))
+    chat = chat_manager.create_chat(WALLET, "history")
+    chat_manager.add_message_to_chat(WALLET, chat.chat_id, {"id": "1", "text": "hi", "sender": "user", "timestamp": 1})
+    chat_manager.add_message_to_chat(WALLET, chat.chat_id, {"id": "2", "text": "hello", "sender": "ai", "timestamp": 2})
+    store = HistoryStore(chat_manager)
+
+    first = make_actions(FakeAnthropic(["Pausable added."]), store)
+    asyncio.run(collect(first.process_message("add pausable", {}, chat.chat_id)))
+
+    # Otro agente (p. ej. tras reconectar) con el mismo store ve el turno completo
+    second = make_actions(FakeAnthropic(["ok"]), store)
+    assert second.conversation_histories.get(WALLET, chat.chat_id) == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+        {"role": "user", "content": "add pausable"},
+        {"role": "assistant", "content": "Pausable added."}
+    ]
+
+    # Un store nuevo (proceso reiniciado) reconstruye el historial desde Chat.messages
+    rebuilt = HistoryStore(ChatManager(base_path=str(tmp_path)))
+    assert make_actions(FakeAnthropic(["ok"]), rebuilt).conversation_histories.get(WALLET, chat.chat_id) == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"}
+    ]
+
+def sse(*events) -> bytes:
+    return "".join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events).encode()
+
+def test_prompt_caching_request_through_the_real_sdk():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        body = sse(
+            {"type": "message_start", "message": {
+                "id": "msg_1", "type": "message", "role": "assistant", "content": [], "model": "test",
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": 12, "cache_read_input_tokens": 900, "cache_creation_input_tokens": 0,
+                          "output_tokens": 1}
+            }},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Pausable added."}},
+            {"type": "content_block_stop", "index": 0},
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+             "usage": {"output_tokens": 4}},
+            {"type": "message_stop"}
+        )
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body)
+
+    client = AsyncAnthropic(api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    store = HistoryStore()
+    store.get(WALLET, "chat1").extend([
+        {"role": "user", "content": "write a token"},
+        {"role": "assistant", "content": "Here is the token."}
+    ])
+    responses = asyncio.run(collect(make_actions(client, store).process_message("add pausable", {}, "chat1")))
+    assert "Pausable added." in [response["content"] for response in responses if response["type"] == "message_delta"]
+
+    # La petición que construye el SDK lleva los bloques cache_control y la cabecera beta
+    request = requests[0]
+    assert PROMPT_CACHING_BETA in request.headers["anthropic-beta"]
+    body = json.loads(request.content)
+    assert body["stream"] is True
+    assert body["system"][0]["cache_control"] == CACHE_CONTROL
+    assert body["messages"][-2]["content"][-1] == {"type": "text", "text": "Here is the token.", "cache_control": CACHE_CONTROL}
+    assert body["messages"][-1] == {"role": "user", "content": "add pausable"}
+
+    # El uso de la caché que informa el stream del SDK llega a las estadísticas del turno
+    stats = store.get_turn_stats(WALLET, "chat1")
+    assert stats["cache_read_input_tokens"] == 900
+    assert stats["input_tokens"] == 12
+    assert stats["output_tokens"] == 4
@@ -0,0 +1,53 @@
+import random
+
+from actions.edit_actions import EditActions
+
+RESPONSE = "\n".join([
+    "Here is the contract.",
+    "```solidity",
+    "contract A {",
+    "}",
+    "```",
+    "Suggestion: consider adding events.",
+    "```solidity",
+    "event Transfer();",
+    "```",
+    "Now we update it:",
+    "```solidity",
+    "function f() public {}",
+    "```",
+    "Done.",
+])
+
+def test_parse_actions():
+    assert EditActions().parse_actions(RESPONSE) == [
+        {"type": "message", "content": "Here is the contract."},
+        {"type": "create_file", "path": "contracts/Contract.sol", "content": "contract A {\n}"},
+        {"type": "message", "content": "Suggestion: consider adding events."},
+        {"type": "message", "content": "Example code:\n```solidity\nevent Transfer();\n```"},
+        {"type": "message", "content": "Now we update it:"},
+        {"type": "edit_file", "path": "contracts/Contract.sol", "edit": {"replace": "contract A {\n\n    function f() public {}\n}"}},
+        {"type": "message", "content": "Done."},
+    ]
+
+def test_chunked_feed_matches_whole_parse():
+    expected = EditActions().parse_actions(RESPONSE)
+    rng = random.Random(7)
+    for _ in range(50):
+        parser = EditActions().create_stream_parser()
+        actions, position = [], 0
+        while position < len(RESPONSE):
+            # Fragmentos que cortan líneas, palabras clave y marcas ``` por cualquier sitio
+            size = rng.randint(1, 12)
+            actions += parser.feed(RESPONSE[position:position + size])
+            position += size
+        assert actions + parser.close() == expected
+
+def test_actions_are_emitted_as_soon_as_they_complete():
+    parser = EditActions().create_stream_parser()
+    assert parser.feed("Here is the contract.\n```solidity\ncontract A {\n") == [
+        {"type": "message", "content": "Here is the contract."}
+    ]
+    assert parser.feed("}\n``") == []
+    assert parser.feed("`\nDone") == [{"type": "create_file", "path": "contracts/Contract.sol", "content": "contract A {\n}"}]
+    assert parser.close() == [{"type": "message", "content": "Done"}]
@@ -0,0 +1,77 @@
+import asyncio
+import os
+
+from file_manager import FileManager
+
+def walk_listing(base_path: str) -> list:
+    """El listado original: os.walk con rutas relativas a base_path."""
+    files = []
+    for root, dirs, filenames in os.walk(base_path):
+        rel_root = os.path.relpath(root, base_path)
+        for name in dirs:
+            files.append({"name": name, "path": os.path.join(rel_root, name).replace("\\", "/"), "type": "directory"})
+        for name in filenames:
+            files.append({"name": name, "path": os.path.join(rel_root, name).replace("\\", "/"), "type": "file"})
+    return files
+
+def by_path(files: list) -> list:
+    return sorted(files, key=lambda entry: entry["path"])
+
+def test_list_files_keeps_the_os_walk_format(tmp_path):
+    for path in ("contracts/Token.sol", "contracts/lib/Math.sol", "node_modules/pkg/index.js", "README.md"):
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text(path)
+    manager = FileManager(base_path=str(tmp_path))
+    try:
+        listed = asyncio.run(manager.list_files())
+        assert by_path(listed) == by_path(walk_listing(str(tmp_path)))
+        # Con los patrones del watcher se omite node_modules
+        filtered = asyncio.run(manager.list_files(ignore=manager.watcher.ignore))
+        assert not any("node_modules" in entry["path"] for entry in filtered)
+    finally:
+        manager.close()
+
+def test_ranges_with_unusual_separators_match_splitlines(tmp_path):
+    # \x0c y \u2028 no los modela el índice de líneas; el archivo supera un fragmento de stream_file
+    lines = [f"line {i}" for i in range(20000)]
+    separators = ["\n", "\r\n", "\x0c", "\u2028", "\r"]
+    content = "".join(line + separators[i % len(separators)] for i, line in enumerate(lines))
+    (tmp_path / "odd.txt").write_text(content, encoding="utf-8", newline="")
+    manager = FileManager(base_path=str(tmp_path))
+    try:
+        ranges = [(1, 3), (0, 5), (9999, 10003), (19998, 30000), (5, 2), (1, -19997)]
+        results = asyncio.run(manager.get_file_ranges("odd.txt", ranges))
+        # Referencia: lo que devolvía get_file_content con el archivo completo en memoria
+        expected = asyncio.run(manager.read_file("odd.txt")).splitlines()
+        assert results == ["\n".join(expected[max(start, 1) - 1:min(end, len(expected))]) for start, end in ranges]
+    finally:
+        manager.close()
+
+def test_repeated_listings_come_from_the_tree_index(tmp_path):
+    for i in range(5):
+        os.makedirs(tmp_path / "contracts" / f"pkg{i}")
+        (tmp_path / "contracts" / f"pkg{i}" / "Token.sol").write_text("contract Token {}")
+    manager = FileManager(base_path=str(tmp_path))
+    scans = []
+    scan = manager.tree_index.scan
+    manager.tree_index.scan = lambda directory: (scans.append(directory), scan(directory))[1]
+    try:
+        async def scenario():
+            batches = [batch async for batch in manager.iter_files("contracts", batch_size=4)]
+            assert all(len(batch) <= 4 for batch in batches)
+            first = [entry for batch in batches for entry in batch]
+            assert len(first) == 10 and len(scans) == 6
+
+            scans.clear()
+            assert await manager.list_files("contracts") == first
+            assert scans == []
+
+            # Las escrituras propias actualizan el índice sin volver a leer el directorio
+            await manager.write_file("contracts/pkg0/Vault.sol", "contract Vault {}")
+            top = await manager.list_files("contracts/pkg0", max_depth=1)
+            assert [entry["path"] for entry in top] == ["contracts/pkg0/Token.sol", "contracts/pkg0/Vault.sol"]
+            assert scans == []
+
+        asyncio.run(scenario())
+    finally:
+        manager.close()
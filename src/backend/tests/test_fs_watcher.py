@@ -0,0 +1,40 @@
+import os
+import time
+
+from file_manager import FileManager
+from fs_watcher import FileSystemWatcher
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_one_recursive_watch_per_root_and_ignored_paths_filtered(tmp_path):
+    for i in range(30):
+        os.makedirs(tmp_path / "src" / f"dir{i}")
+    os.makedirs(tmp_path / "node_modules" / "pkg")
+    received = []
+    watcher = FileSystemWatcher(str(tmp_path), received.append, debounce=0.05)
+    watcher.start()
+    try:
+        assert len(watcher.observer.emitters) == 1
+        (tmp_path / "node_modules" / "pkg" / "index.js").write_text("ignored")
+        (tmp_path / "src" / "dir7" / "Token.sol").write_text("contract Token {}")
+        assert wait_for(lambda: any("src/dir7/Token.sol" in changes for changes in received))
+        assert not any(path.startswith("node_modules") for changes in received for path in changes)
+    finally:
+        watcher.stop()
+
+def test_failed_watch_falls_back_to_no_watching(tmp_path, monkeypatch):
+    def no_inotify(*args, **kwargs):
+        raise OSError(24, "inotify instance limit reached")
+
+    monkeypatch.setattr("watchdog.observers.api.BaseObserver.schedule", no_inotify)
+    manager = FileManager(base_path=str(tmp_path))
+    assert not manager.watcher.covers("contracts/Token.sol")
+    manager.close()
+    # Parar un watcher que nunca arrancó no falla
+    FileSystemWatcher(str(tmp_path), lambda changes: None).stop()
@@ -0,0 +1,34 @@
+import asyncio
+import gc
+
+import llm_client
+from agent import Agent
+from benchmarks.fake_anthropic import END_MARKER, FakeAnthropic as FakeAnthropicServer
+
+async def run_agents(agents: int, calls_per_agent: int) -> int:
+    fake = FakeAnthropicServer(latency=0, tokens_per_second=100000)
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    llm_client._client = llm_client._limiter = None
+    llm_client.os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    try:
+        for _ in range(agents):
+            # Un agente por conexión de wallet que se crea y se descarta
+            agent = Agent(file_manager=None)
+            for call in range(calls_per_agent):
+                responses = [response async for response in agent.process_message(f"write a token ({call})", {})]
+                assert not [response for response in responses if response["type"] == "error"]
+                assert "".join(r["content"] for r in responses if r["type"] == "message_delta").endswith(END_MARKER)
+            del agent
+            gc.collect()
+        return fake.connections
+    finally:
+        await llm_client.close_anthropic_client()
+        llm_client._limiter = None
+        server.close()
+        await server.wait_closed()
+
+def test_agents_share_one_keep_alive_connection(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", "")
+    # 5 agentes x 4 turnos secuenciales: todas las llamadas caben en una o dos conexiones del pool
+    assert asyncio.run(run_agents(5, 4)) <= 2
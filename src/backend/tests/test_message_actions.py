@@ -0,0 +1,51 @@
+import asyncio
+
+from actions import MessageActions
+from fakes import FakeAnthropic
+
+WALLET = "0x" + "3" * 40
+
+RESPONSE = """I will add a pause switch.
+
+```solidity
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+contract Paused {
+    bool public paused;
+}
+```
+"""
+
+async def collect(generator):
+    return [response async for response in generator]
+
+def test_concurrent_turns_keep_their_own_contract():
+    actions = MessageActions(FakeAnthropic([RESPONSE], delay=0.001), None, wallet_address=WALLET)
+
+    async def both():
+        return await asyncio.gather(*(
+            collect(actions.process_message("add pause", {"currentFile": f"contracts/{name}.sol",
+                                                          "currentCode": f"contract {name} {{}}"}, f"chat{name}"))
+            for name in ("X", "Y")
+        ))
+
+    for name, responses in zip(("X", "Y"), asyncio.run(both())):
+        edits = [response for response in responses if response["type"] in ("code_edit", "file_create")]
+        assert edits
+        assert {response["metadata"]["path"] for response in edits} == {f"contracts/{name}.sol"}
+
+def test_cancel_while_waiting_for_the_llm_drops_the_user_turn():
+    actions = MessageActions(FakeAnthropic([RESPONSE], create_delay=10), None, wallet_address=WALLET)
+
+    async def cancel_during_create():
+        turn = asyncio.ensure_future(collect(actions.process_message("add pause", {}, "chatZ")))
+        await asyncio.sleep(0.05)
+        turn.cancel()
+        try:
+            await turn
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancel_during_create())
+    assert actions.conversation_histories.get(WALLET, "chatZ") == []
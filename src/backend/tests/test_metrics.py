@@ -0,0 +1,69 @@
+import asyncio
+
+from metrics import STAGE_SECONDS, Counter, Gauge, Histogram, Registry, StatsCollector, timed
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter("test_requests_total", "Requests", ("type",)))
+    connections = registry.register(Gauge("test_connections", "Open connections", callback=lambda: 3))
+    latency = registry.register(Histogram("test_seconds", "Latency", ("stage",), buckets=(0.1, 1.0)))
+    registry.register(StatsCollector("test_cache", "File cache", lambda: {"bytes": 2048, "enabled": True, "name": "x"}))
+    requests.inc(type='say "hi"')
+    requests.inc(2, type='say "hi"')
+    latency.observe(0.05, stage="llm")
+    latency.observe(0.5, stage="llm")
+    latency.observe(5, stage="llm")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{type="say \\"hi\\""} 3' in lines
+    assert "# TYPE test_connections gauge" in lines and "test_connections 3" in lines
+    # Cubos acumulados, con +Inf igual al total
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="llm",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="llm"} 5.55' in lines
+    assert 'test_seconds_count{stage="llm"} 3' in lines
+    # Solo los campos numéricos de stats() se exportan
+    assert "test_cache_bytes 2048" in lines
+    assert not any(line.startswith(("test_cache_enabled", "test_cache_name")) for line in lines)
+
+def test_broken_callback_does_not_break_the_endpoint():
+    registry = Registry()
+    registry.register(Gauge("test_broken", "Broken", callback=lambda: 1 / 0))
+    registry.register(Counter("test_ok_total", "Ok")).inc()
+    text = registry.render()
+    assert "# test_broken unavailable" in text
+    assert "test_ok_total 1" in text
+
+def test_timed_records_functions_coroutines_and_async_generators():
+    @timed("test_sync", "message")
+    def sync():
+        return 1
+
+    @timed("test_async", "message")
+    async def coroutine():
+        await asyncio.sleep(0.01)
+        return 2
+
+    @timed("test_gen", "message")
+    async def generator():
+        for i in range(3):
+            yield i
+
+    async def consume():
+        items = []
+        async for item in generator():
+            items.append(item)
+            # El tiempo del consumidor no cuenta
+            await asyncio.sleep(0.05)
+        return items
+
+    assert sync() == 1
+    assert asyncio.run(coroutine()) == 2
+    assert asyncio.run(consume()) == [0, 1, 2]
+    for stage in ("test_sync", "test_async", "test_gen"):
+        assert STAGE_SECONDS.count(stage=stage, message_type="message") == 1
+    series = STAGE_SECONDS._series[("test_gen", "message")]
+    assert series[1] < 0.05
+    assert STAGE_SECONDS._series[("test_async", "message")][1] >= 0.01
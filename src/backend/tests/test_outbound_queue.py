@@ -0,0 +1,28 @@
+import asyncio
+
+from outbound_queue import OutboundQueue
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+def test_unencodable_frame_does_not_stop_the_queue():
+    async def scenario():
+        websocket = RecordingWebSocket()
+        queue = OutboundQueue(websocket, "0x" + "6" * 40)
+        queue.start()
+        queue.put({"type": "message", "content": {"not", "json"}})
+        queue.put({"type": "message", "content": "after"})
+        await asyncio.sleep(0.05)
+        queue.stop()
+        return websocket.sent, queue.stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert len(sent) == 1 and "after" in sent[0]
+    assert stats["dropped"] == 1
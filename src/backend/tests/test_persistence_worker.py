@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from persistence_worker import PersistenceWorker
+from session_manager import ChatManager
+
+WALLET = "0x" + "4" * 40
+
+def test_dirty_keys_are_coalesced_and_flushed():
+    written = []
+
+    def slow_write(key, value):
+        time.sleep(0.05)
+        written.append((key, value))
+
+    state = {}
+    worker = PersistenceWorker(lambda key: (key, state[key]), slow_write, debounce=0.05)
+
+    async def scenario():
+        worker.start()
+        for value in range(10):
+            state["a"] = value
+            worker.mark_dirty("a")
+        state["b"] = 1
+        worker.mark_dirty("b")
+        await worker.wait_idle()
+        # Una sola escritura por clave, con el último valor
+        assert sorted(written) == [("a", 9), ("b", 1)]
+
+        # stop() escribe lo pendiente sin esperar al debounce
+        state["a"] = 10
+        worker.mark_dirty("a")
+        await worker.stop()
+        assert written[-1] == ("a", 10)
+
+    asyncio.run(scenario())
+
+def test_flush_makes_chat_changes_durable(tmp_path):
+    manager = ChatManager(base_path=str(tmp_path))
+
+    async def scenario():
+        await manager.start_background_writer()
+        chat_id = manager.create_chat(WALLET, "durable").chat_id
+        for i in range(3):
+            manager.add_message_to_chat(WALLET, chat_id, {"id": f"m{i}", "text": f"m{i}", "sender": "user", "timestamp": i})
+        await manager.flush()
+        # Otra instancia (otro proceso tras un reinicio) ve los cambios sin esperar al debounce
+        reloaded = ChatManager(base_path=str(tmp_path)).get_chat(WALLET, chat_id)
+        assert [m["id"] for m in reloaded.messages] == ["m0", "m1", "m2"]
+        await manager.stop_background_writer()
+
+    asyncio.run(scenario())
@@ -0,0 +1,17 @@
+from response_cache import ResponseCache, normalize_prompt
+
+def make_cache(tmp_path) -> ResponseCache:
+    return ResponseCache(path=str(tmp_path / "cache.jsonl"), max_entries=8, ttl_seconds=60, history_messages=2)
+
+def test_case_distinct_prompts_get_different_keys(tmp_path):
+    cache = make_cache(tmp_path)
+    key = lambda prompt: cache.key(prompt, "system", "model", {"path": "contracts/Token.sol"}, [])
+    assert key("rename `owner` to `Owner`") != key("rename `owner` to `owner`")
+    assert key("  rename `owner`\n to `Owner` ") == key("rename `owner` to `Owner`")
+    assert normalize_prompt("add  Pausable.\n") == "add Pausable."
+
+def test_entries_survive_a_restart(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key("add pausable", "system", "model", {}, [])
+    cache.put(key, "Pausable added.")
+    assert make_cache(tmp_path).get(key) == "Pausable added."
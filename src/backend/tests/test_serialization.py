@@ -0,0 +1,32 @@
+import pytest
+
+from serialization import JsonCodec, available_encodings, get_codec
+
+FRAME = {
+    "type": "file_create",
+    "content": "// Contrato de ejemplo: ñandú €\ncontract Token {}\n",
+    "metadata": {"path": "contracts/Token.sol", "size": 42, "tags": ["a", "b"], "nested": {"ok": True, "none": None}}
+}
+
+def test_json_codec_round_trip_is_compact_utf8():
+    codec = get_codec("json")
+    data = codec.encode(FRAME)
+    assert isinstance(data, str) and not codec.binary
+    assert "ñandú €" in data and '"type":"file_create"' in data
+    assert codec.decode(data) == FRAME
+    assert codec.decode(data.encode("utf-8")) == FRAME
+
+def test_unknown_or_missing_encoding_falls_back_to_json():
+    assert "json" in available_encodings()
+    assert isinstance(get_codec("cbor"), JsonCodec)
+    assert isinstance(get_codec(None), JsonCodec)
+    assert isinstance(get_codec("JSON"), JsonCodec)
+
+def test_msgpack_codec_round_trip():
+    pytest.importorskip("msgpack")
+    codec = get_codec("msgpack")
+    data = codec.encode(FRAME)
+    assert isinstance(data, bytes) and codec.binary
+    assert codec.decode(data) == FRAME
+    # Los clientes pueden seguir enviando texto JSON
+    assert codec.decode(JsonCodec().encode(FRAME)) == FRAME
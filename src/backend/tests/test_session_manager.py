@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from session_manager import ChatManager
+from state_backend import SqliteStateBackend
+
+WALLET = "0x" + "3" * 40
+
+def message(i: int) -> dict:
+    return {"id": f"m{i}", "text": f"m{i}", "sender": "user", "timestamp": i}
+
+def test_background_writes_update_state_on_the_event_loop(tmp_path):
+    manager = ChatManager(base_path=str(tmp_path), store=SqliteStateBackend(str(tmp_path / "chats.db")), compact_every=3)
+    chat_id = manager.create_chat(WALLET, "bg").chat_id
+    key = (WALLET, chat_id)
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        writes = []
+        applied = []
+        write_job = manager._write_job
+        on_write_done = manager._on_write_done
+
+        def spy_write(*job):
+            writes.append(threading.get_ident())
+            return write_job(*job)
+
+        def spy_done(*args):
+            applied.append(threading.get_ident())
+            on_write_done(*args)
+
+        manager.writer.write = spy_write
+        manager.writer.on_done = spy_done
+        await manager.start_background_writer()
+        before = manager._versions.get(key)
+        for i in range(4):
+            manager.add_message_to_chat(WALLET, chat_id, message(i))
+        await manager.flush()
+        await manager.stop_background_writer()
+        assert writes and all(ident != loop_thread for ident in writes)
+        assert applied and all(ident == loop_thread for ident in applied)
+        assert manager._versions[key] != before
+        assert not manager._in_flight
+
+    asyncio.run(scenario())
+    manager.close()
+
+    reloaded = ChatManager(base_path=str(tmp_path), store=SqliteStateBackend(str(tmp_path / "chats.db")))
+    assert [m["id"] for m in reloaded.get_chat(WALLET, chat_id).messages] == ["m0", "m1", "m2", "m3"]
+
+def test_cold_load_runs_in_a_thread(tmp_path, monkeypatch):
+    writer = ChatManager(base_path=str(tmp_path))
+    chat_id = writer.create_chat(WALLET, "cold").chat_id
+    for i in range(3):
+        writer.add_message_to_chat(WALLET, chat_id, message(i))
+    writer.close()
+
+    manager = ChatManager(base_path=str(tmp_path))
+    threads = []
+    load = manager._load_chat
+
+    def spy_load(*args):
+        threads.append(threading.get_ident())
+        return load(*args)
+
+    monkeypatch.setattr(manager, "_load_chat", spy_load)
+
+    async def scenario():
+        first, second = await asyncio.gather(
+            manager.load_chat(WALLET, chat_id),
+            manager.load_chat(WALLET, chat_id),
+        )
+        assert first is second
+        assert threads and threading.get_ident() not in threads
+        return first
+
+    chat = asyncio.run(scenario())
+    assert [m["id"] for m in chat.messages] == ["m0", "m1", "m2"]
+    assert manager.get_chat(WALLET, chat_id) is chat
+    assert asyncio.run(manager.load_chat(WALLET, "missing")) is None
+
+def test_chats_load_on_first_access_and_least_recently_used_are_evicted(tmp_path):
+    writer = ChatManager(base_path=str(tmp_path))
+    chat_ids = [writer.create_chat(WALLET, f"chat {i}").chat_id for i in range(3)]
+    for chat_id in chat_ids:
+        writer.add_message_to_chat(WALLET, chat_id, message(0))
+    writer.close()
+
+    manager = ChatManager(base_path=str(tmp_path), max_loaded_chats=2)
+    loads = []
+    load = manager.store.load
+    manager.store.load = lambda *args: (loads.append(args[1]), load(*args))[1]
+
+    # Listar en modo resumen solo lee el índice
+    summaries = manager.get_user_chats(WALLET, summary=True)
+    assert sorted(summary["id"] for summary in summaries) == sorted(chat_ids)
+    assert all(summary["message_count"] == 1 for summary in summaries)
+    assert loads == [] and not manager._loaded
+
+    for chat_id in chat_ids:
+        manager.get_chat(WALLET, chat_id)
+    manager.get_chat(WALLET, chat_ids[2])
+    assert loads == chat_ids
+    assert list(manager._loaded) == [(WALLET, chat_ids[1]), (WALLET, chat_ids[2])]
+
+    # Un chat descargado se vuelve a leer de disco entero
+    assert manager.get_chat(WALLET, chat_ids[0]).messages[0]["id"] == "m0"
+    assert loads == chat_ids + [chat_ids[0]]
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import stat
+import sys
+import textwrap
+
+from solc_compiler import SolcCompiler
+
+def fake_solc(tmp_path, version_delay: float = 0.0) -> str:
+    """Un `solc` de mentira que anota cada invocación en calls.log."""
+    path = tmp_path / "solc"
+    path.write_text(textwrap.dedent(f"""\
+        #!{sys.executable}
+        import json, sys, time
+        with open({str(tmp_path / "calls.log")!r}, "a") as log:
+            log.write(sys.argv[1] + "\\n")
+        if sys.argv[1] == "--version":
+            time.sleep({version_delay})
+            print("solc, the solidity compiler commandline interface")
+            print("Version: 0.8.24+commit.e11b9ed9.Linux.g++")
+        else:
+            request = json.load(sys.stdin)
+            name = next(iter(request["sources"]))
+            print(json.dumps({{"contracts": {{name: {{"Token": {{"abi": [], "evm": {{"bytecode": {{"object": "60"}}}}}}}}}}}}))
+        """))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+def calls(tmp_path) -> list:
+    log = tmp_path / "calls.log"
+    return log.read_text().split() if log.exists() else []
+
+def test_version_is_read_once_without_blocking_the_loop(tmp_path):
+    compiler = SolcCompiler(solc_path=fake_solc(tmp_path, version_delay=0.3))
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        version = await compiler._get_version()
+        task.cancel()
+        assert ticks > 5
+        assert version == "Version: 0.8.24+commit.e11b9ed9.Linux.g++"
+        assert await compiler._get_version() == version
+
+    asyncio.run(scenario())
+    assert calls(tmp_path) == ["--version"]
+
+def test_unreadable_version_falls_back_to_unknown(tmp_path):
+    compiler = SolcCompiler(solc_path=str(tmp_path / "missing-solc"))
+    assert asyncio.run(compiler._get_version()) == "unknown"
+
+def test_unchanged_source_is_a_cache_hit(tmp_path):
+    compiler = SolcCompiler(solc_path=fake_solc(tmp_path), max_workers=1)
+    source = "pragma solidity ^0.8.20;\ncontract Token {}\n"
+
+    async def scenario():
+        first = await compiler.compile(source, "Token.sol")
+        second = await compiler.compile(source, "Token.sol")
+        changed = await compiler.compile(source + "// edited\n", "Token.sol")
+        other_settings = await compiler.compile(source, "Token.sol", settings={"optimizer": {"enabled": False}})
+        return first, second, changed, other_settings
+
+    try:
+        first, second, changed, other_settings = asyncio.run(scenario())
+    finally:
+        compiler.shutdown()
+    assert first["success"] and not first["cached"]
+    assert first["contracts"] == {"Token": {"abi": [], "bytecode": "60"}}
+    assert second["cached"] and second["contracts"] == first["contracts"]
+    assert not changed["cached"] and not other_settings["cached"]
+    assert (compiler.hits, compiler.misses) == (1, 3)
+    # Un solo `solc --version` y un proceso por contenido/ajustes distinto
+    assert calls(tmp_path) == ["--version"] + ["--standard-json"] * 3
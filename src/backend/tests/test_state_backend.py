@@ -0,0 +1,74 @@
+import multiprocessing
+
+import pytest
+
+from session_manager import ChatManager
+from state_backend import SqliteStateBackend, StateBackend
+
+WALLET = "0x" + "2" * 40
+
+def make_manager(base_path: str, db_path: str) -> ChatManager:
+    manager = ChatManager(base_path=base_path, store=SqliteStateBackend(db_path), compact_every=3)
+    # Peor caso: sin comprobaciones periódicas de coherencia, cada worker escribe sobre su copia en memoria
+    manager.coherence_interval = 3600
+    return manager
+
+def alternate_messages(name: str, first: bool, base_path: str, db_path: str, chat_id: str, barrier, rounds: int) -> None:
+    manager = make_manager(base_path, db_path)
+    manager.get_chat(WALLET, chat_id)
+    for i in range(rounds):
+        if first:
+            manager.add_message_to_chat(WALLET, chat_id, {"id": f"{name}{i}", "text": f"{name}{i}", "sender": "user", "timestamp": i})
+        barrier.wait()
+        if not first:
+            manager.add_message_to_chat(WALLET, chat_id, {"id": f"{name}{i}", "text": f"{name}{i}", "sender": "user", "timestamp": i})
+        barrier.wait()
+    manager.close()
+
+def test_two_processes_do_not_lose_journal_entries(tmp_path):
+    db_path = str(tmp_path / "chats.db")
+    manager = make_manager(str(tmp_path), db_path)
+    chat_id = manager.create_chat(WALLET, "shared").chat_id
+    manager.close()
+
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(2)
+    workers = [
+        context.Process(target=alternate_messages, args=(name, name == "A", str(tmp_path), db_path, chat_id, barrier, 4))
+        for name in ("A", "B")
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    chat = make_manager(str(tmp_path), db_path).get_chat(WALLET, chat_id)
+    assert [message["id"] for message in chat.messages] == ["A0", "B0", "A1", "B1", "A2", "B2", "A3", "B3"]
+
+def test_import_chats_from_files(tmp_path):
+    from chat_store import ChatStore
+    from state_backend import import_chats
+
+    files = ChatManager(base_path=str(tmp_path), store=ChatStore(str(tmp_path)))
+    chat_id = files.create_chat(WALLET, "from files").chat_id
+    for i in range(3):
+        files.add_message_to_chat(WALLET, chat_id, {"id": f"m{i}", "text": f"m{i}", "sender": "user", "timestamp": i})
+    files.close()
+
+    db_path = str(tmp_path / "chats.db")
+    assert import_chats(ChatStore(str(tmp_path)), SqliteStateBackend(db_path)) == (1, 0)
+    # Repetir la importación no duplica nada
+    assert import_chats(ChatStore(str(tmp_path)), SqliteStateBackend(db_path)) == (0, 1)
+
+    chat = make_manager(str(tmp_path), db_path).get_chat(WALLET, chat_id)
+    assert chat.name == "from files"
+    assert [message["id"] for message in chat.messages] == ["m0", "m1", "m2"]
+
+def test_incomplete_backend_fails_on_creation():
+    class IndexOnly(StateBackend):
+        def list_wallets(self):
+            return []
+
+    with pytest.raises(TypeError, match="append"):
+        IndexOnly()
@@ -0,0 +1,50 @@
+import json
+
+from session_manager import ChatManager
+from version_store import VersionHistory
+
+WALLET = "0x" + "6" * 40
+
+def versions(count: int) -> list:
+    contract = [f"    uint256 public value{i};\n" for i in range(40)]
+    contents = []
+    for v in range(count):
+        contract[v % 40] = f"    uint256 public value{v % 40} = {v};\n"
+        contents.append("contract Token {\n" + "".join(contract) + "}\n")
+    return contents
+
+def test_round_trip_reconstructs_every_version():
+    contents = versions(40)
+    history = VersionHistory(keyframe_interval=8, max_versions=100)
+    for timestamp, content in enumerate(contents):
+        history.append(content, timestamp)
+    # Deltas entre keyframes: mucho menos que las copias completas
+    assert sum(1 for entry in history.to_list() if "content" in entry) == 5
+    assert len(json.dumps(history.to_list())) < len("".join(contents)) / 4
+
+    restored = VersionHistory.from_list(json.loads(json.dumps(history.to_list())), keyframe_interval=8, max_versions=100)
+    assert [restored.get(v)["content"] for v in range(len(contents))] == contents
+    assert restored.all() == history.all()
+
+    # Seguir añadiendo tras restaurar produce deltas correctos
+    restored.append(contents[0], 99)
+    assert restored.get(40) == {"content": contents[0], "timestamp": 99}
+
+def test_trimming_drops_whole_groups():
+    contents = versions(30)
+    history = VersionHistory(keyframe_interval=8, max_versions=20)
+    for timestamp, content in enumerate(contents):
+        history.append(content, timestamp)
+    assert len(history) == 14
+    assert [history.get(v)["content"] for v in range(len(history))] == contents[16:]
+
+def test_file_history_survives_a_restart(tmp_path):
+    manager = ChatManager(base_path=str(tmp_path), compact_every=3)
+    chat_id = manager.create_chat(WALLET, "history").chat_id
+    contents = versions(6)
+    for content in contents:
+        manager.add_virtual_file_to_chat(WALLET, chat_id, "contracts/Token.sol", content)
+    manager.close()
+
+    chat = ChatManager(base_path=str(tmp_path)).get_chat(WALLET, chat_id)
+    assert [version["content"] for version in chat.get_file_history("contracts/Token.sol")] == contents[:-1]
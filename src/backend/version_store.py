@@ -0,0 +1,113 @@
+import os
+from difflib import SequenceMatcher
+from typing import Dict, List
+
+class VersionHistory:
+    """Historial de versiones de un archivo guardado como deltas de líneas.
+
+    Cada versión se guarda como diferencia respecto a la anterior y cada
+    `keyframe_interval` versiones (o cuando el delta no compensa) se guarda una
+    copia completa. Reconstruir cualquier versión aplica como mucho
+    `keyframe_interval - 1` deltas. Al superar `max_versions` se descarta el
+    grupo más antiguo completo (keyframe y sus deltas).
+
+    Formato serializado: lista de {"timestamp", "content"} (keyframe) o
+    {"timestamp", "delta"}, donde delta es una lista de operaciones
+    ["c", i1, i2] (copiar líneas i1:i2 de la versión anterior) o ["i", [líneas]].
+    """
+
+    def __init__(self, keyframe_interval: int | None = None, max_versions: int | None = None):
+        self.keyframe_interval = keyframe_interval or int(os.getenv("FILE_HISTORY_KEYFRAME_INTERVAL", "16"))
+        self.max_versions = max_versions or int(os.getenv("FILE_HISTORY_MAX_VERSIONS", "200"))
+        self._versions: List[Dict] = []
+        self._last_keyframe = -1
+        # Última versión añadida, para calcular el siguiente delta sin reconstruir
+        self._last_lines: List[str] | None = None
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def append(self, content: str, timestamp) -> None:
+        lines = content.splitlines(keepends=True)
+        index = len(self._versions)
+        entry = None
+        if self._last_lines is not None and index - self._last_keyframe < self.keyframe_interval:
+            delta = self._diff(self._last_lines, lines)
+            # Un delta que inserta casi todo el archivo no ahorra nada: mejor un keyframe
+            inserted = sum(len(op[1]) for op in delta if op[0] == "i")
+            if inserted < len(lines) // 2 or not lines:
+                entry = {"timestamp": timestamp, "delta": delta}
+        if entry is None:
+            entry = {"timestamp": timestamp, "content": content}
+            self._last_keyframe = index
+        self._versions.append(entry)
+        self._last_lines = lines
+        self._trim()
+
+    def get(self, version: int) -> Dict | None:
+        """Devuelve {"content", "timestamp"} de una versión (0 es la más antigua)."""
+        if not 0 <= version < len(self._versions):
+            return None
+        start = version
+        while "content" not in self._versions[start]:
+            start -= 1
+        lines = self._versions[start]["content"].splitlines(keepends=True)
+        for entry in self._versions[start + 1:version + 1]:
+            lines = self._apply(lines, entry["delta"])
+        return {"content": "".join(lines), "timestamp": self._versions[version]["timestamp"]}
+
+    def all(self) -> List[Dict]:
+        """Reconstruye todas las versiones en un solo recorrido."""
+        result = []
+        lines: List[str] = []
+        for entry in self._versions:
+            lines = entry["content"].splitlines(keepends=True) if "content" in entry else self._apply(lines, entry["delta"])
+            result.append({"content": "".join(lines), "timestamp": entry["timestamp"]})
+        return result
+
+    def to_list(self) -> List[Dict]:
+        # Las entradas no se mutan tras crearse: basta con copiar la lista
+        return list(self._versions)
+
+    @classmethod
+    def from_list(cls, entries: List[Dict], **kwargs) -> "VersionHistory":
+        history = cls(**kwargs)
+        history._versions = list(entries)
+        for index, entry in enumerate(history._versions):
+            if "content" in entry:
+                history._last_keyframe = index
+        if history._versions:
+            history._last_lines = history.get(len(history._versions) - 1)["content"].splitlines(keepends=True)
+        history._trim()
+        return history
+
+    def _trim(self) -> None:
+        while len(self._versions) > self.max_versions:
+            # El siguiente grupo empieza en el próximo keyframe
+            end = 1
+            while end < len(self._versions) and "content" not in self._versions[end]:
+                end += 1
+            if end >= len(self._versions):
+                break
+            del self._versions[:end]
+            self._last_keyframe -= end
+
+    @staticmethod
+    def _diff(old: List[str], new: List[str]) -> List[list]:
+        delta = []
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+            if tag == "equal":
+                delta.append(["c", i1, i2])
+            elif j2 > j1:
+                delta.append(["i", new[j1:j2]])
+        return delta
+
+    @staticmethod
+    def _apply(old: List[str], delta: List[list]) -> List[str]:
+        lines: List[str] = []
+        for op in delta:
+            if op[0] == "c":
+                lines.extend(old[op[1]:op[2]])
+            else:
+                lines.extend(op[1])
+        return lines
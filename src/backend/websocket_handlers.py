@@ -1,19 +1,98 @@
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import Dict
-import json
 import logging
 from datetime import datetime
+import time
 import uuid
 from connection_manager import ConnectionManager
+from metrics import observe_stage
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tipos de petición conocidos; el resto se agrupa para no crear series de métricas sin límite
+REQUEST_TYPES = {"message", "create_context", "save_file", "get_messages", "get_file", "get_file_version", "cancel"}
+
+async def run_generation(
+    manager: ConnectionManager,
+    wallet_address: str,
+    chat_id: str,
+    content: str,
+    context: Dict
+):
+    """Ejecuta un turno del LLM para un chat, persistiendo y enviando cada respuesta."""
+    try:
+        # Crear un nuevo mensaje en el chat
+        manager.chat_manager.add_message_to_chat(
+            wallet_address,
+            chat_id,
+            {
+                "id": str(uuid.uuid4()),
+                "text": content,
+                "sender": "user",
+                "timestamp": datetime.now().timestamp() * 1000
+            }
+        )
+
+        # Procesar el mensaje con el agente
+        agent = manager.agents[wallet_address]
+        response_generator = agent.process_message(content, context, chat_id)
+        try:
+            await _forward_responses(manager, wallet_address, chat_id, response_generator)
+        finally:
+            # Si la tarea se cancela fuera del generador, cerrarlo para abortar el stream del LLM
+            await response_generator.aclose()
+    except Exception as e:
+        logger.error(f"Error processing message for chat {chat_id}: {str(e)}")
+        await manager.send_message(
+            {
+                "type": "error",
+                "content": f"Error processing message: {str(e)}"
+            },
+            wallet_address
+        )
+
+async def _forward_responses(manager: ConnectionManager, wallet_address: str, chat_id: str, response_generator):
+    """Persiste y envía al cliente cada respuesta del agente."""
+    async for response in response_generator:
+        # Los fragmentos de streaming no se persisten: el texto completo llega en las acciones
+        if response["type"] != "message_delta":
+            # Save AI response to chat
+            manager.chat_manager.add_message_to_chat(
+                wallet_address,
+                chat_id,
+                {
+                    "id": str(uuid.uuid4()),
+                    "text": response["content"],
+                    "sender": "ai",
+                    "timestamp": datetime.now().timestamp() * 1000,
+                    "type": response["type"]
+                }
+            )
+            
+            # Si es un mensaje de tipo file_create o code_edit, guardar el archivo en el chat
+            if response["type"] in ["file_create", "code_edit"] and response.get("metadata", {}).get("path"):
+                manager.chat_manager.add_virtual_file_to_chat(
+                    wallet_address,
+                    chat_id,
+                    response["metadata"]["path"],
+                    response["content"],
+                    response["metadata"].get("language", "solidity")
+                )
+        
+        # Send response to client
+        await manager.send_message(
+            response,
+            wallet_address
+        )
+
 async def handle_websocket_connection(
     websocket: WebSocket,
     wallet_address: str | None,
-    manager: ConnectionManager
+    manager: ConnectionManager,
+    contexts_mode: str = "full",
+    encoding: str = "json"
 ):
     # Validar que el wallet_address sea una dirección válida
     if not wallet_address or not wallet_address.startswith('0x'):
@@ -24,26 +103,41 @@ async def handle_websocket_connection(
         logger.info(f"Attempting connection - Wallet: {wallet_address}")
         
         # Permitir la conexión inicial sin chat_id
-        await manager.connect(websocket, wallet_address)
+        codec = await manager.connect(websocket, wallet_address, contexts_mode, encoding)
         
         while True:
+            message_type = None
             try:
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                # Texto (JSON) o binario (según el codec negociado)
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(frame.get("code", 1000))
+                data = frame.get("text")
+                if data is None:
+                    data = frame.get("bytes") or b""
+                message_data = codec.decode(data)
+                request_start = time.perf_counter()
                 content = message_data.get("content", "")
                 context = message_data.get("context", {})
                 message_type = message_data.get("type", "message")
                 chat_id = message_data.get("chat_id")
 
                 # Solo verificar chat_id para mensajes que lo requieran
-                if message_type not in ["create_context", "contexts_loaded", "sync_contexts"] and not chat_id:
+                if message_type not in ["create_context", "contexts_loaded", "sync_contexts", "cancel"] and not chat_id:
                     logger.error(f"No chat_id provided for message type: {message_type}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "content": "No chat_id provided"
-                    })
+                    await manager.send_message(
+                        {
+                            "type": "error",
+                            "content": "No chat_id provided"
+                        },
+                        wallet_address
+                    )
                     continue
 
+                if chat_id and message_type != "cancel":
+                    # Carga en frío fuera del event loop; después get_chat lo encuentra en memoria
+                    await manager.chat_manager.load_chat(wallet_address, chat_id)
+
                 # Manejar la creación de un nuevo chat
                 if message_type == "create_context":
                     try:
@@ -52,25 +146,34 @@ async def handle_websocket_connection(
                         
                         if existing_chat:
                             logger.info(f"Chat {chat_id} already exists for wallet {wallet_address}")
-                            await websocket.send_json({
-                                "type": "context_created",
-                                "content": existing_chat.to_dict()
-                            })
+                            await manager.send_message(
+                                {
+                                    "type": "context_created",
+                                    "content": existing_chat.to_dict()
+                                },
+                                wallet_address
+                            )
                         else:
                             # Crear nuevo chat
                             new_chat = manager.chat_manager.create_chat(wallet_address, content or "New Chat")
                             logger.info(f"Created new chat: {new_chat.chat_id} for wallet: {wallet_address}")
-                            await websocket.send_json({
-                                "type": "context_created",
-                                "content": new_chat.to_dict()
-                            })
+                            await manager.send_message(
+                                {
+                                    "type": "context_created",
+                                    "content": new_chat.to_dict()
+                                },
+                                wallet_address
+                            )
                         continue
                     except Exception as e:
                         logger.error(f"Error creating chat: {str(e)}")
-                        await websocket.send_json({
-                            "type": "error",
-                            "content": f"Error creating chat: {str(e)}"
-                        })
+                        await manager.send_message(
+                            {
+                                "type": "error",
+                                "content": f"Error creating chat: {str(e)}"
+                            },
+                            wallet_address
+                        )
                         continue
 
                 if message_type == "save_file":
@@ -90,24 +193,98 @@ async def handle_websocket_connection(
                         
                         # Enviar confirmación al cliente
                         await manager.send_message(
-                            json.dumps({
+                            {
                                 "type": "file_saved",
                                 "content": f"File saved successfully: {path}",
                                 "metadata": {
                                     "path": path,
                                     "chat_id": chat_id
                                 }
-                            }),
+                            },
                             wallet_address
                         )
                         continue
                     except Exception as e:
                         logger.error(f"Error saving file: {str(e)}")
                         await manager.send_message(
-                            json.dumps({
+                            {
                                 "type": "error",
                                 "content": f"Error saving file: {str(e)}"
-                            }),
+                            },
+                            wallet_address
+                        )
+                        continue
+
+                elif message_type == "get_messages":
+                    try:
+                        page = manager.chat_manager.get_messages(
+                            wallet_address,
+                            chat_id,
+                            message_data.get("cursor"),
+                            min(int(message_data.get("limit", 50)), 200)
+                        )
+                        await manager.send_message(
+                            {
+                                "type": "messages_page",
+                                "content": page["messages"],
+                                "metadata": {
+                                    "chat_id": chat_id,
+                                    "cursor": page["cursor"],
+                                    "next_cursor": page["next_cursor"],
+                                    "total": page["total"]
+                                }
+                            },
+                            wallet_address
+                        )
+                        continue
+                    except Exception as e:
+                        logger.error(f"Error getting messages: {str(e)}")
+                        await manager.send_message(
+                            {
+                                "type": "error",
+                                "content": f"Error getting messages: {str(e)}"
+                            },
+                            wallet_address
+                        )
+                        continue
+
+                elif message_type == "get_file":
+                    try:
+                        path = message_data.get("path")
+                        if not path:
+                            raise ValueError("No path provided for file")
+                        
+                        file_data = manager.chat_manager.get_virtual_file_from_chat(wallet_address, chat_id, path)
+                        if file_data:
+                            await manager.send_message(
+                                {
+                                    "type": "file_content",
+                                    "content": file_data["content"],
+                                    "metadata": {
+                                        "path": path,
+                                        "chat_id": chat_id,
+                                        "language": file_data.get("language", "solidity"),
+                                        "timestamp": file_data["timestamp"]
+                                    }
+                                },
+                                wallet_address
+                            )
+                        else:
+                            await manager.send_message(
+                                {
+                                    "type": "error",
+                                    "content": f"File not found: {path}"
+                                },
+                                wallet_address
+                            )
+                        continue
+                    except Exception as e:
+                        logger.error(f"Error getting file: {str(e)}")
+                        await manager.send_message(
+                            {
+                                "type": "error",
+                                "content": f"Error getting file: {str(e)}"
+                            },
                             wallet_address
                         )
                         continue
@@ -129,7 +306,7 @@ async def handle_websocket_connection(
                         
                         if file_data:
                             await manager.send_message(
-                                json.dumps({
+                                {
                                     "type": "file_version",
                                     "content": file_data["content"],
                                     "metadata": {
@@ -138,89 +315,78 @@ async def handle_websocket_connection(
                                         "version": version,
                                         "timestamp": file_data["timestamp"]
                                     }
-                                }),
+                                },
                                 wallet_address
                             )
                         else:
                             await manager.send_message(
-                                json.dumps({
+                                {
                                     "type": "error",
                                     "content": f"File version not found: {path}"
-                                }),
+                                },
                                 wallet_address
                             )
                         continue
                     except Exception as e:
                         logger.error(f"Error getting file version: {str(e)}")
                         await manager.send_message(
-                            json.dumps({
+                            {
                                 "type": "error",
                                 "content": f"Error getting file version: {str(e)}"
-                            }),
+                            },
                             wallet_address
                         )
                         continue
 
-                # Crear un nuevo mensaje en el chat
-                if chat_id:
-                    manager.chat_manager.add_message_to_chat(
-                        wallet_address,
-                        chat_id,
+                if message_type == "cancel":
+                    cancelled = manager.cancel_generations(wallet_address, chat_id)
+                    await manager.send_message(
                         {
-                            "id": str(uuid.uuid4()),
-                            "text": content,
-                            "sender": "user",
-                            "timestamp": datetime.now().timestamp() * 1000
-                        }
+                            "type": "generation_cancelled",
+                            "content": f"Cancelled {len(cancelled)} generation(s)",
+                            "metadata": {
+                                "chat_id": chat_id,
+                                "cancelled": cancelled
+                            }
+                        },
+                        wallet_address
                     )
+                    continue
 
-                # Procesar el mensaje con el agente
-                agent = manager.agents[wallet_address]
-                response_generator = agent.process_message(content, context, chat_id)
-                
-                async for response in response_generator:
-                    if chat_id:
-                        # Save AI response to chat
-                        manager.chat_manager.add_message_to_chat(
-                            wallet_address,
-                            chat_id,
-                            {
-                                "id": str(uuid.uuid4()),
-                                "text": response["content"],
-                                "sender": "ai",
-                                "timestamp": datetime.now().timestamp() * 1000,
-                                "type": response["type"]
-                            }
-                        )
-                        
-                        # Si es un mensaje de tipo file_create o code_edit, guardar el archivo en el chat
-                        if response["type"] in ["file_create", "code_edit"] and response.get("metadata", {}).get("path"):
-                            manager.chat_manager.add_virtual_file_to_chat(
-                                wallet_address,
-                                chat_id,
-                                response["metadata"]["path"],
-                                response["content"],
-                                response["metadata"].get("language", "solidity")
-                            )
-                    
-                    # Send response to client
+                # Las generaciones del LLM corren como tareas para seguir atendiendo
+                # los mensajes de control (save_file, cancel, ...) mientras tanto
+                error = manager.start_generation(
+                    wallet_address,
+                    chat_id,
+                    lambda: run_generation(manager, wallet_address, chat_id, content, context)
+                )
+                if error:
                     await manager.send_message(
-                        json.dumps(response),
+                        {
+                            "type": "error",
+                            "content": error
+                        },
                         wallet_address
                     )
                     
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received: {data}")
+            except ValueError:
+                # JSONDecodeError y los errores de msgpack derivan de ValueError
+                logger.error(f"Invalid {codec.name} frame received: {data[:200]!r}")
                 await manager.send_message(
-                    json.dumps({
+                    {
                         "type": "error",
                         "content": "Invalid message format"
-                    }),
+                    },
                     wallet_address
                 )
+            finally:
+                # Tiempo de atención de cada petición (las generaciones del LLM se miden aparte como "turn")
+                if message_type is not None:
+                    label = message_type if message_type in REQUEST_TYPES else "other"
+                    observe_stage("request", time.perf_counter() - request_start, label)
                 
     except WebSocketDisconnect:
-        manager.disconnect(wallet_address)
+        manager.disconnect(wallet_address, websocket)
     except Exception as e:
         logger.error(f"Error in websocket connection: {str(e)}")
-        manager.disconnect(wallet_address) 
\ No newline at end of file
+        manager.disconnect(wallet_address, websocket) 
\ No newline at end of file